@@ -0,0 +1,137 @@
+"""
+Admission control for game code execution.
+
+Each worker runs at most MAX_RUNNING_GAME_CODE game code calls at once. Up to MAX_WAITING_GAME_CODE more
+wait for a slot, but no longer than MAX_GAME_CODE_WAIT seconds. A single game type can't have more than
+MAX_GAME_CODE_PER_TYPE calls in flight, so one slow game doesn't take all slots.
+Requests over the limits fail fast with 503 and Retry-After, so threads stay free for other endpoints.
+"""
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from rest_framework.response import Response
+from rest_framework.status import HTTP_503_SERVICE_UNAVAILABLE
+
+from .config import MAX_RUNNING_GAME_CODE, MAX_WAITING_GAME_CODE, MAX_GAME_CODE_WAIT, MAX_GAME_CODE_PER_TYPE, \
+    error_response
+from .errormessages import SERVER_OVERLOADED
+from .exceptions import OverloadedWarning
+
+REJECTED_GAME_TYPE = 'game_type'
+REJECTED_QUEUE_FULL = 'queue_full'
+REJECTED_TIMEOUT = 'timeout'
+
+
+class AdmissionController:
+    """
+    Bounded admission queue with per game type concurrency caps
+    """
+
+    def __init__(self, max_running: int = MAX_RUNNING_GAME_CODE, max_waiting: int = MAX_WAITING_GAME_CODE,
+                 max_wait: float = MAX_GAME_CODE_WAIT, max_per_type: int = MAX_GAME_CODE_PER_TYPE):
+        self.max_running = max_running
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+        self.max_per_type = max_per_type
+        self.__cond = threading.Condition()
+        self.__running = 0
+        self.__waiting = 0
+        # game type id -> calls running or waiting
+        self.__in_flight = defaultdict(int)
+        self.__admitted = 0
+        self.__rejected = defaultdict(int)
+        self.__wait_total = 0.0
+        self.__wait_max = 0.0
+        # moving average of execution time, used for Retry-After
+        self.__exec_avg = 0.1
+
+    @contextmanager
+    def admit(self, game_type_id: str):
+        """
+        Waits for a slot to run game code of game type.
+        Raises OverloadedWarning with seconds to wait before retrying, if it can't be admitted
+        :param game_type_id: id of game type
+        """
+        start = time.monotonic()
+        with self.__cond:
+            if self.__in_flight[game_type_id] >= self.max_per_type:
+                self.__reject(REJECTED_GAME_TYPE, game_type_id)
+            if self.__running >= self.max_running and self.__waiting >= self.max_waiting:
+                self.__reject(REJECTED_QUEUE_FULL, game_type_id)
+            self.__in_flight[game_type_id] += 1
+            self.__waiting += 1
+            try:
+                deadline = start + self.max_wait
+                while self.__running >= self.max_running:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.__release(game_type_id)
+                        self.__reject(REJECTED_TIMEOUT, game_type_id)
+                    self.__cond.wait(remaining)
+            finally:
+                self.__waiting -= 1
+            self.__running += 1
+            waited = time.monotonic() - start
+            self.__admitted += 1
+            self.__wait_total += waited
+            self.__wait_max = max(self.__wait_max, waited)
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self.__cond:
+                self.__running -= 1
+                self.__release(game_type_id)
+                self.__exec_avg = 0.9 * self.__exec_avg + 0.1 * (time.monotonic() - started)
+                self.__cond.notify()
+
+    def __release(self, game_type_id: str):
+        self.__in_flight[game_type_id] -= 1
+        if not self.__in_flight[game_type_id]:
+            del self.__in_flight[game_type_id]
+
+    def __reject(self, reason: str, game_type_id: str):
+        if not self.__in_flight[game_type_id]:
+            del self.__in_flight[game_type_id]
+        self.__rejected[reason] += 1
+        # time for the queue ahead to drain
+        retry_after = self.__exec_avg * (self.__waiting + 1) / max(self.max_running, 1)
+        raise OverloadedWarning(max(1, math.ceil(retry_after)))
+
+    def stats(self) -> dict:
+        """
+        Gets admission statistics
+        :return: dict with queue depth, running calls, admitted and rejected calls, wait times
+        """
+        with self.__cond:
+            return {
+                'running': self.__running,
+                'waiting': self.__waiting,
+                'admitted': self.__admitted,
+                'rejected': dict(self.__rejected),
+                'wait_avg': self.__wait_total / self.__admitted if self.__admitted else 0.0,
+                'wait_max': self.__wait_max,
+                'exec_avg': self.__exec_avg,
+                'in_flight_by_type': dict(self.__in_flight),
+            }
+
+
+def overloadedResponse(retry_after: int) -> Response:
+    """
+    Makes 503 response for requests, that weren't admitted
+    :param retry_after: seconds to wait before retrying
+    :return: response
+    """
+    response = error_response(SERVER_OVERLOADED, HTTP_503_SERVICE_UNAVAILABLE)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+"""
+Process-wide admission control of game code
+"""
+game_admission = AdmissionController()
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class CavokeConfig(AppConfig):
     name = 'cavoke_app'
+
+    def ready(self):
+        # connect signal receivers
+        import cavoke_server.sqlite  # noqa: F401
+        # DRF imports authentication classes lazily, revocations before the first request must not be missed
+        import cavoke_app.authentication  # noqa: F401
@@ -0,0 +1,169 @@
+import logging
+import os
+import struct
+import time
+import zlib
+from datetime import datetime
+
+from django.utils import timezone
+
+from .config import SESSION_ARCHIVE_FOLDER, SESSION_ARCHIVE_SEGMENT_SIZE
+from .exceptions import ArchiveCorruptedError
+
+logger = logging.getLogger(__name__)
+
+"""
+Record header: magic, crc32 of uncompressed data, length of compressed data
+"""
+RECORD_HEADER = struct.Struct('>4sII')
+RECORD_MAGIC = b'CVKS'
+
+
+class SegmentWriter:
+    """
+    Appends compressed records to segment files, starting new segment when current one is full.
+    Each writer owns its segments, so no locking between processes is needed.
+    """
+
+    def __init__(self, folder: str = SESSION_ARCHIVE_FOLDER, max_size: int = SESSION_ARCHIVE_SEGMENT_SIZE):
+        self.folder = folder
+        self.max_size = max_size
+        self.__file = None
+        self.__name = None
+        self.__count = 0
+        os.makedirs(folder, exist_ok=True)
+
+    def append(self, data: bytes):
+        """
+        Appends record to current segment
+        :param data: uncompressed data
+        :return: (segment name, offset of record, length of record)
+        """
+        if self.__file is None or self.__file.tell() >= self.max_size:
+            self.__rotate()
+        compressed = zlib.compress(data)
+        offset = self.__file.tell()
+        self.__file.write(RECORD_HEADER.pack(RECORD_MAGIC, zlib.crc32(data), len(compressed)))
+        self.__file.write(compressed)
+        return self.__name, offset, RECORD_HEADER.size + len(compressed)
+
+    def flush(self):
+        """
+        Makes appended records durable. Must be called before records are referenced from the database
+        """
+        if self.__file is not None:
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+
+    def close(self):
+        if self.__file is not None:
+            self.flush()
+            self.__file.close()
+            self.__file = None
+
+    def __rotate(self):
+        self.close()
+        self.__count += 1
+        self.__name = 'segment-{}-{}-{}.seg'.format(
+            datetime.utcnow().strftime('%Y%m%d%H%M%S'), os.getpid(), self.__count)
+        self.__file = open(os.path.join(self.folder, self.__name), 'ab')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def readRecord(segment: str, offset: int, length: int, folder: str = SESSION_ARCHIVE_FOLDER) -> bytes:
+    """
+    Reads archived record back
+    :param segment: segment name
+    :param offset: offset of record in segment
+    :param length: length of record
+    :param folder: archive folder
+    :return: uncompressed data
+    """
+    with open(os.path.join(folder, os.path.basename(segment)), 'rb') as f:
+        f.seek(offset)
+        raw = f.read(length)
+    if len(raw) != length:
+        raise ArchiveCorruptedError('Truncated record in ' + segment)
+    magic, crc, size = RECORD_HEADER.unpack_from(raw)
+    if magic != RECORD_MAGIC or size != length - RECORD_HEADER.size:
+        raise ArchiveCorruptedError('Bad record header in ' + segment)
+    data = zlib.decompress(raw[RECORD_HEADER.size:])
+    if zlib.crc32(data) != crc:
+        raise ArchiveCorruptedError('Checksum mismatch in ' + segment)
+    return data
+
+
+def archiveIdleSessions(idle_for: timezone.timedelta, folder: str = SESSION_ARCHIVE_FOLDER) -> int:
+    """
+    Moves game objects of sessions idle for longer than `idle_for` to archive segments,
+    leaving stub rows in the database
+    :param idle_for: idle time threshold
+    :param folder: archive folder
+    :return: number of archived sessions
+    """
+    from .models import GameSession
+
+    cutoff = timezone.now() - idle_for
+    archived = 0
+    with SegmentWriter(folder) as writer:
+        for alias, sessions in GameSession.objects.onShards():
+            candidates = sessions.filter(lastUsedOn__lt=cutoff, archive_segment='', game_object_hash='') \
+                .only('id', 'lastUsedOn', 'state_version', 'game_object_bytes')
+            batch = []
+            for gs in candidates.iterator(chunk_size=100):
+                batch.append((gs.pk, gs.lastUsedOn, gs.state_version) + writer.append(bytes(gs.game_object_bytes)))
+                if len(batch) >= 100:
+                    archived += _stubSessions(writer, alias, batch)
+                    batch = []
+            archived += _stubSessions(writer, alias, batch)
+    logger.info("Archived %d idle game sessions", archived)
+    return archived
+
+
+def _stubSessions(writer: SegmentWriter, alias: str, batch: list) -> int:
+    """
+    Replaces game objects of sessions with references to archived records
+    :param writer: writer, that archived records
+    :param alias: database of sessions
+    :param batch: list of (session pk, lastUsedOn, state_version, segment, offset, length)
+    :return: number of stubbed sessions
+    """
+    from .models import GameSession
+
+    writer.flush()
+    count = 0
+    for pk, lastUsedOn, version, segment, offset, length in batch:
+        # skip sessions used or changed while we were archiving them
+        count += GameSession.objects.using(alias).filter(
+            pk=pk, lastUsedOn=lastUsedOn, state_version=version, archive_segment='').update(
+            game_object_bytes=b'', archive_segment=segment, archive_offset=offset, archive_length=length)
+    return count
+
+
+def deleteUnreferencedSegments(folder: str = SESSION_ARCHIVE_FOLDER, min_age: float = 60 * 60) -> int:
+    """
+    Deletes segments, that have no archived sessions left
+    :param folder: archive folder
+    :param min_age: seconds since last write, so segments still being written are kept
+    :return: number of deleted segments
+    """
+    from .models import GameSession
+
+    if not os.path.exists(folder):
+        return 0
+    referenced = set()
+    for _, sessions in GameSession.objects.onShards():
+        referenced.update(sessions.exclude(archive_segment='')
+                          .values_list('archive_segment', flat=True).distinct())
+    deleted = 0
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if name.endswith('.seg') and name not in referenced and os.path.getmtime(path) < time.time() - min_age:
+            os.remove(path)
+            deleted += 1
+    return deleted
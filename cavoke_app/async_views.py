@@ -0,0 +1,151 @@
+"""
+Async versions of I/O-bound views, served when the project runs under ASGI (cavoke_server/asgi.py).
+
+Independent Firestore and Telegram calls run concurrently in worker threads,
+database work runs in the thread sensitive executor, so the event loop is never blocked
+and one worker handles many requests waiting on remote services.
+"""
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.status import *
+from rest_framework.utils.encoders import JSONEncoder
+
+from cavoke_server import notifyAdmin
+from .config import headers, parse, isAnonymous
+from .errormessages import *
+from .exceptions import RequestRejectedWarning
+from .authors import readAuthorGames
+from .views import prepareGameType, savePendingGame, addPendingToUser, moderationMessage, authorQuery
+
+
+def _json_response(data: dict, status: int) -> JsonResponse:
+    response = JsonResponse(data, status=status, encoder=JSONEncoder)
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+def async_error_response(message: str, error_code) -> JsonResponse:
+    """
+    Makes error http response with explanation and error code
+    :param message: message for client
+    :param error_code: http error code as rest_framework.status
+    :return: response
+    """
+    return _json_response({"status": "Error", "message": message}, error_code)
+
+
+def async_ok_response(answer: dict = {}) -> JsonResponse:
+    """
+    Makes ok http response
+    :param answer: data for client
+    :return: response
+    """
+    return _json_response({"status": "OK", "response": answer}, HTTP_200_OK)
+
+
+def io_bound(func):
+    """
+    Wraps blocking remote call (Firestore, HTTP), so it runs in its own thread
+    :param func: blocking function
+    :return: awaitable function
+    """
+    return sync_to_async(func, thread_sensitive=False)
+
+
+def _authenticate(request) -> Request:
+    """
+    Authenticates request with rest_framework authentication classes
+    :param request: django request
+    :return: rest_framework request with user and auth
+    """
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    # accessing user performs authentication
+    drf_request.user
+    return drf_request
+
+
+def async_api_view(methods: list):
+    """
+    Decorator for async views of authenticated users. Mirrors @api_view for the supported methods
+    :param methods: allowed http methods
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return async_error_response("Method \"" + request.method + "\" not allowed.",
+                                            HTTP_405_METHOD_NOT_ALLOWED)
+            try:
+                drf_request = await sync_to_async(_authenticate)(request)
+            except APIException as e:
+                return async_error_response(str(e.detail), e.status_code)
+            if not isinstance(drf_request.auth, dict):
+                return async_error_response("Authentication credentials were not provided.",
+                                            HTTP_401_UNAUTHORIZED)
+            return await view(drf_request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@async_api_view(["GET"])
+async def newGameType(request):
+    """
+    Creates new game type for an authenticated non-anonymous user.
+    :param request: request with parameters for GameType constructor
+    :return: response
+    """
+    # get uid
+    uid = request.auth['uid']
+
+    # check if anonymous
+    if await sync_to_async(isAnonymous)(uid):
+        return async_error_response(ANONYMOUS_FORBIDDEN, HTTP_403_FORBIDDEN)
+
+    # validate and take a slot from author's limit
+    data = parse(request.query_params)
+    try:
+        rdict, modtoken = await sync_to_async(prepareGameType)(uid, data)
+    except RequestRejectedWarning as e:
+        return async_error_response(*e.args)
+
+    # save pending game, add it to author and notify moderator at once
+    host = request._request._current_scheme_host
+    await asyncio.gather(
+        io_bound(savePendingGame)(rdict, modtoken),
+        io_bound(addPendingToUser)(uid, rdict),
+        io_bound(notifyAdmin)(moderationMessage(rdict, modtoken, host)),
+    )
+
+    return async_ok_response(rdict)
+
+
+@async_api_view(["GET"])
+async def getAuthor(request):
+    """
+    Gets info about authored games, that authenticated user has made.
+    :param request: request with optional kind (authored_games or pending_games), limit
+    and authored_games_cursor/pending_games_cursor returned with previous page, all games are returned without both
+    :return: response with pages of games and cursors of next pages (null after the last one)
+    """
+    # get id
+    uid = request.auth["uid"]
+
+    # get query
+    try:
+        kinds, limit, cursors = authorQuery(parse(request.query_params))
+    except RequestRejectedWarning as e:
+        return async_error_response(*e.args)
+
+    # read pages of all kinds at once
+    pages = await asyncio.gather(*(io_bound(readAuthorGames)(uid, kind, limit, cursors.get(kind)) for kind in kinds))
+    author = {}
+    for kind, (games, cursor) in zip(kinds, pages):
+        author[kind], author[kind + '_cursor'] = games, cursor
+    return async_ok_response(author)
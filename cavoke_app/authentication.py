@@ -0,0 +1,282 @@
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.contrib.auth.models import User, AnonymousUser
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from drf_firebase_auth_cavoke.models import FirebaseUser
+from drf_firebase_auth_cavoke.settings import api_settings
+from rest_framework import authentication, exceptions
+
+
+def tokenDigest(token) -> str:
+    """
+    Makes cache key for firebase id token, so raw tokens are never kept in memory
+    :param token: id token as bytes or str
+    :return: hex digest
+    """
+    if isinstance(token, str):
+        token = token.encode()
+    return hashlib.sha256(token).hexdigest()
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of verified firebase id tokens.
+    Each entry expires at the token's `exp` (or after `max_age` seconds, whichever is earlier).
+    """
+
+    def __init__(self, size: int, max_age: float):
+        self.size = size
+        self.max_age = max_age
+        self.__entries = OrderedDict()
+        self.__lock = Lock()
+
+    def get(self, digest: str):
+        """
+        Gets cached entry by token digest
+        :param digest: token digest
+        :return: (user_id, decoded_token, time of last firebase user check) or None if missing or expired
+        """
+        now = time.time()
+        with self.__lock:
+            entry = self.__entries.get(digest)
+            if entry is None:
+                return None
+            expiresAt, uid, user_id, decoded_token, checkedAt = entry
+            if expiresAt <= now:
+                del self.__entries[digest]
+                return None
+            self.__entries.move_to_end(digest)
+            return user_id, decoded_token, checkedAt
+
+    def put(self, digest: str, user_id: int, decoded_token: dict):
+        """
+        Caches verified token until its expiration
+        :param digest: token digest
+        :param user_id: id of local django user
+        :param decoded_token: decoded and verified token
+        """
+        if self.size <= 0:
+            return
+        now = time.time()
+        expiresAt = min(float(decoded_token.get('exp', now)), now + self.max_age)
+        if expiresAt <= now:
+            return
+        with self.__lock:
+            self.__entries[digest] = (expiresAt, decoded_token.get('uid'), user_id, decoded_token, now)
+            self.__entries.move_to_end(digest)
+            while len(self.__entries) > self.size:
+                self.__entries.popitem(last=False)
+
+    def markChecked(self, digest: str):
+        """
+        Remembers, that firebase user of token was checked just now
+        :param digest: token digest
+        """
+        with self.__lock:
+            entry = self.__entries.get(digest)
+            if entry is not None:
+                self.__entries[digest] = entry[:4] + (time.time(),)
+
+    def revokeToken(self, token):
+        """
+        Drops single token from cache
+        :param token: raw id token
+        """
+        with self.__lock:
+            self.__entries.pop(tokenDigest(token), None)
+
+    def revokeUid(self, uid: str):
+        """
+        Drops all tokens of a firebase user from cache
+        :param uid: user's uid
+        """
+        with self.__lock:
+            for digest in [d for d, e in self.__entries.items() if e[1] == uid]:
+                del self.__entries[digest]
+
+    def revokeUser(self, user_id: int):
+        """
+        Drops all tokens of a local django user from cache
+        :param user_id: id of django user
+        """
+        with self.__lock:
+            for digest in [d for d, e in self.__entries.items() if e[2] == user_id]:
+                del self.__entries[digest]
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def __len__(self):
+        return len(self.__entries)
+
+
+"""
+Process-wide cache of verified tokens
+"""
+token_cache = VerifiedTokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_MAX_AGE)
+
+
+def _headerToken(request):
+    """
+    Gets id token from well-formed Authorization header
+    :param request: request
+    :return: token as bytes, None if header is malformed
+    """
+    header = authentication.get_authorization_header(request).split()
+    if len(header) != 2 or header[0].lower() != api_settings.FIREBASE_AUTH_HEADER_PREFIX.lower().encode():
+        return None
+    return header[1]
+
+
+def _checksFirebaseUser() -> bool:
+    return api_settings.FIREBASE_CHECK_JWT_REVOKED or api_settings.FIREBASE_AUTH_EMAIL_VERIFICATION
+
+
+def checkFirebaseUser(decoded_token: dict):
+    """
+    Repeats checks of FirebaseAuthentication, that depend on the firebase user and not on the token itself:
+    revocation (FIREBASE_CHECK_JWT_REVOKED) and email verification (FIREBASE_AUTH_EMAIL_VERIFICATION).
+    Raises AuthenticationFailed if token must not be trusted anymore
+    :param decoded_token: decoded and verified token
+    """
+    from firebase_admin import auth as firebase_auth
+
+    try:
+        firebase_user = firebase_auth.get_user(decoded_token.get('uid'))
+    except Exception:
+        raise exceptions.AuthenticationFailed(
+            'Error retrieving the user, or the specified user ID does not exist')
+    valid_after = firebase_user.tokens_valid_after_timestamp
+    if api_settings.FIREBASE_CHECK_JWT_REVOKED and valid_after and decoded_token.get('iat', 0) * 1000 < valid_after:
+        raise exceptions.AuthenticationFailed('Token revoked, inform the user to reauthenticate or signOut().')
+    if api_settings.FIREBASE_AUTH_EMAIL_VERIFICATION and not firebase_user.email_verified:
+        raise exceptions.AuthenticationFailed('Email address of this user has not been verified.')
+
+
+class CachedFirebaseAuthentication(authentication.BaseAuthentication):
+    """
+    FirebaseAuthentication, that skips signature verification and local user sync
+    for id tokens that were already verified by this process and haven't expired yet.
+    Revocation and email verification are still checked with the firebase user (see checkFirebaseUser).
+    FirebaseAuthentication (and firebase_admin with it) is imported on the first token, that isn't cached.
+    """
+
+    def __init__(self):
+        self.__firebase = None
+
+    def firebase(self):
+        """
+        Gets FirebaseAuthentication doing the actual verification
+        :return: FirebaseAuthentication
+        """
+        if self.__firebase is None:
+            from drf_firebase_auth_cavoke.authentication import FirebaseAuthentication
+            self.__firebase = FirebaseAuthentication()
+        return self.__firebase
+
+    def authenticate(self, request):
+        authorization_header = authentication.get_authorization_header(request)
+        if api_settings.ALLOW_ANONYMOUS_REQUESTS and not authorization_header:
+            return AnonymousUser(), None
+
+        firebase_token = _headerToken(request)
+        if firebase_token is None:
+            # let firebase authentication report what's wrong with the header
+            return self.firebase().authenticate(request)
+        digest = tokenDigest(firebase_token)
+
+        # fast path
+        cached = token_cache.get(digest)
+        if cached is not None:
+            user_id, decoded_token, checkedAt = cached
+            if _checksFirebaseUser() and time.time() - checkedAt >= settings.TOKEN_REVOCATION_CHECK_INTERVAL:
+                try:
+                    checkFirebaseUser(decoded_token)
+                except exceptions.AuthenticationFailed:
+                    token_cache.revokeToken(firebase_token)
+                    raise
+                token_cache.markChecked(digest)
+            try:
+                user = User.objects.get(pk=user_id, is_active=True)
+            except User.DoesNotExist:
+                token_cache.revokeUser(user_id)
+                raise exceptions.AuthenticationFailed('User account is not currently active.')
+            return user, decoded_token
+
+        # slow path: verify signature and sync local user
+        firebase = self.firebase()
+        decoded_token = firebase.decode_token(firebase_token)
+        firebase_user = firebase.authenticate_token(decoded_token)
+        local_user = firebase.get_or_create_local_user(firebase_user)
+        firebase.create_local_firebase_user(local_user, firebase_user)
+
+        token_cache.put(digest, local_user.pk, decoded_token)
+        return local_user, decoded_token
+
+
+# serializes creation of stub users between threads
+_stub_lock = Lock()
+
+
+class StubAuthentication(authentication.BaseAuthentication):
+    """
+    Authenticates "Stub <uid>" headers without Firebase, creating local users on the fly.
+    Used by replaytraffic against a local server (settings.STUB_AUTH), never enable it in production
+    """
+    keyword = b'stub'
+
+    def authenticate(self, request):
+        header = authentication.get_authorization_header(request).split()
+        if not header or header[0].lower() != self.keyword:
+            return None
+        if len(header) != 2:
+            raise exceptions.AuthenticationFailed('Invalid stub header.')
+        uid = header[1].decode()
+        with _stub_lock:
+            firebase_user = FirebaseUser.objects.select_related('user').filter(uid=uid).first()
+            if firebase_user is None:
+                user, _ = User.objects.get_or_create(username=uid)
+                firebase_user = FirebaseUser.objects.create(user=user, uid=uid)
+        return firebase_user.user, {'uid': uid}
+
+    def authenticate_header(self, request):
+        return 'Stub'
+
+
+def revokeToken(token):
+    """
+    Revocation hook: forget verified token
+    :param token: raw id token
+    """
+    token_cache.revokeToken(token)
+
+
+def revokeUid(uid: str):
+    """
+    Revocation hook: forget all verified tokens of a firebase user.
+    Should be called after `firebase_admin.auth.revoke_refresh_tokens(uid)`
+    :param uid: user's uid
+    """
+    token_cache.revokeUid(uid)
+
+
+@receiver(post_save, sender=User)
+def revoke_inactive_user_tokens(sender, instance, **kwargs):
+    if not instance.is_active:
+        token_cache.revokeUser(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    token_cache.revokeUser(instance.pk)
+
+
+@receiver(post_delete, sender=FirebaseUser)
+def revoke_deleted_firebase_user_tokens(sender, instance, **kwargs):
+    token_cache.revokeUid(instance.uid)
@@ -0,0 +1,158 @@
+"""
+Games of authors in Firestore.
+
+Every pending and authored game is a document in a subcollection of its author,
+users/{uid}/pending_games/{game_type_id} and users/{uid}/authored_games/{game_type_id},
+so moderation writes touch one small document per game and getAuthor reads a page of games ordered by createdOn and id.
+Moderator tokens are only kept in the top-level pending_games collection.
+Users, whose games are still arrays in users/{uid} (as before), are moved with migrateauthorgames.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+
+from cavoke_server import db, DeleteField
+from .config import FIRESTORE_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+AUTHORED_GAMES = 'authored_games'
+PENDING_GAMES = 'pending_games'
+AUTHOR_GAMES = (AUTHORED_GAMES, PENDING_GAMES)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def authorGames(uid: str, kind: str):
+    """
+    Gets subcollection of author's games
+    :param uid: uid of author
+    :param kind: authored_games or pending_games
+    :return: CollectionReference
+    """
+    return db.collection('users').document(uid).collection(kind)
+
+
+def authorGameRef(uid: str, kind: str, game_type_id: str):
+    """
+    Gets document of author's game
+    :param uid: uid of author
+    :param kind: authored_games or pending_games
+    :param game_type_id: id of game type
+    :return: DocumentReference
+    """
+    return authorGames(uid, kind).document(game_type_id)
+
+
+def makeCursor(snapshot) -> str:
+    """
+    Makes cursor of next page
+    :param snapshot: DocumentSnapshot of last game of page
+    :return: cursor, createdOn in microseconds since epoch and id of the game
+    """
+    return '{}.{}'.format((snapshot.get('createdOn') - EPOCH) // timedelta(microseconds=1), snapshot.id)
+
+
+def parseCursor(cursor: str) -> tuple:
+    """
+    Reads cursor returned with previous page
+    :param cursor: cursor
+    :return: tuple of (createdOn, id) of last game of previous page, id is None in cursors made before ids were added,
+    raises ValueError if cursor is invalid
+    """
+    created_on, _, game_type_id = cursor.partition('.')
+    return EPOCH + timedelta(microseconds=int(created_on)), game_type_id or None
+
+
+def readAuthorGames(uid: str, kind: str, limit: int = None, cursor: str = None) -> tuple:
+    """
+    Reads page of author's games, newest first
+    :param uid: uid of author
+    :param kind: authored_games or pending_games
+    :param limit: max number of games, all if None
+    :param cursor: cursor of next page from previous call, first page if None
+    :return: tuple of (list of game dicts, cursor of next page or None if it was the last one)
+    """
+    # games created at the same time are ordered by id, so none of them are skipped or repeated between pages
+    query = authorGames(uid, kind).order_by('createdOn', direction='DESCENDING')
+    query = query.order_by('__name__', direction='DESCENDING')
+    if cursor is not None:
+        created_on, game_type_id = parseCursor(cursor)
+        position = {'createdOn': created_on}
+        if game_type_id is not None:
+            position['__name__'] = game_type_id
+        query = query.start_after(position)
+    if limit is None:
+        return [doc.to_dict() for doc in query.stream()], None
+    # one more game tells if there is a next page
+    docs = list(query.limit(limit + 1).stream())
+    cursor = makeCursor(docs[limit - 1]) if len(docs) > limit else None
+    return [doc.to_dict() for doc in docs[:limit]], cursor
+
+
+def moderatedGameWrites(game_type_id: str, gdict: dict, approved: bool) -> list:
+    """
+    Makes writes, that remove moderated game from pending games and add approved one to authored games
+    :param game_type_id: id of game type
+    :param gdict: pending game dict without modtoken
+    :param approved: true if game was approved
+    :return: list of writes for commitWrites
+    """
+    uid = gdict['creator']
+    writes = [('delete', db.collection('pending_games').document(game_type_id), None),
+              ('delete', authorGameRef(uid, PENDING_GAMES, game_type_id), None)]
+    if approved:
+        writes.append(('set', authorGameRef(uid, AUTHORED_GAMES, game_type_id), gdict))
+    return writes
+
+
+def commitWrites(writes: list):
+    """
+    Commits writes in batches
+    :param writes: list of (kind, ref, data), kind is 'set', 'update' or 'delete'
+    """
+    for start in range(0, len(writes), FIRESTORE_BATCH_SIZE):
+        batch = db.batch()
+        for kind, ref, data in writes[start:start + FIRESTORE_BATCH_SIZE]:
+            if kind == 'delete':
+                batch.delete(ref)
+            else:
+                getattr(batch, kind)(ref, data)
+        batch.commit()
+
+
+def migrateAuthorGames(dry_run: bool = False) -> tuple:
+    """
+    Moves authored_games and pending_games arrays of user documents to subcollections.
+    Writes are idempotent, so it can be run again after a failure
+    :param dry_run: only count games to move
+    :return: tuple of (number of users, number of games)
+    """
+    users = games = 0
+    for snapshot in db.collection('users').stream():
+        data = snapshot.to_dict() or {}
+        fields = [kind for kind in AUTHOR_GAMES if kind in data]
+        if not fields:
+            continue
+        pending = [gdict for gdict in data.get(PENDING_GAMES) or [] if 'game_type_id' in gdict]
+        # games moderated since subcollections were deployed are gone from pending_games and aren't copied back
+        refs = [db.collection('pending_games').document(gdict['game_type_id']) for gdict in pending]
+        still_pending = {doc.id for doc in db.get_all(refs) if doc.exists} if refs else set()
+        writes = []
+        for kind in fields:
+            for gdict in data[kind] or []:
+                if 'game_type_id' not in gdict:
+                    logger.warning("Game without id in {%s} of {%s} is dropped", kind, snapshot.id)
+                    continue
+                if kind == PENDING_GAMES and gdict['game_type_id'] not in still_pending:
+                    continue
+                gdict = dict(gdict)
+                # games are paginated by createdOn, so games without it wouldn't be listed
+                gdict.setdefault('createdOn', datetime.now(timezone.utc))
+                writes.append(('set', authorGameRef(snapshot.id, kind, gdict['game_type_id']), gdict))
+        # arrays are removed last, after all their games were written
+        writes.append(('update', snapshot.reference, {kind: DeleteField() for kind in fields}))
+        if not dry_run:
+            commitWrites(writes)
+        users += 1
+        games += len(writes) - 1
+    return users, games
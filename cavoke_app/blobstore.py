@@ -0,0 +1,122 @@
+"""
+Content-addressed storage for pickled game objects.
+Blobs are files named by sha256 of their content, so identical game states are stored once.
+References are counted in GameBlob model, blob is deleted when the last reference is released.
+"""
+import hashlib
+import mmap
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import F
+
+from .config import BLOB_STORE_FOLDER
+
+
+def blobPath(blob_hash: str, folder: str = BLOB_STORE_FOLDER) -> str:
+    """
+    Gets path of blob file
+    :param blob_hash: sha256 of blob
+    :param folder: blob store folder
+    :return: path
+    """
+    return os.path.join(folder, blob_hash[:2], blob_hash[2:])
+
+
+def _writeFile(path: str, data: bytes):
+    """
+    Writes file atomically, so readers never see partial blobs
+    :param path: path to file
+    :param data: content
+    """
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def putBlob(data: bytes) -> str:
+    """
+    Stores blob (if not stored yet) and adds reference to it
+    :param data: content
+    :return: sha256 of blob
+    """
+    from .models import GameBlob
+
+    data = bytes(data)
+    blob_hash = hashlib.sha256(data).hexdigest()
+    path = blobPath(blob_hash)
+    with transaction.atomic():
+        blob, created = GameBlob.objects.select_for_update().get_or_create(
+            blob_hash=blob_hash, defaults={'size': len(data), 'refcount': 0})
+        if created or not os.path.exists(path):
+            _writeFile(path, data)
+        GameBlob.objects.filter(blob_hash=blob_hash).update(refcount=F('refcount') + 1)
+    return blob_hash
+
+
+def releaseBlob(blob_hash: str):
+    """
+    Removes reference to blob, deleting it if it was the last one
+    :param blob_hash: sha256 of blob
+    """
+    from .models import GameBlob
+
+    with transaction.atomic():
+        GameBlob.objects.select_for_update().filter(blob_hash=blob_hash).update(refcount=F('refcount') - 1)
+        deleted, _ = GameBlob.objects.filter(blob_hash=blob_hash, refcount__lte=0).delete()
+        if deleted:
+            # the file is needed again, if the caller's transaction is rolled back
+            transaction.on_commit(lambda: _removeUnreferenced(blob_hash))
+
+
+def _removeUnreferenced(blob_hash: str):
+    """
+    Deletes blob file, unless the blob was stored again since it was released
+    :param blob_hash: sha256 of blob
+    """
+    from .models import GameBlob
+
+    with transaction.atomic():
+        if GameBlob.objects.select_for_update().filter(blob_hash=blob_hash).exists():
+            return
+        try:
+            os.remove(blobPath(blob_hash))
+        except FileNotFoundError:
+            pass
+
+
+@contextmanager
+def openBlob(blob_hash: str):
+    """
+    Maps blob into memory
+    :param blob_hash: sha256 of blob
+    :return: context manager with read-only buffer of blob
+    """
+    with open(blobPath(blob_hash), 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield buffer
+
+
+def readBlob(blob_hash: str) -> bytes:
+    """
+    Reads blob
+    :param blob_hash: sha256 of blob
+    :return: content
+    """
+    with openBlob(blob_hash) as buffer:
+        return bytes(buffer)
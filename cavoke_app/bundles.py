@@ -0,0 +1,161 @@
+"""
+Precompiled zip bundles of game modules.
+
+Bundle of game type is a zip with bytecode of its package (`<game_type_id>/__init__.pyc`, ...),
+built from the git checkout when the game is approved and imported with zipimport,
+so new workers neither scan checkouts nor compile sources.
+"""
+import importlib
+import importlib.util
+import logging
+import os
+import py_compile
+import sys
+import tempfile
+import time
+import zipfile
+import zipimport
+
+from .config import GAME_TYPES_FOLDER, GAME_BUNDLES_FOLDER
+
+logger = logging.getLogger(__name__)
+
+GAME_MODULES_PACKAGE = 'cavoke_app.game_modules'
+
+
+def bundlePath(game_type_id: str) -> str:
+    """
+    Gets path of game type's bundle
+    :param game_type_id: id of game type
+    :return: path
+    """
+    return os.path.join(GAME_BUNDLES_FOLDER, game_type_id + '.zip')
+
+
+def buildBundle(game_type_id: str, source: str = None) -> str:
+    """
+    Compiles game type's checkout and packs it into zip bundle
+    :param game_type_id: id of game type
+    :param source: folder with game type's code, its checkout if None
+    :return: path of bundle
+    """
+    source = source or os.path.join(GAME_TYPES_FOLDER, game_type_id)
+    if not os.path.isdir(source):
+        raise FileNotFoundError(source)
+    os.makedirs(GAME_BUNDLES_FOLDER, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=GAME_BUNDLES_FOLDER, prefix='.tmp-', suffix='.zip')
+    os.close(fd)
+    try:
+        with tempfile.TemporaryDirectory() as build, zipfile.ZipFile(tmp, 'w', zipfile.ZIP_DEFLATED) as bundle:
+            for folder, dirs, files in os.walk(source):
+                dirs[:] = [d for d in dirs if not d.startswith('.') and d != '__pycache__']
+                for name in files:
+                    path = os.path.join(folder, name)
+                    arcname = os.path.join(game_type_id, os.path.relpath(path, source))
+                    if name.endswith('.py'):
+                        # sources are left out, so zipimport uses bytecode without checking mtimes
+                        compiled = os.path.join(build, arcname + 'c')
+                        py_compile.compile(path, cfile=compiled, dfile=arcname, doraise=True)
+                        bundle.write(compiled, arcname + 'c')
+                    elif not name.endswith(('.pyc', '.pyo')):
+                        bundle.write(path, arcname)
+        os.replace(tmp, bundlePath(game_type_id))
+    except BaseException:
+        os.remove(tmp)
+        raise
+    logger.info("Built bundle for {%s}", game_type_id)
+    return bundlePath(game_type_id)
+
+
+def loadBundle(game_type_id: str):
+    """
+    Imports game module from its bundle
+    :param game_type_id: id of game type
+    :return: module
+    """
+    name = GAME_MODULES_PACKAGE + '.' + game_type_id
+    # bundle may have been replaced by an update, so its cached table of contents is stale
+    getattr(zipimport, '_zip_directory_cache', {}).pop(bundlePath(game_type_id), None)
+    importer = zipimport.zipimporter(bundlePath(game_type_id))
+    if not hasattr(importer, 'exec_module'):
+        # python < 3.10
+        return importer.load_module(name)
+    spec = importer.find_spec(name)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    return module
+
+
+def loadGameModule(game_type_id: str):
+    """
+    Imports game module, preferring its bundle over the checkout
+    :param game_type_id: id of game type
+    :return: module
+    """
+    name = GAME_MODULES_PACKAGE + '.' + game_type_id
+    if name in sys.modules:
+        return sys.modules[name]
+    if os.path.exists(bundlePath(game_type_id)):
+        try:
+            return loadBundle(game_type_id)
+        except Exception as e:
+            logger.error("Loading bundle of {%s} failed, importing checkout. Details: {%s}", game_type_id, e)
+    return importlib.import_module(name)
+
+
+def warmup(load=loadGameModule, limit: int = None) -> dict:
+    """
+    Imports bundled game modules, the most played ones if not all of them are imported
+    :param load: function importing game module by game type id
+    :param limit: maximum number of modules to import, all if None
+    :return: dict of game type id to import time in seconds
+    """
+    timings = {}
+    if not os.path.exists(GAME_BUNDLES_FOLDER):
+        return timings
+    bundled = [name[:-len('.zip')] for name in os.listdir(GAME_BUNDLES_FOLDER)
+               if name.endswith('.zip') and not name.startswith('.')]
+    # the most played are imported last, so they are evicted last if the memory budget runs out
+    for game_type_id in reversed(mostPlayed(bundled)[:limit]):
+        start = time.perf_counter()
+        try:
+            load(game_type_id)
+        except Exception as e:
+            logger.error("Warming up {%s} failed. Details: {%s}", game_type_id, e)
+            continue
+        timings[game_type_id] = time.perf_counter() - start
+    return timings
+
+
+def mostPlayed(game_type_ids: list) -> list:
+    """
+    Sorts game types by times played
+    :param game_type_ids: ids of game types
+    :return: ids, the most played first, by id if they can't be read
+    """
+    from .models import GameType
+
+    try:
+        plays = dict(GameType.objects.filter(game_type_id__in=game_type_ids)
+                     .values_list('game_type_id', 'timesPlayed'))
+    except Exception as e:
+        logger.error("Reading times played failed. Details: {%s}", e)
+        plays = {}
+    return sorted(game_type_ids, key=lambda game_type_id: (-plays.get(game_type_id, 0), game_type_id))
+    for name in sorted(os.listdir(GAME_BUNDLES_FOLDER)):
+        if not name.endswith('.zip') or name.startswith('.'):
+            continue
+        game_type_id = name[:-len('.zip')]
+        start = time.perf_counter()
+        try:
+            load(game_type_id)
+        except Exception as e:
+            logger.error("Warming up {%s} failed. Details: {%s}", game_type_id, e)
+            continue
+        timings[game_type_id] = time.perf_counter() - start
+    return timings
@@ -3,7 +3,6 @@ import multiprocessing
 import uuid
 from multiprocessing import Process
 from typing import Callable
-import eventlet
 
 import cavoke.exceptions
 from django.contrib.auth.models import User
@@ -13,7 +12,6 @@ from django.db.models import QuerySet
 from django.http import HttpResponse
 from django.utils import timezone
 from drf_firebase_auth_cavoke.models import FirebaseUser
-from google.cloud.firestore_v1 import ArrayUnion, ArrayRemove
 from rest_framework.decorators import api_view, authentication_classes
 from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
@@ -41,11 +39,168 @@ Folder used for storing game types
 """
 GAME_TYPES_FOLDER = "./cavoke_app/game_modules/"
 
+"""
+Folder used for storing precompiled zip bundles of game types
+"""
+GAME_BUNDLES_FOLDER = "./cavoke_app/game_bundles/"
+
+"""
+Folder used for storing git mirrors of game types' repositories
+"""
+GAME_REPOS_FOLDER = "./cavoke_app/game_repos/"
+
+"""
+Number of extracted revisions of each game type kept on disk, including the current one
+"""
+KEEP_GAME_REVISIONS = 2
+
+"""
+Maximum number of game modules each worker keeps imported (None for no limit)
+"""
+MAX_LOADED_GAME_MODULES = 50
+
+"""
+Maximum memory in bytes, that game modules imported by each worker may take (None for no limit)
+"""
+MAX_GAME_MODULES_MEMORY = 256 * 1024 * 1024
+
+"""
+Whether workers import game bundles on startup, the most played ones up to MAX_LOADED_GAME_MODULES
+"""
+WARMUP_GAME_BUNDLES = True
+
 """
 Timeout for cavoke game session in seconds
 """
 TIMEOUT_FOR_GAME = 10
 
+"""
+Folder used for storing archived game sessions
+"""
+SESSION_ARCHIVE_FOLDER = "./cavoke_app/session_archive/"
+
+"""
+Time delta, after which unused game sessions are archived
+"""
+SESSION_ARCHIVE_AFTER = timezone.timedelta(hours=1)
+
+"""
+Size in bytes, after which new archive segment is started
+"""
+SESSION_ARCHIVE_SEGMENT_SIZE = 64 * 1024 * 1024
+
+"""
+Where game objects of new game sessions are stored: 'db' (game_object_bytes) or 'blob' (see blobstore.py)
+"""
+GAME_STATE_BACKEND = 'db'
+
+"""
+Folder used by content-addressed store of game objects
+"""
+BLOB_STORE_FOLDER = "./cavoke_app/blobs/"
+
+"""
+Time delta, during which repeated uses of game session don't update its lastUsedOn
+"""
+SESSION_TOUCH_INTERVAL = timezone.timedelta(minutes=1)
+
+"""
+Per-user rate limits of endpoints: (tokens refilled per second, bucket size)
+"""
+RATE_LIMITS = {
+    'newSession': (0.2, 5),
+    'getSession': (5, 20),
+    'click': (5, 20),
+}
+
+"""
+SQLite file with rate limit buckets shared by all workers
+"""
+RATE_LIMIT_STORE = "./cavoke_app/ratelimit.sqlite3"
+
+"""
+Number of game repositories cloned in parallel by bulk moderation
+"""
+BULK_MODERATION_WORKERS = 8
+
+"""
+Maximum number of writes in one Firestore batch
+"""
+FIRESTORE_BATCH_SIZE = 500
+
+"""
+Number of authored or pending games in one page of getAuthor by default and at most,
+requests without limit and cursors get all games
+"""
+AUTHOR_GAMES_PAGE_SIZE = 20
+MAX_AUTHOR_GAMES_PAGE_SIZE = 100
+
+"""
+Maximum number of game types returned by search
+"""
+MAX_SEARCH_RESULTS = 200
+
+"""
+Seconds between checkpoints of popular games counters to the database
+"""
+POPULARITY_CHECKPOINT_INTERVAL = 60
+
+"""
+Maximum number of popular games returned at once
+"""
+MAX_POPULAR_GAMES = 50
+
+"""
+Number of rows fetched from the database at once by NDJSON export
+"""
+EXPORT_CHUNK_SIZE = 500
+
+"""
+Number of rows inserted with one bulk_create by NDJSON import
+"""
+IMPORT_BATCH_SIZE = 500
+
+"""
+Maximum number of rendered game responses each worker caches
+"""
+RESPONSE_CACHE_SIZE = 10000
+
+"""
+Number of recent responses of each game session kept to encode new ones as patches
+"""
+RESPONSE_HISTORY_LENGTH = 8
+
+"""
+Maximum number of game sessions each worker keeps response history for
+"""
+RESPONSE_HISTORY_SESSIONS = 10000
+
+"""
+Maximum size of game session summary (result of optional `getSummary()` of games) as JSON in bytes,
+bigger summaries aren't stored
+"""
+MAX_SESSION_SUMMARY_SIZE = 1024
+
+"""
+Maximum number of game code calls each worker runs at once
+"""
+MAX_RUNNING_GAME_CODE = 4
+
+"""
+Maximum number of game code calls waiting for a free slot in each worker, the rest are rejected with 503
+"""
+MAX_WAITING_GAME_CODE = 16
+
+"""
+Maximum time in seconds game code call waits for a free slot
+"""
+MAX_GAME_CODE_WAIT = 2.0
+
+"""
+Maximum number of game code calls of one game type running or waiting in each worker
+"""
+MAX_GAME_CODE_PER_TYPE = 8
+
 
 # eventlet.monkey_patch()
 
@@ -109,6 +264,8 @@ def run_with_limited_time(func: Callable, args: tuple):
     :param args: The functions args, given as tuple
     :return: True if the function ended successfully. False if it was terminated.
     """
+    import eventlet
+
     timeout = eventlet.Timeout(TIMEOUT_FOR_GAME, TimeoutError)
     r = func(*args)
     timeout.cancel()
@@ -0,0 +1,146 @@
+"""
+Delta-encoded game responses.
+
+Each worker keeps the last RESPONSE_HISTORY_LENGTH responses of recently used game sessions.
+Every response carries response_version (state version and game type revision). Clients send the one they have
+as since_version and get a JSON Patch (RFC 6902) against it instead of the full response.
+If the version isn't in history (too old, or served by another worker), or the patch isn't smaller than the response,
+the full response is sent. History keeps only what getResponse renders for a version, responses of other
+game calls (e.g. clickUnitId), that differ from it, are sent in full without response_version.
+"""
+import json
+import threading
+from collections import OrderedDict
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .config import RESPONSE_HISTORY_LENGTH, RESPONSE_HISTORY_SESSIONS
+
+
+def _escape(key) -> str:
+    return str(key).replace('~', '~0').replace('/', '~1')
+
+
+def diff(old, new, path: str = '') -> list:
+    """
+    Makes JSON Patch, that turns old into new
+    :param old: JSON-like object
+    :param new: JSON-like object
+    :param path: JSON Pointer of objects
+    :return: list of operations
+    """
+    if type(old) is not type(new):
+        return [{'op': 'replace', 'path': path, 'value': new}]
+    if old == new:
+        return []
+    if isinstance(new, dict):
+        ops = [{'op': 'remove', 'path': path + '/' + _escape(key)} for key in old if key not in new]
+        for key, value in new.items():
+            if key in old:
+                ops.extend(diff(old[key], value, path + '/' + _escape(key)))
+            else:
+                ops.append({'op': 'add', 'path': path + '/' + _escape(key), 'value': value})
+        return ops
+    if isinstance(new, list):
+        common = min(len(old), len(new))
+        ops = []
+        for i in range(common):
+            ops.extend(diff(old[i], new[i], path + '/' + str(i)))
+        # removed from the end, so indices of the rest stay valid
+        ops.extend({'op': 'remove', 'path': path + '/' + str(i)} for i in range(len(old) - 1, common - 1, -1))
+        ops.extend({'op': 'add', 'path': path + '/-', 'value': value} for value in new[common:])
+        return ops
+    return [{'op': 'replace', 'path': path, 'value': new}]
+
+
+def _size(obj) -> int:
+    return len(json.dumps(obj, cls=DjangoJSONEncoder, separators=(',', ':')))
+
+
+def responseVersion(state_version: int, revision: str) -> str:
+    """
+    Makes version of response, that clients send back as since_version
+    :param state_version: state version of game session
+    :param revision: game type revision, that rendered response
+    :return: version, unique for state and revision, as the same state renders differently after game type update
+    """
+    return '{}.{}'.format(state_version, revision) if revision else str(state_version)
+
+
+class ResponseHistory:
+    """
+    LRU of game session id to its recent responses by response version
+    """
+
+    def __init__(self, sessions: int = RESPONSE_HISTORY_SESSIONS, length: int = RESPONSE_HISTORY_LENGTH):
+        self.sessions = sessions
+        self.length = length
+        self.__histories = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__deltas = 0
+        self.__full = 0
+
+    def __swap(self, game_session_id: str, version: str, response, since_version: str = None):
+        """
+        Records response and gets response of since_version, if it's in history
+        """
+        with self.__lock:
+            history = self.__histories.get(game_session_id)
+            if history is None:
+                history = self.__histories[game_session_id] = OrderedDict()
+            self.__histories.move_to_end(game_session_id)
+            while len(self.__histories) > self.sessions:
+                self.__histories.popitem(last=False)
+            base = history.get(since_version) if since_version is not None else None
+            history[version] = response
+            history.move_to_end(version)
+            while len(history) > self.length:
+                history.popitem(last=False)
+            return base
+
+    def encode(self, game_session_id: str, since_version, version: str, response, canonical=None) -> dict:
+        """
+        Records response and encodes it against the version client has.
+        History keeps one payload per version, the one getResponse renders for it, so a client's copy of a version
+        is the same whichever endpoint it came from
+        :param game_session_id: id of game session
+        :param since_version: response version client has, None for full response
+        :param version: response version
+        :param response: response to send
+        :param canonical: response getResponse renders for version, if it isn't the one sent (e.g. click's response)
+        :return: {"game_patch": JSON Patch, "since_version": ...} or {"game": response}, with "response_version"
+                 unless response differs from the canonical one, as it can't be a base of later patches
+        """
+        recorded = response if canonical is None else canonical
+        base = self.__swap(game_session_id, version, recorded, since_version)
+        if recorded != response:
+            with self.__lock:
+                self.__full += 1
+            return {'game': response}
+        if base is not None:
+            patch = diff(base, response)
+            if _size(patch) < _size(response):
+                with self.__lock:
+                    self.__deltas += 1
+                return {'game_patch': patch, 'since_version': since_version, 'response_version': version}
+        with self.__lock:
+            self.__full += 1
+        return {'game': response, 'response_version': version}
+
+    def stats(self) -> dict:
+        """
+        Gets history statistics
+        :return: dict with sessions in history and responses sent as patches and in full
+        """
+        with self.__lock:
+            return {
+                'sessions': len(self.__histories),
+                'deltas': self.__deltas,
+                'full': self.__full,
+            }
+
+
+"""
+Process-wide history of game responses
+"""
+response_history = ResponseHistory()
@@ -14,3 +14,13 @@ NOT_IMPLEMENTED = "Not implemented"
 NOT_OWNER = "Not the owner of the game type/session"
 UNIT_NOT_FOUND = "Unit not found"
 MAX_GAME_SESSIONS = "User reached max game sessions count"
+TOO_MANY_REQUESTS = "Too many requests, try again later"
+WRONG_DECISION = "Decision must be either approve or decline"
+DUPLICATE_DECISION = "Duplicate decision for the same game"
+WRONG_SORT = "Sort must be one of relevance, timesPlayed, createdOn"
+WRONG_WINDOW = "Window must be one of day, week, all"
+WRONG_EXPORT = "Export must be one of types, sessions, all"
+STATE_CONFLICT = "Game session was changed by another request, try again"
+SERVER_OVERLOADED = "Server is overloaded, try again later"
+WRONG_CURSOR = "Cursor is invalid"
+WRONG_AUTHOR_GAMES = "Kind must be either authored_games or pending_games"
@@ -26,3 +26,23 @@ class TooManyGameTypesWarning(BaseCavokeWarning):
 class TooManyGameSessionsWarning(BaseCavokeWarning):
     # Raised when user has too many game sessions
     pass
+
+
+class ArchiveCorruptedError(BaseCavokeError):
+    # Raised when archived game session can't be read back
+    pass
+
+
+class RequestRejectedWarning(BaseCavokeWarning):
+    # Raised by view helpers when request can't be fulfilled. Args are (message for client, http error code)
+    pass
+
+
+class StateConflictWarning(BaseCavokeWarning):
+    # Raised when game session was changed by another request since it was read
+    pass
+
+
+class OverloadedWarning(BaseCavokeWarning):
+    # Raised when game code call isn't admitted. Args are (seconds to wait before retrying,)
+    pass
@@ -0,0 +1,240 @@
+"""
+Streaming NDJSON export and import of game types and game sessions.
+
+Every line is a JSON object {"model": ..., "fields": {...}}. Game types go first, so sessions can refer to them
+by game_type_id. Rows are read with chunked iterator() queries and written one line at a time,
+the importer reads line by line and inserts with bulk_create in batches, so memory use doesn't depend on table size.
+"""
+import base64
+import json
+from collections import Counter, defaultdict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from .archive import readRecord
+from .blobstore import putBlob, readBlob
+from .config import EXPORT_CHUNK_SIZE, IMPORT_BATCH_SIZE, GAME_STATE_BACKEND
+from cavoke_server.sharding import sessionBucket, shardOf
+from .models import GameSession, GameType, QuotaCounter
+from .prototypes import initialGame
+
+MODEL_GAME_TYPE = 'game_type'
+MODEL_GAME_SESSION = 'game_session'
+
+GAME_TYPE_FIELDS = ('game_type_id', 'name', 'creator', 'creator_display_name', 'git_url', 'description',
+                    'timesPlayed', 'createdOn')
+GAME_SESSION_FIELDS = ('game_session_id', 'player_uid', 'createdOn', 'expiresOn', 'lastUsedOn')
+
+
+def _line(model: str, fields: dict) -> str:
+    return json.dumps({'model': model, 'fields': fields}, cls=DjangoJSONEncoder) + '\n'
+
+
+def exportGameTypes():
+    """
+    Streams game types
+    :return: generator of NDJSON lines
+    """
+    for row in GameType.objects.order_by('pk').values(*GAME_TYPE_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield _line(MODEL_GAME_TYPE, row)
+
+
+def _gameObjectBytes(gs: GameSession) -> bytes:
+    """
+    Reads pickled game object wherever it is stored, without restoring archived sessions
+    :param gs: GameSession
+    :return: pickled game object
+    """
+    if gs.game_object_hash:
+        return readBlob(gs.game_object_hash)
+    if gs.isArchived():
+        return readRecord(gs.archive_segment, gs.archive_offset, gs.archive_length)
+    return bytes(gs.game_object_bytes)
+
+
+def exportGameSessions(include_blobs: bool = False):
+    """
+    Streams game sessions of every shard
+    :param include_blobs: add base64 pickled game objects as game_object
+    :return: generator of NDJSON lines
+    """
+    # sessions may be on other databases than game types, so game types aren't joined
+    game_type_ids = dict(GameType.objects.values_list('pk', 'game_type_id'))
+    for _, sessions in GameSession.objects.onShards():
+        sessions = sessions.order_by('pk')
+        if include_blobs:
+            sessions = sessions.only('game_type_id', 'game_object_bytes', 'game_object_hash', 'summary',
+                                     'archive_segment', 'archive_offset', 'archive_length', *GAME_SESSION_FIELDS)
+            for gs in sessions.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+                fields = {field: getattr(gs, field) for field in GAME_SESSION_FIELDS}
+                fields['game_type_id'] = game_type_ids.get(gs.game_type_id)
+                fields['game_object'] = base64.b64encode(_gameObjectBytes(gs)).decode()
+                # summary belongs to the game object
+                fields['summary'] = gs.summary
+                yield _line(MODEL_GAME_SESSION, fields)
+        else:
+            rows = sessions.values('game_type_id', *GAME_SESSION_FIELDS)
+            for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+                row['game_type_id'] = game_type_ids.get(row['game_type_id'])
+                yield _line(MODEL_GAME_SESSION, row)
+
+
+def exportAll(include_blobs: bool = False):
+    """
+    Streams game types, then game sessions
+    :param include_blobs: add base64 pickled game objects to game sessions
+    :return: generator of NDJSON lines
+    """
+    yield from exportGameTypes()
+    yield from exportGameSessions(include_blobs)
+
+
+def _restoreCreatedOn(model, alias: str, key: str, objects: list, created_on: dict):
+    """
+    Sets exported createdOn of rows inserted with bulk_create, which sets auto_now_add fields to now
+    :param model: model class
+    :param alias: database the rows were inserted to
+    :param key: natural key field of model
+    :param objects: inserted model instances
+    :param created_on: dict of natural key to exported createdOn
+    """
+    if not objects:
+        return
+    # bulk_create doesn't set primary keys on every backend
+    pks = dict(model.objects.using(alias).filter(**{key + '__in': list(created_on)}).values_list(key, 'pk'))
+    for obj in objects:
+        obj.pk = pks[getattr(obj, key)]
+        obj.createdOn = created_on[getattr(obj, key)]
+    model.objects.using(alias).bulk_update(objects, ['createdOn'])
+
+
+class _Importer:
+    """
+    Buffers parsed rows and inserts them in batches
+    """
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self.game_types = []
+        self.game_sessions = []
+        # game_type_id -> GameType referenced by imported sessions
+        self.game_type_objects = {}
+        self.created = {MODEL_GAME_TYPE: 0, MODEL_GAME_SESSION: 0}
+        self.skipped = {MODEL_GAME_TYPE: 0, MODEL_GAME_SESSION: 0}
+        # sessions skipped, because their game type is neither imported nor in the database
+        self.unknown_game_type = 0
+
+    def add(self, record: dict):
+        model, fields = record['model'], record['fields']
+        if model == MODEL_GAME_TYPE:
+            fields['createdOn'] = parse_datetime(fields['createdOn'])
+            self.game_types.append(GameType(**fields))
+            if len(self.game_types) >= self.batch_size:
+                self.flushGameTypes()
+        elif model == MODEL_GAME_SESSION:
+            self.game_sessions.append(fields)
+            if len(self.game_sessions) >= self.batch_size:
+                self.flushGameSessions()
+        else:
+            raise ValueError("Unknown model {" + str(model) + "}")
+
+    def flushGameTypes(self):
+        batch, self.game_types = self.game_types, []
+        if not batch:
+            return
+        existing = set(GameType.objects.filter(game_type_id__in=[gt.game_type_id for gt in batch])
+                       .values_list('game_type_id', flat=True))
+        new = [gt for gt in batch if gt.game_type_id not in existing]
+        created_on = {gt.game_type_id: gt.createdOn for gt in new}
+        with transaction.atomic():
+            GameType.objects.bulk_create(new)
+            _restoreCreatedOn(GameType, 'default', 'game_type_id', new, created_on)
+            # bulk_create bypasses save, so quotas are counted here
+            for creator, count in Counter(gt.creator for gt in new).items():
+                QuotaCounter.objects.add(QuotaCounter.GAME_TYPES, creator, count)
+                QuotaCounter.objects.add(QuotaCounter.SUBMISSIONS, creator, count)
+        self.created[MODEL_GAME_TYPE] += len(new)
+        self.skipped[MODEL_GAME_TYPE] += len(batch) - len(new)
+
+    def flushGameSessions(self):
+        batch, self.game_sessions = self.game_sessions, []
+        if not batch:
+            return
+        # game types are always flushed first, so sessions can refer to them
+        self.flushGameTypes()
+        missing = {fields['game_type_id'] for fields in batch} - set(self.game_type_objects)
+        self.game_type_objects.update((gt.game_type_id, gt) for gt in GameType.objects.filter(game_type_id__in=missing))
+        # sessions go to the shards of their ids
+        shards = defaultdict(list)
+        for fields in batch:
+            shards[shardOf(sessionBucket(fields['game_session_id'], fields['player_uid']))].append(fields)
+        created, unknown_game_type = 0, self.unknown_game_type
+        for alias, rows in shards.items():
+            created += self.createGameSessions(alias, rows)
+        self.created[MODEL_GAME_SESSION] += created
+        self.skipped[MODEL_GAME_SESSION] += len(batch) - created - (self.unknown_game_type - unknown_game_type)
+
+    def createGameSessions(self, alias: str, rows: list) -> int:
+        existing = set(GameSession.objects.using(alias).filter(game_session_id__in=[f['game_session_id'] for f in rows])
+                       .values_list('game_session_id', flat=True))
+        sessions = []
+        for fields in rows:
+            if fields['game_session_id'] in existing:
+                continue
+            game_type = self.game_type_objects.get(fields['game_type_id'])
+            if game_type is None:
+                # the session couldn't be played or restarted
+                self.unknown_game_type += 1
+                continue
+            gs = GameSession(
+                game_session_id=fields['game_session_id'],
+                player_uid=fields['player_uid'],
+                game_type=game_type,
+                createdOn=parse_datetime(fields['createdOn']),
+                expiresOn=parse_datetime(fields['expiresOn']),
+                lastUsedOn=parse_datetime(fields['lastUsedOn']),
+            )
+            if 'game_object' in fields:
+                gs.game_object_bytes = base64.b64decode(fields['game_object'])
+                gs.summary = fields.get('summary') or {}
+            else:
+                # sessions exported without game objects start over
+                gs.game_object_bytes, gs.summary = initialGame(gs.game_type)
+            sessions.append(gs)
+        created_on = {gs.game_session_id: gs.createdOn for gs in sessions}
+        # blobs and quotas are on default, so its transaction is committed after the shard's one
+        with transaction.atomic(), transaction.atomic(using=alias):
+            if GAME_STATE_BACKEND == 'blob':
+                for gs in sessions:
+                    gs.game_object_hash = putBlob(gs.game_object_bytes)
+                    gs.game_object_bytes = b''
+            GameSession.objects.using(alias).bulk_create(sessions)
+            _restoreCreatedOn(GameSession, alias, 'game_session_id', sessions, created_on)
+            for player_uid, count in Counter(gs.player_uid for gs in sessions).items():
+                QuotaCounter.objects.add(QuotaCounter.GAME_SESSIONS, player_uid, count)
+        return len(sessions)
+
+    def flush(self):
+        self.flushGameTypes()
+        self.flushGameSessions()
+
+
+def importRecords(lines, batch_size: int = IMPORT_BATCH_SIZE) -> tuple:
+    """
+    Imports NDJSON lines made by export. Every batch is committed separately and rows, that already exist
+    (by game_type_id or game_session_id), are skipped, so interrupted import can be run again
+    :param lines: iterable of lines (file, generator)
+    :param batch_size: number of rows in one bulk_create
+    :return: tuple of (dict of model to created rows, dict of model to skipped existing rows,
+             number of game sessions skipped because their game type is unknown)
+    """
+    importer = _Importer(batch_size)
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode()
+        if line.strip():
+            importer.add(json.loads(line))
+    importer.flush()
+    return importer.created, importer.skipped, importer.unknown_game_type
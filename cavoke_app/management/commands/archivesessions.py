@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cavoke_app.archive import archiveIdleSessions, deleteUnreferencedSegments
+from cavoke_app.config import SESSION_ARCHIVE_AFTER
+
+
+class Command(BaseCommand):
+    help = 'Moves game objects of idle game sessions to compressed archive segments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--idle-minutes', type=float, default=SESSION_ARCHIVE_AFTER.total_seconds() / 60,
+                            help='archive sessions unused for longer than this')
+        parser.add_argument('--gc', action='store_true', help='delete segments with no archived sessions left')
+
+    def handle(self, *args, **options):
+        archived = archiveIdleSessions(timezone.timedelta(minutes=options['idle_minutes']))
+        self.stdout.write('Archived {} game sessions'.format(archived))
+        if options['gc']:
+            self.stdout.write('Deleted {} segments'.format(deleteUnreferencedSegments()))
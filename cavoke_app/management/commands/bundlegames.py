@@ -0,0 +1,75 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from cavoke_app.bundles import buildBundle, bundlePath, GAME_MODULES_PACKAGE
+from cavoke_app.models import GameType
+
+"""
+Script measuring cold import of game module in a fresh interpreter.
+cavoke itself is imported before measuring, as it is shared by all game types
+"""
+COLD_IMPORT_SCRIPT = '''
+import importlib, importlib.util, sys, time, zipimport
+sys.path.insert(0, {base!r})
+import cavoke
+name = {package!r} + '.' + {game_type_id!r}
+start = time.perf_counter()
+if {bundle!r}:
+    importer = zipimport.zipimporter({bundle!r})
+    if hasattr(importer, 'exec_module'):
+        spec = importer.find_spec(name)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    else:
+        importer.load_module(name)
+else:
+    importlib.import_module(name)
+print(time.perf_counter() - start)
+'''
+
+
+class Command(BaseCommand):
+    help = 'Builds zip bundles of game types and reports cold import time before and after'
+
+    def add_arguments(self, parser):
+        parser.add_argument('game_type_ids', nargs='*', help='game types to bundle, all by default')
+        parser.add_argument('--no-report', action='store_true', help="don't measure import times")
+
+    def handle(self, *args, **options):
+        ids = options['game_type_ids'] or list(GameType.objects.values_list('game_type_id', flat=True))
+        for game_type_id in ids:
+            before = None if options['no_report'] else self.__coldImport(game_type_id, None)
+            try:
+                buildBundle(game_type_id)
+            except Exception as e:
+                self.stderr.write('{}: bundling failed: {}'.format(game_type_id, e))
+                continue
+            if options['no_report']:
+                self.stdout.write('{}: bundled'.format(game_type_id))
+                continue
+            after = self.__coldImport(game_type_id, os.path.abspath(bundlePath(game_type_id)))
+            self.stdout.write('{:40} checkout {:8.2f} ms   bundle {:8.2f} ms'.format(
+                game_type_id, before * 1000, after * 1000))
+
+    @staticmethod
+    def __coldImport(game_type_id: str, bundle) -> float:
+        """
+        Measures import time of game module in new interpreter
+        :param game_type_id: id of game type
+        :param bundle: path to bundle or None to import checkout
+        :return: seconds
+        """
+        script = COLD_IMPORT_SCRIPT.format(base=settings.BASE_DIR, package=GAME_MODULES_PACKAGE,
+                                           game_type_id=game_type_id, bundle=bundle)
+        # -B only stops writing bytecode, an empty cache prefix makes the checkout be compiled from source,
+        # while bundles still bring their own bytecode
+        with tempfile.TemporaryDirectory() as cache:
+            env = dict(os.environ, PYTHONPYCACHEPREFIX=cache)
+            output = subprocess.check_output([sys.executable, '-B', '-c', script], cwd=settings.BASE_DIR, env=env)
+        return float(output.decode().strip().splitlines()[-1])
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from cavoke_app.export import exportGameTypes, exportGameSessions, exportAll
+
+
+class Command(BaseCommand):
+    help = 'Streams game types and game sessions as NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--what', choices=('types', 'sessions', 'all'), default='all')
+        parser.add_argument('--blobs', action='store_true', help='include base64 pickled game objects')
+        parser.add_argument('--output', '-o', help='file to write to, stdout by default')
+
+    def handle(self, *args, **options):
+        if options['what'] == 'types':
+            lines = exportGameTypes()
+        elif options['what'] == 'sessions':
+            lines = exportGameSessions(options['blobs'])
+        else:
+            lines = exportAll(options['blobs'])
+        count = 0
+        if options['output']:
+            with open(options['output'], 'w') as out:
+                for line in lines:
+                    out.write(line)
+                    count += 1
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
+                count += 1
+        self.stderr.write('Exported {} rows'.format(count))
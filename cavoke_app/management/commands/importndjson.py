@@ -0,0 +1,26 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from cavoke_app.config import IMPORT_BATCH_SIZE
+from cavoke_app.export import importRecords, MODEL_GAME_SESSION
+
+
+class Command(BaseCommand):
+    help = 'Imports game types and game sessions from NDJSON made by exportndjson'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', nargs='?', help='file to read from, stdin by default')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        source = open(options['input']) if options['input'] else sys.stdin
+        try:
+            created, skipped, unknown_game_type = importRecords(source, options['batch_size'])
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        for model in created:
+            self.stdout.write('{}: created {}, skipped {} existing'.format(model, created[model], skipped[model]))
+        if unknown_game_type:
+            self.stdout.write('{}: skipped {} of unknown game types'.format(MODEL_GAME_SESSION, unknown_game_type))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from cavoke_app.authors import migrateAuthorGames
+
+
+class Command(BaseCommand):
+    help = 'Moves authored_games and pending_games arrays of Firestore user documents to per-game subcollections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='only count games to move')
+
+    def handle(self, *args, **options):
+        users, games = migrateAuthorGames(options['dry_run'])
+        self.stdout.write('{} {} games of {} users'.format(
+            'Would move' if options['dry_run'] else 'Moved', games, users))
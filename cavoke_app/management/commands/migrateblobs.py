@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from cavoke_app.blobstore import putBlob, readBlob, releaseBlob
+from cavoke_app.models import GameSession
+
+
+class Command(BaseCommand):
+    help = 'Moves game objects of existing game sessions between the database and the blob store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--to', choices=('blob', 'db'), default='blob')
+
+    def handle(self, *args, **options):
+        moved = 0
+        for alias, sessions in GameSession.objects.onShards():
+            # sessions saved meanwhile are skipped, so neither their new state nor their blob's references are lost
+            if options['to'] == 'blob':
+                sessions = sessions.filter(game_object_hash='', archive_segment='') \
+                    .only('id', 'state_version', 'game_object_bytes')
+                for gs in sessions.iterator(chunk_size=100):
+                    with transaction.atomic():
+                        blob_hash = putBlob(gs.game_object_bytes)
+                        updated = GameSession.objects.using(alias).filter(
+                            pk=gs.pk, state_version=gs.state_version, game_object_hash='').update(
+                            game_object_hash=blob_hash, game_object_bytes=b'')
+                        if updated != 1:
+                            releaseBlob(blob_hash)
+                    moved += updated
+            else:
+                sessions = sessions.exclude(game_object_hash='').only('id', 'state_version', 'game_object_hash')
+                for gs in sessions.iterator(chunk_size=100):
+                    with transaction.atomic():
+                        updated = GameSession.objects.using(alias).filter(
+                            pk=gs.pk, state_version=gs.state_version, game_object_hash=gs.game_object_hash).update(
+                            game_object_bytes=readBlob(gs.game_object_hash), game_object_hash='')
+                        if updated == 1:
+                            releaseBlob(gs.game_object_hash)
+                    moved += updated
+        self.stdout.write('Moved {} game sessions'.format(moved))
@@ -0,0 +1,83 @@
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+"""
+Script importing startup module in a fresh interpreter and printing wall time of the import
+"""
+STARTUP_SCRIPT = '''
+import sys, time
+sys.path.insert(0, {base!r})
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+'''
+
+"""
+Packages, that shouldn't be imported on startup, as they are loaded lazily on first use
+"""
+LAZY_PACKAGES = ('firebase_admin', 'google', 'eventlet')
+
+
+class Command(BaseCommand):
+    help = 'Reports import time breakdown of worker startup, measured with python -X importtime'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', default='cavoke_server.wsgi', help='module workers import on startup')
+        parser.add_argument('--runs', type=int, default=3, help='startups measured, the fastest one is reported')
+        parser.add_argument('--top', type=int, default=20, help='number of packages and modules listed')
+
+    def handle(self, *args, **options):
+        best = None
+        for _ in range(max(options['runs'], 1)):
+            run = self.__measure(options['module'])
+            if best is None or run[0] < best[0]:
+                best = run
+        wall, imports = best
+
+        self.stdout.write('Startup import of {}: {:.1f} ms wall, {} modules'.format(
+            options['module'], wall * 1000, len(imports)))
+
+        packages = defaultdict(int)
+        for name, self_us, cumulative_us in imports:
+            packages[name.split('.')[0]] += self_us
+        self.stdout.write('\nSelf time by top-level package:')
+        for package, us in sorted(packages.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write('  {:40} {:8.1f} ms'.format(package, us / 1000))
+
+        self.stdout.write('\nSlowest modules (cumulative):')
+        for name, self_us, cumulative_us in sorted(imports, key=lambda item: -item[2])[:options['top']]:
+            self.stdout.write('  {:60} {:8.1f} ms'.format(name, cumulative_us / 1000))
+
+        eager = sorted(package for package in LAZY_PACKAGES if package in packages)
+        if eager:
+            self.stdout.write('\nImported on startup, though expected to be lazy: ' + ', '.join(eager))
+
+    @staticmethod
+    def __measure(module: str) -> tuple:
+        """
+        Imports module in a fresh interpreter with -X importtime
+        :param module: module to import
+        :return: tuple of (wall time in seconds, list of (module, self us, cumulative us))
+        """
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'cavoke_server.settings'))
+        script = STARTUP_SCRIPT.format(base=str(settings.BASE_DIR), module=module)
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', script], env=env, cwd=str(settings.BASE_DIR),
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        if result.returncode != 0:
+            raise CommandError('Importing {} failed:\n{}'.format(module, result.stderr[-2000:]))
+        imports = []
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            if not line.startswith('import time:'):
+                continue
+            fields = line[len('import time:'):].split('|')
+            try:
+                imports.append((fields[2].strip(), int(fields[0]), int(fields[1])))
+            except (IndexError, ValueError):
+                continue
+        return float(result.stdout.strip().splitlines()[-1]), imports
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from cavoke_app.models import QuotaCounter
+from cavoke_app.quotas import reconcileQuotas
+
+
+class Command(BaseCommand):
+    help = 'Fixes quota counters, that drifted from real counts of game sessions and game types'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=QuotaCounter.KINDS, action='append',
+                            help='kind of quota to reconcile, all by default')
+
+    def handle(self, *args, **options):
+        for kind in options['kind'] or QuotaCounter.KINDS:
+            self.stdout.write('Fixed {} counters of {}'.format(reconcileQuotas(kind), kind))
@@ -0,0 +1,66 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cavoke_server.replay import DEFAULT_ENDPOINTS, Replayer, readTraces, summarize, compare
+
+
+def _change(value) -> str:
+    return '' if value is None else '{:+.1%}'.format(value)
+
+
+def _ms(value) -> str:
+    return '' if value is None else '{:.1f}'.format(value)
+
+
+class Command(BaseCommand):
+    help = ('Replays traffic captured with CAVOKE_CAPTURE_FILE against a server running with CAVOKE_STUB_AUTH=1, '
+            'or compares latencies of two replays')
+
+    def add_arguments(self, parser):
+        parser.add_argument('capture', nargs='?', help='JSONL file written by traffic capture')
+        parser.add_argument('--target', default='http://127.0.0.1:8000', help='base url of server')
+        parser.add_argument('--speed', type=float, default=1.0,
+                            help='pacing multiplier: 1 for original pacing, 10 for 10x faster, 0 for no pacing')
+        parser.add_argument('--workers', type=int, default=16, help='concurrent requests')
+        parser.add_argument('--endpoints', nargs='+', default=list(DEFAULT_ENDPOINTS),
+                            help='endpoints to replay')
+        parser.add_argument('-o', '--output', help='JSONL file to write results to')
+        parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'),
+                            help='compare results of two replays instead of replaying')
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            summaries = []
+            for path in options['compare']:
+                with open(path) as f:
+                    summaries.append(summarize(json.loads(line) for line in f if line.strip()))
+            self.writeComparison(compare(*summaries))
+            return
+
+        if not options['capture']:
+            raise CommandError('Capture file or --compare is required')
+        with open(options['capture']) as f:
+            traces = readTraces(f, options['endpoints'])
+        replayer = Replayer(options['target'], options['speed'], options['workers'])
+        output = open(options['output'], 'w') if options['output'] else None
+        try:
+            results = replayer.run(traces, lambda result: output and output.write(json.dumps(result) + '\n'))
+        finally:
+            if output is not None:
+                output.close()
+
+        self.stdout.write('Replayed {} of {} requests, {} skipped for unknown game sessions'.format(
+            len(results), len(traces), replayer.skipped))
+        self.stdout.write('{:<16}{:>8}{:>8}{:>10}{:>10}{:>10}'.format('endpoint', 'count', 'errors', 'p50', 'p95',
+                                                                     'p99'))
+        for endpoint, row in summarize(results).items():
+            self.stdout.write('{:<16}{:>8}{:>8}{:>10}{:>10}{:>10}'.format(
+                endpoint, row['count'], row['errors'], _ms(row['p50']), _ms(row['p95']), _ms(row['p99'])))
+
+    def writeComparison(self, rows: list):
+        self.stdout.write('{:<16}{:>8}{:>10}{:>10}{:>9}{:>10}{:>10}{:>9}'.format(
+            'endpoint', 'count', 'p50 base', 'p50 new', 'change', 'p95 base', 'p95 new', 'change'))
+        for endpoint, count, p50a, p50b, p50c, p95a, p95b, p95c in rows:
+            self.stdout.write('{:<16}{:>8}{:>10}{:>10}{:>9}{:>10}{:>10}{:>9}'.format(
+                endpoint, count, _ms(p50a), _ms(p50b), _change(p50c), _ms(p95a), _ms(p95b), _change(p95c)))
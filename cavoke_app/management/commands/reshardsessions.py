@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from cavoke_app.resharding import reshardSessions
+from cavoke_server.sharding import sessionShards
+
+
+class Command(BaseCommand):
+    help = ('Moves game sessions to the shards SESSION_SHARD_MAP assigns their buckets to. '
+            'Run it with SESSION_SHARD_MAP_PREVIOUS set to the old map, then unset it')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='append', choices=list(settings.DATABASES),
+                            help='databases to move sessions from, all shards by default')
+        parser.add_argument('--dry-run', action='store_true', help='only count misplaced sessions')
+
+    def handle(self, *args, **options):
+        moved = reshardSessions(options['database'] or sessionShards(), options['dry_run'])
+        for (source, target), count in sorted(moved.items()):
+            self.stdout.write('{} {} game sessions from {} to {}'.format(
+                'Would move' if options['dry_run'] else 'Moved', count, source, target))
+        if not moved:
+            self.stdout.write('All game sessions are on their shards')
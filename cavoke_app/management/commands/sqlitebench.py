@@ -0,0 +1,76 @@
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand
+
+from cavoke_server.sqlite import applyPragmas, pragmas
+
+"""
+Size of fake game object written by each benchmark operation
+"""
+PAYLOAD_SIZE = 2048
+
+
+def _writer(args):
+    """
+    Benchmark worker. Updates random rows until deadline
+    :param args: (db path, pragmas to apply or None, busy timeout in seconds, seconds to run, rows count)
+    :return: (successful writes, 'database is locked' errors)
+    """
+    path, values, timeout, duration, rows = args
+    conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    if values is not None:
+        applyPragmas(conn.cursor(), values)
+    payload = os.urandom(PAYLOAD_SIZE)
+    done = locked = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        try:
+            conn.execute('UPDATE session SET bytes = ?, version = version + 1 WHERE id = ?',
+                         (payload, random.randint(1, rows)))
+            done += 1
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            locked += 1
+    conn.close()
+    return done, locked
+
+
+class Command(BaseCommand):
+    help = 'Measures concurrent SQLite write throughput with default and tuned pragmas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=5.0, help='seconds per run')
+        parser.add_argument('--rows', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        results = {}
+        # both runs wait for locks equally long, so only the other pragmas are compared
+        timeout = pragmas().get('busy_timeout', 5000) / 1000
+        for title, values in (('default', None), ('tuned', pragmas())):
+            with tempfile.TemporaryDirectory() as folder:
+                path = os.path.join(folder, 'bench.sqlite3')
+                self.__prepare(path, options['rows'])
+                jobs = [(path, values, timeout, options['duration'], options['rows'])] * options['processes']
+                with Pool(options['processes']) as pool:
+                    counts = pool.map(_writer, jobs)
+            done = sum(c[0] for c in counts)
+            locked = sum(c[1] for c in counts)
+            results[title] = done / options['duration']
+            self.stdout.write('{:8} {:10.1f} writes/s  {:6} locked errors'.format(title, results[title], locked))
+        if results['default']:
+            self.stdout.write('speedup: x{:.2f}'.format(results['tuned'] / results['default']))
+
+    @staticmethod
+    def __prepare(path: str, rows: int):
+        conn = sqlite3.connect(path)
+        conn.execute('CREATE TABLE session (id INTEGER PRIMARY KEY, bytes BLOB, version INTEGER)')
+        conn.executemany('INSERT INTO session VALUES (?, ?, 0)', ((i, b'') for i in range(1, rows + 1)))
+        conn.commit()
+        conn.close()
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cavoke_app.models import GameType
+from cavoke_app.revisions import updateGameType
+
+
+class Command(BaseCommand):
+    help = 'Fetches new commits of game types and swaps their new revisions in'
+
+    def add_arguments(self, parser):
+        parser.add_argument('game_type_ids', nargs='*', help='game types to update')
+        parser.add_argument('--all', action='store_true', help='update all game types')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            game_types = GameType.objects.all()
+        elif options['game_type_ids']:
+            game_types = GameType.objects.filter(game_type_id__in=options['game_type_ids'])
+        else:
+            raise CommandError('Pass game type ids or --all')
+        failed = 0
+        for gt in game_types.iterator():
+            try:
+                previous, revision = updateGameType(gt)
+            except Exception as e:
+                failed += 1
+                self.stderr.write('{}: update failed: {}'.format(gt.game_type_id, e))
+                continue
+            if previous == revision:
+                self.stdout.write('{}: up to date at {}'.format(gt.game_type_id, revision))
+            else:
+                self.stdout.write('{}: {} -> {}'.format(gt.game_type_id, previous or 'unversioned checkout', revision))
+        if failed:
+            raise CommandError('{} game types failed to update'.format(failed))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from cavoke_app.bundles import warmup
+from cavoke_app.modulecache import game_module_cache
+
+
+class Command(BaseCommand):
+    help = 'Imports all bundled game modules and reports import time of each'
+
+    def handle(self, *args, **options):
+        timings = warmup(game_module_cache.get)
+        for game_type_id, seconds in timings.items():
+            self.stdout.write('{:40} {:8.2f} ms'.format(game_type_id, seconds * 1000))
+        self.stdout.write('Loaded {} bundles in {:.2f} ms'.format(len(timings), sum(timings.values()) * 1000))
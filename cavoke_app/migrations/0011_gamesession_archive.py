@@ -0,0 +1,34 @@
+# Generated by Django 2.2.4 on 2026-10-19 12:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cavoke_app', '0010_auto_20190822_1713'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamesession',
+            name='lastUsedOn',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='gamesession',
+            name='archive_segment',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='gamesession',
+            name='archive_offset',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='gamesession',
+            name='archive_length',
+            field=models.IntegerField(default=0),
+        ),
+    ]
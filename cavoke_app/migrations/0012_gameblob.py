@@ -0,0 +1,27 @@
+# Generated by Django 2.2.4 on 2026-10-19 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cavoke_app', '0011_gamesession_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameBlob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('blob_hash', models.CharField(max_length=64, unique=True)),
+                ('size', models.IntegerField(default=0)),
+                ('refcount', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='gamesession',
+            name='game_object_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.4 on 2026-10-19 13:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cavoke_app', '0012_gameblob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameTypePlays',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('count', models.IntegerField(default=0)),
+                ('game_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cavoke_app.GameType')),
+            ],
+            options={
+                'unique_together': {('game_type', 'hour')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.4 on 2026-10-19 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cavoke_app', '0013_gametypeplays'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gametype',
+            name='revision',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+    ]
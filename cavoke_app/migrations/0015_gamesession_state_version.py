@@ -0,0 +1,18 @@
+# Generated by Django 2.2.4 on 2026-10-19 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cavoke_app', '0014_gametype_revision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamesession',
+            name='state_version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 2.2.4 on 2026-10-19 17:10
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def seed_counters(apps, schema_editor):
+    QuotaCounter = apps.get_model('cavoke_app', 'QuotaCounter')
+    GameSession = apps.get_model('cavoke_app', 'GameSession')
+    GameType = apps.get_model('cavoke_app', 'GameType')
+    Profile = apps.get_model('cavoke_app', 'Profile')
+    FirebaseUser = apps.get_model('drf_firebase_auth_cavoke', 'FirebaseUser')
+    db = schema_editor.connection.alias
+
+    counters = []
+    for row in GameSession.objects.using(db).values('player_uid').annotate(used=Count('pk')).order_by():
+        counters.append(QuotaCounter(kind='game_sessions', owner=row['player_uid'], used=row['used']))
+    for row in GameType.objects.using(db).values('creator').annotate(used=Count('pk')).order_by():
+        counters.append(QuotaCounter(kind='game_types', owner=row['creator'], used=row['used']))
+    uids = dict(FirebaseUser.objects.using(db).values_list('user_id', 'uid'))
+    games_made = Profile.objects.using(db).filter(gamesMadeCount__gt=0).values_list('user_id', 'gamesMadeCount')
+    for user_id, used in games_made:
+        if user_id in uids:
+            counters.append(QuotaCounter(kind='submissions', owner=uids[user_id], used=used))
+    QuotaCounter.objects.using(db).bulk_create(counters, batch_size=500)
+
+
+def restore_games_made(apps, schema_editor):
+    QuotaCounter = apps.get_model('cavoke_app', 'QuotaCounter')
+    Profile = apps.get_model('cavoke_app', 'Profile')
+    FirebaseUser = apps.get_model('drf_firebase_auth_cavoke', 'FirebaseUser')
+    db = schema_editor.connection.alias
+
+    users = dict(FirebaseUser.objects.using(db).values_list('uid', 'user_id'))
+    for owner, used in QuotaCounter.objects.using(db).filter(kind='submissions').values_list('owner', 'used'):
+        if owner in users:
+            Profile.objects.using(db).filter(user_id=users[owner]).update(gamesMadeCount=used)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf_firebase_auth_cavoke', '0001_initial'),
+        ('cavoke_app', '0015_gamesession_state_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuotaCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('owner', models.CharField(max_length=191)),
+                ('used', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('kind', 'owner')},
+            },
+        ),
+        migrations.RunPython(seed_counters, restore_games_made),
+        migrations.RemoveField(
+            model_name='profile',
+            name='gamesMadeCount',
+        ),
+    ]
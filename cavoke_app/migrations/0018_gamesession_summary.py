@@ -0,0 +1,24 @@
+# Generated by Django 3.1 on 2026-10-19 19:00
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cavoke_app', '0017_gamesession_game_type_no_constraint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamesession',
+            name='summary',
+            field=models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder),
+        ),
+        migrations.AlterField(
+            model_name='gamesession',
+            name='player_uid',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+    ]
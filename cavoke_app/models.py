@@ -3,18 +3,28 @@ import os
 import subprocess
 import pickle
 from pickle import HIGHEST_PROTOCOL
-from importlib import import_module
 
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import URLValidator
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import models, router, transaction, IntegrityError
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 from django.utils import timezone
 from drf_firebase_auth_cavoke.models import FirebaseUser
 
+from cavoke_server.sharding import PRIMARY_DB, bucketOf, newSessionId, sessionBucket, shardsOf, sessionShards, \
+    isResharding
+
 from .gamestorage import *
+from .prototypes import initialGame, invalidatePrototype
+from .archive import readRecord
+from .blobstore import putBlob, releaseBlob, openBlob, readBlob
+from .modulecache import game_module_cache
+from .revisions import cloneGameType, currentRevision
 from .exceptions import *
 from .config import *
 
@@ -31,21 +41,81 @@ def git(*args):
     return subprocess.check_call(['git'] + list(args))
 
 
+class GameSessionManager(models.Manager):
+    """
+    Finds game sessions on their shards (see cavoke_server.sharding)
+    """
+
+    def onShard(self, alias: str) -> models.QuerySet:
+        """
+        Gets sessions on shard. Sessions on default may be read from replicas in replica_reads views
+        :param alias: database alias
+        :return: queryset
+        """
+        return self.get_queryset() if alias == PRIMARY_DB else self.using(alias)
+
+    def onShards(self):
+        """
+        Gets sessions on every shard, read from primaries, for maintenance jobs
+        :return: generator of (alias, queryset)
+        """
+        for alias in sessionShards():
+            yield alias, self.using(alias)
+
+    def locate(self, game_session_id: str, player_uid: str = None, defer: tuple = ()):
+        """
+        Gets game session with its game type by id, looking only at the shard of its bucket
+        :param game_session_id: id of game session
+        :param player_uid: uid of player, used for ids made before sharding
+        :param defer: fields loaded lazily
+        :return: GameSession, raises GameSession.DoesNotExist if not found
+        """
+        bucket = sessionBucket(game_session_id, player_uid)
+        aliases = shardsOf(bucket) if bucket is not None else sessionShards()
+        # session is invisible for a moment, while reshardsessions moves it
+        for attempt in range(2 if isResharding() else 1):
+            for alias in aliases:
+                sessions = self.onShard(alias)
+                if alias == PRIMARY_DB:
+                    # game types are only on default
+                    sessions = sessions.select_related('game_type')
+                try:
+                    return sessions.defer(*defer).get(game_session_id=game_session_id)
+                except self.model.DoesNotExist:
+                    pass
+        raise self.model.DoesNotExist
+
+    def forPlayer(self, player_uid: str, defer: tuple = ()) -> list:
+        """
+        Gets all game sessions of player
+        :param player_uid: uid of player
+        :param defer: fields loaded lazily
+        :return: list of GameSession
+        """
+        sessions = []
+        for alias in shardsOf(bucketOf(player_uid)):
+            sessions.extend(self.onShard(alias).filter(player_uid=player_uid).defer(*defer))
+        if len(sessions) > 1:
+            sessions.sort(key=lambda gs: gs.createdOn)
+        return sessions
+
+
 class GameSession(models.Model):
     """
     GameSession model
     """
-    # id of game session
+    # id of game session, '<bucket>-<uuid>' (see cavoke_server.sharding)
     game_session_id = models.CharField(max_length=100, unique=True)
 
     # uid of player
-    player_uid = models.CharField(max_length=100)
+    player_uid = models.CharField(max_length=100, db_index=True)
 
-    # game type of game session
+    # game type of game session, not enforced by the database, as sessions may be on another shard
     game_type = models.ForeignKey(
         'GameType',
         on_delete=models.CASCADE,
-        null=True
+        null=True,
+        db_constraint=False
     )
 
     # timestamp of time when created
@@ -57,6 +127,25 @@ class GameSession(models.Model):
     # object of game in binary to be decoded with pickle
     game_object_bytes = models.BinaryField()
 
+    # timestamp of last use (not updated more often than SESSION_TOUCH_INTERVAL)
+    lastUsedOn = models.DateTimeField(default=timezone.now)
+
+    # location of game object in archive, if session was archived (see archive.py)
+    archive_segment = models.CharField(max_length=100, blank=True, default='')
+    archive_offset = models.BigIntegerField(default=0)
+    archive_length = models.IntegerField(default=0)
+
+    # sha256 of game object in blob store, if it is stored there instead of game_object_bytes
+    game_object_hash = models.CharField(max_length=64, blank=True, default='')
+
+    # version of game state, bumped by every mutating action
+    state_version = models.IntegerField(default=0)
+
+    # summary of game state from optional `getSummary()` of game, saved with the state (see summaries.py)
+    summary = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+
+    objects = GameSessionManager()
+
     class Meta:
         ordering = ('createdOn', 'player_uid', 'game_type_id', 'game_session_id', 'expiresOn')
 
@@ -69,16 +158,26 @@ class GameSession(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.game_session_id:
-            # check if session count is ok
-            if GameSession.objects.filter(player_uid=self.player_uid).count() > MAX_ACTIVE_GAME_SESSIONS:
-                raise TooManyGameSessionsWarning
-
-            # called on create, so we initialize
-            self.createdOn = timezone.now()
-            self.expiresOn = self.createdOn + GAMESESSION_VALID_FOR
-            self.game_session_id = randomUUID()
-
+            # game code runs before the transaction, so it doesn't hold database locks
             self.__createGameObject()
+            # slot in player's quota (on default) is rolled back if the insert into session's shard fails,
+            # the shard commits first, so a failed commit of default may leave the session without its slot
+            with transaction.atomic():
+                if not QuotaCounter.objects.acquire(QuotaCounter.GAME_SESSIONS, self.player_uid,
+                                                    MAX_ACTIVE_GAME_SESSIONS):
+                    raise TooManyGameSessionsWarning
+
+                # called on create, so we initialize
+                self.createdOn = timezone.now()
+                self.expiresOn = self.createdOn + GAMESESSION_VALID_FOR
+                # router writes session to the shard of this id
+                self.game_session_id = newSessionId(self.player_uid)
+
+                if GAME_STATE_BACKEND == 'blob':
+                    self.game_object_hash = putBlob(self.game_object_bytes)
+                    self.game_object_bytes = b''
+                with transaction.atomic(using=router.db_for_write(GameSession, instance=self), savepoint=False):
+                    return super(GameSession, self).save(*args, **kwargs)
 
         return super(GameSession, self).save(*args, **kwargs)
 
@@ -86,12 +185,9 @@ class GameSession(models.Model):
         """
         create Game object from cavoke-lib
         """
-        gt_id = self.game_type.game_type_id
-        gt = GameType.objects.get(game_type_id=gt_id)
-        module = gt.getGameModule()
-        session = module.MyGame()
-        self.__game = session
-        self.game_object_bytes = pickle.dumps(session, HIGHEST_PROTOCOL)
+        # copy pickled initial state, game object is unpickled lazily in getCavokeGame
+        self.__game = None
+        self.game_object_bytes, self.summary = initialGame(self.game_type)
 
     def getCavokeGame(self) -> Game:
         """
@@ -100,10 +196,116 @@ class GameSession(models.Model):
         """
         if self.__game is not None:
             return self.__game
-        game = pickle.loads(self.game_object_bytes)
+        # import game module through LRU, as pickle would import it bypassing it
+        self.game_type.getGameModule()
+        if self.game_object_hash:
+            # unpickle straight from memory-mapped blob
+            with openBlob(self.game_object_hash) as buffer:
+                game = pickle.loads(buffer)
+        else:
+            game = pickle.loads(self.getGameObjectBytes())
         self.__game = game
         return game
 
+    def saveGameState(self, summary: dict = None):
+        """
+        Saves game object changed by a mutating action and bumps state version.
+        Raises StateConflictWarning if the session was changed by another request since it was read
+        :param summary: new summary of game, kept if None
+        """
+        data = pickle.dumps(self.getCavokeGame(), HIGHEST_PROTOCOL)
+        version = self.state_version
+        # the state may have been archived after it was read, the new state replaces the archived one
+        fields = {'state_version': version + 1, 'archive_segment': '', 'archive_offset': 0, 'archive_length': 0}
+        if summary is not None:
+            fields['summary'] = summary
+        # blobs are on default, the session may be on a shard
+        with transaction.atomic(), transaction.atomic(using=self._state.db, savepoint=False):
+            if self.game_object_hash:
+                blob_hash = putBlob(data)
+                updated = GameSession.objects.using(self._state.db).filter(pk=self.pk, state_version=version).update(
+                    game_object_hash=blob_hash, **fields)
+                # release the blob, that is no longer referenced
+                releaseBlob(self.game_object_hash if updated else blob_hash)
+                if updated:
+                    self.game_object_hash = blob_hash
+            else:
+                updated = GameSession.objects.using(self._state.db).filter(pk=self.pk, state_version=version).update(
+                    game_object_bytes=data, **fields)
+                if updated:
+                    self.game_object_bytes = data
+        if not updated:
+            raise StateConflictWarning
+        self.state_version = version + 1
+        self.archive_segment, self.archive_offset, self.archive_length = '', 0, 0
+        if summary is not None:
+            self.summary = summary
+
+    def getGameObjectBytes(self) -> bytes:
+        """
+        Gets pickled game object, restoring session from archive if needed
+        :return: pickled game object
+        """
+        if self.game_object_hash:
+            return readBlob(self.game_object_hash)
+        if self.isArchived():
+            self.restoreFromArchive()
+        return self.game_object_bytes
+
+    def isArchived(self) -> bool:
+        """
+        Checks if game object was moved to archive
+        :return: true if session is a stub
+        """
+        return bool(self.archive_segment)
+
+    def restoreFromArchive(self):
+        """
+        Moves game object from archive back to the database
+        """
+        data = readRecord(self.archive_segment, self.archive_offset, self.archive_length)
+        GameSession.objects.using(self._state.db).filter(pk=self.pk, archive_segment=self.archive_segment).update(
+            game_object_bytes=data, archive_segment='', archive_offset=0, archive_length=0)
+        self.game_object_bytes = data
+        self.archive_segment = ''
+        self.archive_offset = 0
+        self.archive_length = 0
+
+    def touch(self):
+        """
+        Updates lastUsedOn, so session isn't archived while in use
+        """
+        now = timezone.now()
+        if self.lastUsedOn is None or now - self.lastUsedOn >= SESSION_TOUCH_INTERVAL:
+            GameSession.objects.using(self._state.db).filter(pk=self.pk).update(lastUsedOn=now)
+            self.lastUsedOn = now
+
+
+@receiver(post_delete, sender=GameSession)
+def release_game_session_blob(sender, instance, **kwargs):
+    if instance.game_object_hash:
+        releaseBlob(instance.game_object_hash)
+
+
+@receiver(post_delete, sender=GameSession)
+def release_game_session_quota(sender, instance, **kwargs):
+    QuotaCounter.objects.release(QuotaCounter.GAME_SESSIONS, instance.player_uid)
+
+
+class GameBlob(models.Model):
+    """
+    Reference counter for game object in blob store
+    """
+    # sha256 of content
+    blob_hash = models.CharField(max_length=64, unique=True)
+    # size of content in bytes
+    size = models.IntegerField(default=0)
+    # number of game sessions using this blob
+    refcount = models.IntegerField(default=0)
+
+    def __str__(self):
+        return self.blob_hash
+
 
 class Profile(models.Model):
     """
@@ -112,10 +314,7 @@ class Profile(models.Model):
     # main Django user model
     user = models.OneToOneField(User, on_delete=models.CASCADE)
 
-    # TODO remove this "Костыль"-like code
-    # games authored integer
-    gamesMadeCount = models.IntegerField(default=0)
-    # maximum amount of games allowed to be made
+    # maximum amount of games allowed to be made, games made are counted by QuotaCounter.SUBMISSIONS
     gamesMadeMaxCount = models.IntegerField(default=MAX_AUTHORED_GAMES)
 
     # first api request timestamp
@@ -178,7 +377,7 @@ class GameType(models.Model):
     # description for game type
     description = models.CharField(max_length=1000, default='No description')
 
-    # times the game was played TODO implement
+    # times the game was played, counted in batches by popularity.py
     timesPlayed = models.IntegerField(default=0)
     # timestamp of creation time
     createdOn = models.DateTimeField(auto_now_add=True)
@@ -186,16 +385,15 @@ class GameType(models.Model):
     # module binary FIXME REMOVE THIS
     type_module_bytes = models.BinaryField()
 
+    # commit of game type's repository, that workers should run (see revisions.py)
+    revision = models.CharField(max_length=40, blank=True, default='')
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.__game_module = None
 
     def save(self, *args, **kwargs):
         if not self.createdOn:
-            # check if game type count exceeds desired maximum
-            if GameType.objects.filter(creator=self.creator).count() > MAX_AUTHORED_GAMES:
-                raise TooManyGameTypesWarning
-
             # called on create
             self.createdOn = timezone.now()
 
@@ -211,6 +409,12 @@ class GameType(models.Model):
                 raise UrlInvalidError
             # try cloning
             self.getGameModule()
+
+            # slot in creator's quota is taken in the same transaction as the insert
+            with transaction.atomic():
+                if not QuotaCounter.objects.acquire(QuotaCounter.GAME_TYPES, self.creator, MAX_AUTHORED_GAMES):
+                    raise TooManyGameTypesWarning
+                return super(GameType, self).save(*args, **kwargs)
         return super(GameType, self).save(*args, **kwargs)
 
     def getGameModule(self):
@@ -222,17 +426,157 @@ class GameType(models.Model):
             return self.__game_module
         gt_id = self.game_type_id
         # clone
-        if not os.path.exists(GAME_TYPES_FOLDER):
-            try:
-                logger.info("Cloning {" + gt_id + "}...")
-                git('clone', self.git_url, GAME_TYPES_FOLDER + gt_id)
-            except Exception as e:
-                logger.error("Cloning of {" + gt_id + "} failed! Details: {" + str(e) + "}")
-                raise RuntimeError(str(e))
-            else:
-                logger.info("Cloning of {" + gt_id + "} is complete!")
+        self.cloneRepository()
         # TODO make it work with src/setup.py stuff
         # save
-        module = import_module('cavoke_app.game_modules.' + gt_id)
+        module = game_module_cache.get(gt_id, self.revision or None)
         self.__game_module = module
         return module
+
+    def cloneRepository(self):
+        """
+        Clones game type's git repository, if it wasn't cloned yet
+        """
+        gt_id = self.game_type_id
+        if os.path.exists(GAME_TYPES_FOLDER + gt_id):
+            if not self.revision:
+                self.revision = currentRevision(gt_id)
+            return
+        try:
+            logger.info("Cloning {%s}...", gt_id)
+            self.revision = cloneGameType(gt_id, self.git_url, self.revision or None)
+        except Exception as e:
+            logger.error("Cloning of {%s} failed! Details: {%s}", gt_id, e)
+            raise RuntimeError(str(e))
+        else:
+            logger.info("Cloning of {%s} is complete!", gt_id)
+
+
+@receiver(post_save, sender=GameType)
+@receiver(post_delete, sender=GameType)
+def invalidate_game_type_prototype(sender, instance, **kwargs):
+    invalidatePrototype(instance.game_type_id)
+
+
+@receiver(pre_delete, sender=GameType)
+def delete_sharded_game_sessions(sender, instance, **kwargs):
+    # sessions on default are deleted by cascade
+    for alias, sessions in GameSession.objects.onShards():
+        if alias != PRIMARY_DB:
+            sessions.filter(game_type_id=instance.pk).delete()
+
+
+@receiver(post_delete, sender=GameType)
+def release_game_type_quota(sender, instance, **kwargs):
+    QuotaCounter.objects.release(QuotaCounter.GAME_TYPES, instance.creator)
+    QuotaCounter.objects.release(QuotaCounter.SUBMISSIONS, instance.creator)
+
+
+class GameTypePlays(models.Model):
+    """
+    Number of game sessions of game type started during an hour, used for popular games windows
+    """
+    game_type = models.ForeignKey(
+        'GameType',
+        on_delete=models.CASCADE
+    )
+    # start of the hour
+    hour = models.DateTimeField()
+    # sessions started
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('game_type', 'hour')
+
+
+class QuotaCounterManager(models.Manager):
+    """
+    Ledger operations, each is a single UPDATE, so concurrent requests can't go over the limits
+    """
+
+    def acquire(self, kind: str, owner: str, limit: int, amount: int = 1) -> bool:
+        """
+        Takes amount from owner's quota, unless it would exceed limit
+        :param kind: kind of quota
+        :param owner: uid of owner
+        :param limit: maximum of used quota
+        :param amount: amount to take
+        :return: true if taken
+        """
+        if amount > limit:
+            return False
+        counter = self.filter(kind=kind, owner=owner)
+        if counter.filter(used__lte=limit - amount).update(used=F('used') + amount):
+            return True
+        if counter.exists():
+            return False
+        # first use of quota
+        try:
+            with transaction.atomic():
+                self.create(kind=kind, owner=owner, used=amount)
+            return True
+        except IntegrityError:
+            # created by concurrent request
+            return bool(counter.filter(used__lte=limit - amount).update(used=F('used') + amount))
+
+    def add(self, kind: str, owner: str, amount: int):
+        """
+        Adds amount to owner's quota regardless of limit, e.g. for imported rows
+        :param kind: kind of quota
+        :param owner: uid of owner
+        :param amount: amount to add
+        """
+        counter = self.filter(kind=kind, owner=owner)
+        if counter.update(used=F('used') + amount):
+            return
+        try:
+            with transaction.atomic():
+                self.create(kind=kind, owner=owner, used=amount)
+        except IntegrityError:
+            counter.update(used=F('used') + amount)
+
+    def release(self, kind: str, owner: str, amount: int = 1):
+        """
+        Returns amount to owner's quota
+        :param kind: kind of quota
+        :param owner: uid of owner
+        :param amount: amount to return
+        """
+        self.filter(kind=kind, owner=owner).update(used=Greatest(F('used') - amount, 0))
+
+    def used(self, kind: str, owner: str) -> int:
+        """
+        Gets used quota of owner
+        :param kind: kind of quota
+        :param owner: uid of owner
+        :return: used amount
+        """
+        return self.filter(kind=kind, owner=owner).values_list('used', flat=True).first() or 0
+
+
+class QuotaCounter(models.Model):
+    """
+    Used quota of user, kept in sync with rows it counts by atomic updates and reconciled by reconcilequotas
+    """
+    # game sessions of player
+    GAME_SESSIONS = 'game_sessions'
+    # game types created by author
+    GAME_TYPES = 'game_types'
+    # game types submitted by author, pending or approved
+    SUBMISSIONS = 'submissions'
+    KINDS = (GAME_SESSIONS, GAME_TYPES, SUBMISSIONS)
+
+    # kind of quota
+    kind = models.CharField(max_length=20)
+    # uid of owner
+    owner = models.CharField(max_length=191)
+    # used amount
+    used = models.IntegerField(default=0)
+
+    objects = QuotaCounterManager()
+
+    class Meta:
+        unique_together = ('kind', 'owner')
+
+    def __str__(self):
+        return self.kind + ':' + self.owner
@@ -0,0 +1,151 @@
+"""
+Bulk moderation of pending games.
+
+All pending games are read from Firestore in one batched read, approved games are cloned in parallel,
+and Firestore and database changes are committed in batches.
+"""
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import transaction, close_old_connections
+
+from cavoke_server import db
+from .authors import moderatedGameWrites, commitWrites
+from .bundles import buildBundle
+from .config import BULK_MODERATION_WORKERS
+from .errormessages import *
+from .exceptions import TooManyGameTypesWarning
+from .models import QuotaCounter
+from .serializers import GameTypeSerializer
+
+logger = logging.getLogger(__name__)
+
+APPROVE = 'approve'
+DECLINE = 'decline'
+
+
+def _result(game_type_id: str, decision: str, message: str = None) -> dict:
+    """
+    Makes result of single decision
+    :param game_type_id: id of game type
+    :param decision: approve or decline
+    :param message: error message, None if decision was applied
+    :return: result dict
+    """
+    if message is None:
+        return {"game_type_id": game_type_id, "decision": decision, "status": "OK"}
+    return {"game_type_id": game_type_id, "decision": decision, "status": "Error", "message": message}
+
+
+def _cloneAndBundle(game_type):
+    """
+    Clones, precompiles and imports game type. Runs in worker thread
+    :param game_type: unsaved GameType
+    """
+    try:
+        game_type.cloneRepository()
+        buildBundle(game_type.game_type_id)
+        # imported here, so saving it doesn't run game code inside the transaction
+        game_type.getGameModule()
+    finally:
+        close_old_connections()
+
+
+def moderate(decisions: list) -> list:
+    """
+    Applies many moderation decisions
+    :param decisions: list of dicts with game_type_id, token and decision ('approve' or 'decline')
+    :return: list of per-decision results in the same order
+    """
+    results = [None] * len(decisions)
+    valid = {}
+    for i, item in enumerate(decisions):
+        try:
+            game_type_id = str(item['game_type_id'])
+            modtoken = str(item['token'])
+            decision = str(item['decision'])
+        except (KeyError, TypeError):
+            results[i] = _result(None, None, NOT_ENOUGH_PARAMS)
+            continue
+        if decision not in (APPROVE, DECLINE):
+            results[i] = _result(game_type_id, decision, WRONG_DECISION)
+        elif game_type_id in valid:
+            results[i] = _result(game_type_id, decision, DUPLICATE_DECISION)
+        else:
+            valid[game_type_id] = (i, modtoken, decision)
+
+    # check all games and tokens with one batched read
+    refs = [db.collection('pending_games').document(game_type_id) for game_type_id in valid]
+    docs = {doc.id: doc for doc in db.get_all(refs)} if refs else {}
+    approved, declined = {}, {}
+    for game_type_id, (i, modtoken, decision) in valid.items():
+        doc = docs.get(game_type_id)
+        if doc is None or not doc.exists:
+            results[i] = _result(game_type_id, decision, GAME_NOT_FOUND)
+            continue
+        gdict = doc.to_dict()
+        if gdict['modtoken'] != modtoken:
+            results[i] = _result(game_type_id, decision, WRONG_TOKEN)
+            continue
+        (approved if decision == APPROVE else declined)[game_type_id] = gdict
+
+    # clone and import approved games in parallel
+    game_types = {}
+    for game_type_id, gdict in approved.items():
+        serializer = GameTypeSerializer(data=gdict)
+        if serializer.is_valid():
+            game_types[game_type_id] = serializer.createInstance()
+        else:
+            results[valid[game_type_id][0]] = _result(game_type_id, APPROVE, ERROR_OCCURRED)
+    with ThreadPoolExecutor(max_workers=BULK_MODERATION_WORKERS) as executor:
+        futures = {game_type_id: executor.submit(_cloneAndBundle, game_type)
+                   for game_type_id, game_type in game_types.items()}
+    for game_type_id, future in futures.items():
+        if future.exception() is not None:
+            logger.error("Bulk approval of {%s} failed! Details: {%s}", game_type_id, future.exception())
+            results[valid[game_type_id][0]] = _result(game_type_id, APPROVE, ERROR_OCCURRED)
+            game_types.pop(game_type_id)
+
+    # commit database changes, only inserts and quota updates run inside the transaction
+    with transaction.atomic():
+        for game_type_id, game_type in game_types.items():
+            try:
+                with transaction.atomic():
+                    game_type.save()
+            except TooManyGameTypesWarning:
+                results[valid[game_type_id][0]] = _result(game_type_id, APPROVE, AUTHOR_MAX_GAMES)
+            except Exception as e:
+                logger.error("Bulk approval of {%s} failed! Details: {%s}", game_type_id, e)
+                results[valid[game_type_id][0]] = _result(game_type_id, APPROVE, ERROR_OCCURRED)
+            else:
+                results[valid[game_type_id][0]] = _result(game_type_id, APPROVE)
+        # free up slots of declined games
+        declinedPerUser = defaultdict(int)
+        for gdict in declined.values():
+            declinedPerUser[gdict['creator']] += 1
+        for uid, count in declinedPerUser.items():
+            QuotaCounter.objects.release(QuotaCounter.SUBMISSIONS, uid, count)
+        for game_type_id in declined:
+            results[valid[game_type_id][0]] = _result(game_type_id, DECLINE)
+
+    # commit firestore changes
+    done = {game_type_id: gdict for game_type_id, gdict in approved.items()
+            if results[valid[game_type_id][0]]['status'] == 'OK'}
+    done.update(declined)
+    _commitFirestore(done, approved)
+    return results
+
+
+def _commitFirestore(done: dict, approved: dict):
+    """
+    Removes moderated games from pending and adds approved games to authored in batches
+    :param done: dict of game_type_id to pending game dict for applied decisions
+    :param approved: dict of game_type_id to pending game dict for approvals
+    """
+    writes = []
+    for game_type_id, gdict in done.items():
+        gdict = dict(gdict)
+        gdict.pop('modtoken')
+        writes.extend(moderatedGameWrites(game_type_id, gdict, game_type_id in approved))
+    commitWrites(writes)
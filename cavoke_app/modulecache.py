@@ -0,0 +1,149 @@
+"""
+Memory-bounded registry of imported game modules.
+
+Every game module imported by a worker stays in sys.modules forever, so resident memory grows with the catalog.
+GameModuleCache keeps imported game modules in LRU order and evicts the coldest ones (with their submodules)
+from sys.modules when MAX_LOADED_GAME_MODULES or MAX_GAME_MODULES_MEMORY is exceeded.
+Evicted modules are imported again on demand, as are modules whose game type was updated to another revision.
+"""
+import gc
+import logging
+import os
+import sys
+from collections import OrderedDict
+from threading import RLock
+
+from .bundles import loadGameModule, GAME_MODULES_PACKAGE
+from .config import MAX_LOADED_GAME_MODULES, MAX_GAME_MODULES_MEMORY
+from .prototypes import invalidatePrototype
+from .revisions import currentRevision
+
+logger = logging.getLogger(__name__)
+
+
+def currentRSS() -> int:
+    """
+    Gets resident set size of current process
+    :return: bytes, 0 if unknown
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class GameModuleCache:
+    """
+    LRU of imported game modules with count and memory budget
+    """
+
+    def __init__(self, max_count: int = MAX_LOADED_GAME_MODULES, max_memory: int = MAX_GAME_MODULES_MEMORY):
+        self.max_count = max_count
+        self.max_memory = max_memory
+        # game_type_id -> (module, estimated memory, revision)
+        self.__modules = OrderedDict()
+        self.__lock = RLock()
+        self.__evictions = 0
+        self.__reloads = 0
+        self.__rss_saved = 0
+
+    def get(self, game_type_id: str, revision: str = None):
+        """
+        Gets game module, importing it if needed
+        :param game_type_id: id of game type
+        :param revision: expected revision of game type, module of another revision is reloaded. None to skip check
+        :return: module
+        """
+        name = GAME_MODULES_PACKAGE + '.' + game_type_id
+        with self.__lock:
+            entry = self.__modules.get(game_type_id)
+            if entry is not None and sys.modules.get(name) is entry[0]:
+                if revision is None or entry[2] == revision:
+                    self.__modules.move_to_end(game_type_id)
+                    return entry[0]
+                # game type was updated, old module stays alive only while in use
+                logger.info("Reloading game module {%s} at revision {%s}", game_type_id, revision)
+                self.__unload(game_type_id)
+                self.__reloads += 1
+
+            loaded_before = currentRSS()
+            loaded_revision = currentRevision(game_type_id)
+            module = loadGameModule(game_type_id)
+            self.__modules[game_type_id] = (module, max(currentRSS() - loaded_before, 0), loaded_revision)
+            self.__modules.move_to_end(game_type_id)
+            before = currentRSS()
+            evicted = self.__enforceBudget()
+        if evicted:
+            self.__collect(before)
+        return module
+
+    def evict(self, game_type_id: str) -> int:
+        """
+        Removes game module and its submodules from sys.modules
+        :param game_type_id: id of game type
+        :return: RSS saved in bytes (may be 0, as allocator doesn't always return memory)
+        """
+        before = currentRSS()
+        with self.__lock:
+            self.__evict(game_type_id)
+        return self.__collect(before)
+
+    def stats(self) -> dict:
+        """
+        Gets cache statistics
+        :return: dict with loaded modules, their estimated memory, evictions and RSS saved by them
+        """
+        with self.__lock:
+            return {
+                'loaded': len(self.__modules),
+                'estimated_memory': sum(e[1] for e in self.__modules.values()),
+                'evictions': self.__evictions,
+                'reloads': self.__reloads,
+                'rss_saved': self.__rss_saved,
+            }
+
+    def __unload(self, game_type_id: str):
+        name = GAME_MODULES_PACKAGE + '.' + game_type_id
+        self.__modules.pop(game_type_id, None)
+        invalidatePrototype(game_type_id)
+        for module_name in [m for m in sys.modules if m == name or m.startswith(name + '.')]:
+            del sys.modules[module_name]
+        # importing a submodule binds it on its package too, which would keep it alive
+        package = sys.modules.get(GAME_MODULES_PACKAGE)
+        if package is not None and hasattr(package, game_type_id):
+            delattr(package, game_type_id)
+
+    def __evict(self, game_type_id: str):
+        self.__unload(game_type_id)
+        self.__evictions += 1
+        logger.info("Evicted game module {%s}", game_type_id)
+
+    def __collect(self, before: int) -> int:
+        # full collection is slow, so it runs once after evicting and never while lookups wait for the lock
+        gc.collect()
+        saved = max(before - currentRSS(), 0)
+        with self.__lock:
+            self.__rss_saved += saved
+        return saved
+
+    def __enforceBudget(self) -> int:
+        evicted = 0
+        # the most recently used module is never evicted
+        while len(self.__modules) > 1 and self.__overBudget():
+            self.__evict(next(iter(self.__modules)))
+            evicted += 1
+        return evicted
+
+    def __overBudget(self) -> bool:
+        if self.max_count is not None and len(self.__modules) > self.max_count:
+            return True
+        if self.max_memory is not None and sum(e[1] for e in self.__modules.values()) > self.max_memory:
+            return True
+        return False
+
+
+"""
+Process-wide registry of game modules
+"""
+game_module_cache = GameModuleCache()
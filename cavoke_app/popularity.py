@@ -0,0 +1,190 @@
+"""
+Incrementally maintained popular games.
+
+Each worker counts started game sessions in memory and a background thread periodically checkpoints them
+to the database (GameType.timesPlayed and hourly GameTypePlays), then reloads window totals, that include
+other workers' plays, so recording plays never waits for the database.
+Top K game types are selected with a heap and cached until counters change.
+"""
+import atexit
+import heapq
+import logging
+import time
+from collections import Counter
+from threading import Lock, RLock, Thread
+
+from django.db import transaction, close_old_connections
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .config import POPULARITY_CHECKPOINT_INTERVAL
+from .models import GameType, GameTypePlays
+
+logger = logging.getLogger(__name__)
+
+WINDOW_DAY = 'day'
+WINDOW_WEEK = 'week'
+WINDOW_ALL = 'all'
+
+"""
+Length of sliding windows
+"""
+WINDOWS = {
+    WINDOW_DAY: timezone.timedelta(days=1),
+    WINDOW_WEEK: timezone.timedelta(weeks=1),
+    WINDOW_ALL: None,
+}
+
+
+def _hour(moment) -> timezone.datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+class PopularityTracker:
+    """
+    Play counters of game types over sliding windows
+    """
+
+    def __init__(self, checkpoint_interval: float = POPULARITY_CHECKPOINT_INTERVAL, background: bool = True):
+        self.checkpoint_interval = checkpoint_interval
+        # checkpoint periodically in a background thread, otherwise only when checkpoint() is called
+        self.background = background
+        self.__lock = RLock()
+        # serializes checkpoints, which don't hold __lock while they query the database
+        self.__checkpointLock = Lock()
+        # (game type pk, hour) -> plays not yet written to the database
+        self.__pending = Counter()
+        # window -> game type pk -> plays
+        self.__counts = None
+        # window -> cached top list
+        self.__top = {}
+        self.__checkpointer = None
+
+    def record(self, game_type: GameType):
+        """
+        Counts new game session of game type. Doesn't query the database and never raises
+        :param game_type: GameType
+        """
+        try:
+            with self.__lock:
+                self.__pending[(game_type.pk, _hour(timezone.now()))] += 1
+                if self.__counts is not None:
+                    for counts in self.__counts.values():
+                        counts[game_type.pk] += 1
+                    self.__top.clear()
+            self.__startCheckpointer()
+        except Exception as e:
+            # the game session is started already, it just isn't counted
+            logger.error("Counting play of game type %s failed. Details: {%s}", game_type.pk, e)
+
+    def top(self, window: str, k: int) -> list:
+        """
+        Gets the most played game types
+        :param window: day, week or all
+        :param k: number of game types
+        :return: list of (game type pk, plays), the most played first, empty if totals couldn't be loaded
+        """
+        self.__startCheckpointer()
+        if self.__counts is None:
+            # only the first request of a worker waits for totals
+            self.checkpoint()
+        with self.__lock:
+            if self.__counts is None:
+                return []
+            cached = self.__top.get(window)
+            if cached is None or len(cached) < k:
+                cached = heapq.nlargest(k, self.__counts[window].items(), key=lambda item: (item[1], item[0]))
+                self.__top[window] = cached
+            return cached[:k]
+
+    def checkpoint(self):
+        """
+        Writes pending plays to the database and reloads window totals.
+        Errors are logged, plays that failed to be written are kept for the next checkpoint
+        """
+        with self.__checkpointLock:
+            with self.__lock:
+                pending, self.__pending = self.__pending, Counter()
+            try:
+                self.__flush(pending)
+            except Exception as e:
+                with self.__lock:
+                    self.__pending.update(pending)
+                logger.error("Popularity checkpoint failed. Details: {%s}", e)
+                if self.__counts is not None:
+                    return
+            try:
+                counts = self.__load()
+            except Exception as e:
+                logger.error("Loading popularity totals failed. Details: {%s}", e)
+                return
+            with self.__lock:
+                # plays, that aren't written yet, are still counted locally
+                for (pk, hour), count in self.__pending.items():
+                    for window, length in WINDOWS.items():
+                        if length is None or hour >= _hour(timezone.now() - length):
+                            counts[window][pk] += count
+                self.__counts = counts
+                self.__top.clear()
+
+    def __startCheckpointer(self):
+        """
+        Starts background checkpoints, once per process
+        """
+        if not self.background or (self.__checkpointer is not None and self.__checkpointer.is_alive()):
+            return
+        with self.__lock:
+            # threads don't survive fork, so every worker starts its own
+            if self.__checkpointer is None or not self.__checkpointer.is_alive():
+                self.__checkpointer = Thread(target=self.__runCheckpoints, name='popularity-checkpoint', daemon=True)
+                self.__checkpointer.start()
+
+    def __runCheckpoints(self):
+        while True:
+            time.sleep(self.checkpoint_interval)
+            try:
+                self.checkpoint()
+            finally:
+                close_old_connections()
+
+    @staticmethod
+    def __flush(pending: Counter):
+        totals = Counter()
+        with transaction.atomic():
+            for (pk, hour), count in pending.items():
+                plays, _ = GameTypePlays.objects.get_or_create(game_type_id=pk, hour=hour)
+                GameTypePlays.objects.filter(pk=plays.pk).update(count=F('count') + count)
+                totals[pk] += count
+            for pk, count in totals.items():
+                GameType.objects.filter(pk=pk).update(timesPlayed=F('timesPlayed') + count)
+            # hourly counters older than the longest window aren't needed anymore
+            GameTypePlays.objects.filter(hour__lt=_hour(timezone.now() - WINDOWS[WINDOW_WEEK])).delete()
+
+    @staticmethod
+    def __load() -> dict:
+        counts = {WINDOW_ALL: Counter(dict(GameType.objects.values_list('pk', 'timesPlayed')))}
+        for window, length in WINDOWS.items():
+            if length is None:
+                continue
+            rows = GameTypePlays.objects.filter(hour__gte=_hour(timezone.now() - length)) \
+                .values('game_type').annotate(plays=Sum('count')).values_list('game_type', 'plays')
+            counts[window] = Counter(dict(rows))
+        return counts
+
+    def flushOnExit(self):
+        """
+        Writes pending plays before worker exits
+        """
+        with self.__lock:
+            if self.__pending:
+                try:
+                    self.__flush(self.__pending)
+                except Exception as e:
+                    logger.error("Popularity flush on exit failed. Details: {%s}", e)
+
+
+"""
+Process-wide popularity tracker
+"""
+popularity_tracker = PopularityTracker()
+atexit.register(popularity_tracker.flushOnExit)
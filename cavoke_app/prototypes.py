@@ -0,0 +1,52 @@
+import pickle
+import sys
+from pickle import HIGHEST_PROTOCOL
+from threading import Lock
+from typing import Dict, Tuple
+
+from .admission import game_admission
+from .config import run_with_limited_time
+from .summaries import gameSummary
+
+"""
+prototype_dict dictionary for storing pickled initial states of game types.
+Maps game_type_id to (game module, pickled MyGame(), summary of MyGame())
+"""
+prototype_dict: Dict[str, Tuple[object, bytes, dict]] = {}
+prototype_lock = Lock()
+
+
+def initialGame(game_type) -> Tuple[bytes, dict]:
+    """
+    Gets pickled initial state of game type with its summary.
+    Games with deterministic initial state can opt in by setting `CACHE_INITIAL_STATE = True` in their module,
+    then `MyGame()` is constructed only once per module
+    :param game_type: GameType
+    :return: (pickled MyGame(), summary of MyGame()),
+    raises OverloadedWarning if there is no free slot for game code and TimeoutError if MyGame() is too slow
+    """
+    gt_id = game_type.game_type_id
+    cached = prototype_dict.get(gt_id)
+    # prototype is valid as long as the module it was made with is the one imported
+    if cached is not None and sys.modules.get(cached[0].__name__) is cached[0]:
+        return cached[1], cached[2]
+
+    module = game_type.getGameModule()
+    # MyGame() is game code, so it gets a slot and a time limit like other game calls
+    with game_admission.admit(gt_id):
+        game = run_with_limited_time(module.MyGame, ())
+        state, summary = pickle.dumps(game, HIGHEST_PROTOCOL), gameSummary(game)
+    if not getattr(module, 'CACHE_INITIAL_STATE', False):
+        return state, summary
+    with prototype_lock:
+        prototype_dict[gt_id] = (module, state, summary)
+    return state, summary
+
+
+def invalidatePrototype(game_type_id: str):
+    """
+    Drops cached initial state of game type
+    :param game_type_id: id of game type
+    """
+    with prototype_lock:
+        prototype_dict.pop(game_type_id, None)
@@ -0,0 +1,94 @@
+"""
+Reconciliation of the quota ledger.
+
+Quotas are checked and taken with single conditional UPDATEs of QuotaCounter (see QuotaCounterManager),
+so creates don't count rows. Counters can still drift, e.g. after rows were deleted with raw SQL or a pending game
+was lost in Firestore, so reconcileQuotas compares them with real row counts and fixes the ones that differ.
+Every mismatch is recounted for its owner with the counter row locked, so creates running meanwhile,
+that take the slot in the same transaction as the insert, aren't counted twice or lost.
+"""
+import logging
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count
+
+from cavoke_server import db
+from .models import GameSession, GameType, QuotaCounter
+
+logger = logging.getLogger(__name__)
+
+
+def _pendingGames(owner: str = None) -> Counter:
+    """
+    Counts pending games in Firestore
+    :param owner: uid of author to count games of, all authors if None
+    :return: Counter of author uid to pending games
+    """
+    pending = db.collection('pending_games')
+    if owner is not None:
+        pending = pending.where('creator', '==', owner)
+    return Counter(doc.get('creator') for doc in pending.select(['creator']).stream())
+
+
+def realCounts(kind: str) -> Counter:
+    """
+    Counts rows, that quota of kind is used by
+    :param kind: kind of quota
+    :return: Counter of owner uid to real count
+    """
+    if kind == QuotaCounter.GAME_SESSIONS:
+        counts = Counter()
+        for _, sessions in GameSession.objects.onShards():
+            counts.update(dict(sessions.values_list('player_uid').annotate(used=Count('pk')).order_by()))
+        return counts
+    counts = Counter(dict(GameType.objects.values_list('creator').annotate(used=Count('pk')).order_by()))
+    if kind == QuotaCounter.SUBMISSIONS:
+        counts.update(_pendingGames())
+    return counts
+
+
+def recount(kind: str, owner: str) -> int:
+    """
+    Counts rows, that quota of kind is used by, for one owner
+    :param kind: kind of quota
+    :param owner: uid of owner
+    :return: real count
+    """
+    if kind == QuotaCounter.GAME_SESSIONS:
+        return sum(sessions.filter(player_uid=owner).count()
+                   for _, sessions in GameSession.objects.onShards())
+    count = GameType.objects.filter(creator=owner).count()
+    if kind == QuotaCounter.SUBMISSIONS:
+        count += _pendingGames(owner)[owner]
+    return count
+
+
+def reconcileQuotas(kind: str) -> int:
+    """
+    Sets counters of kind, that differ from real counts, to real counts
+    :param kind: kind of quota
+    :return: number of fixed counters
+    """
+    counts = realCounts(kind)
+    counters = dict(QuotaCounter.objects.filter(kind=kind).values_list('owner', 'used'))
+    fixed = 0
+    for owner in set(counts) | set(counters):
+        if counts[owner] == counters.get(owner, 0):
+            continue
+        with transaction.atomic():
+            # waits for creates, that took the slot, but didn't commit yet
+            counter = QuotaCounter.objects.select_for_update().filter(kind=kind, owner=owner).first()
+            used = recount(kind, owner)
+            if counter is None:
+                if not used:
+                    continue
+                QuotaCounter.objects.add(kind, owner, used)
+            elif counter.used != used:
+                QuotaCounter.objects.filter(pk=counter.pk).update(used=used)
+            else:
+                continue
+        logger.warning("Quota {%s} of {%s} was %s, real count is %s", kind, owner,
+                       counter.used if counter else 0, used)
+        fixed += 1
+    return fixed
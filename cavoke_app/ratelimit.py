@@ -0,0 +1,114 @@
+"""
+Per-user token-bucket rate limiting, shared by all worker processes.
+
+Buckets live in a small SQLite file (RATE_LIMIT_STORE), so every Apache process sees the same limits.
+Each endpoint has its own (rate, burst) in RATE_LIMITS. Calls over the limit get 429 with Retry-After.
+"""
+import logging
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from rest_framework.status import HTTP_429_TOO_MANY_REQUESTS
+
+from .config import RATE_LIMITS, RATE_LIMIT_STORE, error_response
+from .errormessages import TOO_MANY_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+"""
+Buckets not used for this long (in seconds) are deleted
+"""
+BUCKET_TTL = 24 * 60 * 60
+
+_local = threading.local()
+
+
+def _connection() -> sqlite3.Connection:
+    """
+    Gets this thread's connection to the shared store, creating store if needed
+    :return: connection
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        folder = os.path.dirname(RATE_LIMIT_STORE)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        conn = sqlite3.connect(RATE_LIMIT_STORE, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS throttled (endpoint TEXT PRIMARY KEY, count INTEGER)')
+        _local.conn = conn
+    return conn
+
+
+def take(endpoint: str, uid: str) -> float:
+    """
+    Takes token from user's bucket for endpoint
+    :param endpoint: endpoint name as in RATE_LIMITS
+    :param uid: user's uid
+    :return: 0 if call is allowed, else seconds to wait before retrying
+    """
+    rate, burst = RATE_LIMITS[endpoint]
+    key = endpoint + ':' + uid
+    conn = _connection()
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+        tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            wait = (1 - tokens) / rate
+            conn.execute('INSERT OR IGNORE INTO throttled VALUES (?, 0)', (endpoint,))
+            conn.execute('UPDATE throttled SET count = count + 1 WHERE endpoint = ?', (endpoint,))
+        conn.execute('INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)', (key, tokens, now))
+        if random.random() < 0.001:
+            conn.execute('DELETE FROM buckets WHERE updated < ?', (now - BUCKET_TTL,))
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    return wait
+
+
+def throttledCounts() -> dict:
+    """
+    Gets number of throttled calls per endpoint
+    :return: dict of endpoint to count
+    """
+    return dict(_connection().execute('SELECT endpoint, count FROM throttled').fetchall())
+
+
+def rate_limited(endpoint: str):
+    """
+    Decorator for views, that limits calls per user with RATE_LIMITS[endpoint]
+    :param endpoint: endpoint name
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            auth = request.auth
+            uid = auth.get('uid') if isinstance(auth, dict) else None
+            if uid is None or endpoint not in RATE_LIMITS:
+                return view(request, *args, **kwargs)
+            try:
+                wait = take(endpoint, uid)
+            except sqlite3.Error as e:
+                # never let limiter failures take the endpoint down
+                logger.error("Rate limit store error: %s", e)
+                wait = 0
+            if wait > 0:
+                response = error_response(TOO_MANY_REQUESTS, HTTP_429_TOO_MANY_REQUESTS)
+                response['Retry-After'] = str(math.ceil(wait))
+                return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,91 @@
+"""
+Moving game sessions to the shards of their buckets (see cavoke_server.sharding).
+
+While SESSION_SHARD_MAP_PREVIOUS is set, workers look sessions up on their new shard first. Each session is moved by
+deleting the old row under the state version it was copied at and inserting the copy, with the copy committed first.
+A click, that changed the session meanwhile, makes the delete miss, and the move is retried with the new state;
+clicks, that read the old row before the move, update nothing and get 409 instead of writing to a stale row.
+A duplicate left by a failed commit is shadowed by the copy and removed by the next run.
+"""
+import logging
+
+from django.db import transaction, IntegrityError
+
+from cavoke_server.sharding import sessionBucket, shardOf
+from .config import EXPORT_CHUNK_SIZE
+from .models import GameSession
+
+logger = logging.getLogger(__name__)
+
+# fields, that must be unchanged for the copy to replace the old row
+MOVE_GUARD_FIELDS = ('state_version', 'archive_segment', 'game_object_hash')
+
+
+def moveSession(game_session_id: str, source: str, target: str, attempts: int = 5) -> bool:
+    """
+    Moves game session between databases
+    :param game_session_id: id of game session
+    :param source: database alias, where session is
+    :param target: database alias, where it should be
+    :param attempts: retries of moves, that raced with updates
+    :return: true if moved
+    """
+    for _ in range(attempts):
+        gs = GameSession.objects.using(source).filter(game_session_id=game_session_id).first()
+        if gs is None:
+            return False
+        guard = {field: getattr(gs, field) for field in MOVE_GUARD_FIELDS}
+        try:
+            # the copy is committed first, so a failed commit leaves a duplicate, never a lost session
+            with transaction.atomic(using=source), transaction.atomic(using=target):
+                # raw delete doesn't send post_delete, as blob references and quotas move with the session
+                deleted = GameSession.objects.using(source).filter(
+                    game_session_id=game_session_id, **guard)._raw_delete(source)
+                if not deleted:
+                    raise _Changed
+                # ids are per database, game_session_id stays the same
+                gs.pk = None
+                GameSession.objects.using(target).bulk_create([gs])
+        except _Changed:
+            continue
+        except IntegrityError:
+            # copy from an interrupted run is newer than the old row, as workers look on target first
+            GameSession.objects.using(source).filter(game_session_id=game_session_id)._raw_delete(source)
+            return True
+        return True
+    logger.warning("Moving {%s} from {%s} to {%s} kept racing with updates", game_session_id, source, target)
+    return False
+
+
+class _Changed(Exception):
+    # session was updated while being copied
+    pass
+
+
+def misplacedSessions(alias: str):
+    """
+    Finds sessions on database, that belong to other shards
+    :param alias: database alias
+    :return: generator of (game_session_id, target alias)
+    """
+    sessions = GameSession.objects.using(alias).order_by('pk').values_list('game_session_id', 'player_uid')
+    for game_session_id, player_uid in sessions.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        target = shardOf(sessionBucket(game_session_id, player_uid))
+        if target != alias:
+            yield game_session_id, target
+
+
+def reshardSessions(aliases, dry_run: bool = False) -> dict:
+    """
+    Moves misplaced sessions of databases to their shards
+    :param aliases: database aliases to look at
+    :param dry_run: only count misplaced sessions
+    :return: dict of (source, target) to moved sessions
+    """
+    moved = {}
+    for alias in aliases:
+        # ids are collected first, so moves don't disturb the scan
+        for game_session_id, target in list(misplacedSessions(alias)):
+            if dry_run or moveSession(game_session_id, alias, target):
+                moved[(alias, target)] = moved.get((alias, target), 0) + 1
+    return moved
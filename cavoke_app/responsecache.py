@@ -0,0 +1,112 @@
+"""
+Per-process cache of rendered game responses.
+
+getResponse of game code depends only on the game state, so its output is cached per game session
+together with the state version (bumped by every mutating action) and the game type revision.
+Polls of unchanged sessions get the cached payload without unpickling the game or running game code.
+Concurrent misses for the same version are collapsed: one request computes, the others wait for its result.
+"""
+import threading
+from collections import OrderedDict
+
+from .config import RESPONSE_CACHE_SIZE
+
+
+class _Flight:
+    """
+    Computation in progress, that other requests wait for
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ResponseCache:
+    """
+    LRU of game session id to (version, rendered response) with single-flight computation
+    """
+
+    def __init__(self, size: int = RESPONSE_CACHE_SIZE):
+        self.size = size
+        self.__entries = OrderedDict()
+        self.__flights = {}
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+        self.__collapsed = 0
+
+    def get(self, game_session_id: str, version, compute):
+        """
+        Gets rendered response of game session, computing it once per version.
+        Returned responses are shared and must not be mutated
+        :param game_session_id: id of game session
+        :param version: hashable version of game state, e.g. (state_version, revision)
+        :param compute: function rendering response
+        :return: response
+        """
+        key = (game_session_id, version)
+        with self.__lock:
+            entry = self.__entries.get(game_session_id)
+            if entry is not None and entry[0] == version:
+                self.__entries.move_to_end(game_session_id)
+                self.__hits += 1
+                return entry[1]
+            flight = self.__flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.__flights[key] = _Flight()
+                self.__misses += 1
+            else:
+                self.__collapsed += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = compute()
+        except BaseException as e:
+            flight.error = e
+            raise
+        else:
+            with self.__lock:
+                self.__entries[game_session_id] = (version, flight.result)
+                self.__entries.move_to_end(game_session_id)
+                while len(self.__entries) > self.size:
+                    self.__entries.popitem(last=False)
+            return flight.result
+        finally:
+            with self.__lock:
+                self.__flights.pop(key, None)
+            flight.done.set()
+
+    def invalidate(self, game_session_id: str):
+        """
+        Drops cached response of game session
+        :param game_session_id: id of game session
+        """
+        with self.__lock:
+            self.__entries.pop(game_session_id, None)
+
+    def stats(self) -> dict:
+        """
+        Gets cache statistics
+        :return: dict with cached responses, hits, misses and collapsed concurrent misses
+        """
+        with self.__lock:
+            return {
+                'cached': len(self.__entries),
+                'hits': self.__hits,
+                'misses': self.__misses,
+                'collapsed': self.__collapsed,
+            }
+
+
+"""
+Process-wide cache of rendered game responses
+"""
+response_cache = ResponseCache()
@@ -0,0 +1,220 @@
+"""
+Revisions of game types' code and their updates.
+
+Every game type has a mirror of its git repository in GAME_REPOS_FOLDER. Each revision is extracted into its own
+directory (GAME_TYPES_FOLDER/.revisions/<game_type_id>/<commit>), and the checkout GAME_TYPES_FOLDER/<game_type_id>,
+that game modules are imported from, is a symlink to the current one.
+Update fetches only new commits into the mirror, extracts and bundles the new revision next to the old one
+and swaps the symlink and the bundle with os.replace, so imports never see a half-written tree.
+Workers compare GameType.revision with the revision of their imported module and reload it lazily.
+"""
+import fcntl
+import logging
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+from contextlib import contextmanager
+
+from .bundles import buildBundle
+from .config import GAME_TYPES_FOLDER, GAME_REPOS_FOLDER, KEEP_GAME_REVISIONS, randomUUID
+
+logger = logging.getLogger(__name__)
+
+REVISIONS_FOLDER = '.revisions'
+
+
+def checkoutPath(game_type_id: str) -> str:
+    """
+    Gets path of game type's checkout, that game module is imported from
+    :param game_type_id: id of game type
+    :return: path
+    """
+    return os.path.join(GAME_TYPES_FOLDER, game_type_id)
+
+
+def repositoryPath(game_type_id: str) -> str:
+    """
+    Gets path of game type's git mirror
+    :param game_type_id: id of game type
+    :return: path
+    """
+    return os.path.join(GAME_REPOS_FOLDER, game_type_id + '.git')
+
+
+def revisionsFolder(game_type_id: str) -> str:
+    """
+    Gets folder with extracted revisions of game type
+    :param game_type_id: id of game type
+    :return: path
+    """
+    return os.path.join(GAME_TYPES_FOLDER, REVISIONS_FOLDER, game_type_id)
+
+
+def currentRevision(game_type_id: str) -> str:
+    """
+    Gets revision the checkout points to
+    :param game_type_id: id of game type
+    :return: commit hash, empty string for checkouts made before revisions
+    """
+    path = checkoutPath(game_type_id)
+    if not os.path.islink(path):
+        return ''
+    return os.path.basename(os.readlink(path))
+
+
+def _git(*args) -> str:
+    """
+    Runs git
+    :param args: git params
+    :return: stripped output
+    """
+    return subprocess.check_output(['git'] + list(args), stderr=subprocess.PIPE).decode().strip()
+
+
+@contextmanager
+def _updateLock(game_type_id: str):
+    """
+    Serializes clones and updates of game type between processes
+    :param game_type_id: id of game type
+    """
+    os.makedirs(GAME_REPOS_FOLDER, exist_ok=True)
+    with open(repositoryPath(game_type_id) + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _extractRevision(game_type_id: str, revision: str) -> str:
+    """
+    Extracts tree of commit from mirror into its own revision folder
+    :param game_type_id: id of game type
+    :param revision: commit hash
+    :return: path of revision folder
+    """
+    target = os.path.join(revisionsFolder(game_type_id), revision)
+    if os.path.isdir(target):
+        return target
+    os.makedirs(revisionsFolder(game_type_id), exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=revisionsFolder(game_type_id), prefix='.tmp-')
+    try:
+        archive = subprocess.Popen(['git', '--git-dir', repositoryPath(game_type_id), 'archive', revision],
+                                   stdout=subprocess.PIPE)
+        with tarfile.open(fileobj=archive.stdout, mode='r|') as tar:
+            # 'data' filter rejects absolute paths and links out of the tree, if this python has it
+            tar.extractall(tmp, **({'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}))
+        if archive.wait() != 0:
+            raise subprocess.CalledProcessError(archive.returncode, 'git archive')
+        os.rename(tmp, target)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return target
+
+
+def _swapCheckout(game_type_id: str, revision: str):
+    """
+    Points checkout to revision atomically
+    :param game_type_id: id of game type
+    :param revision: commit hash
+    """
+    path = checkoutPath(game_type_id)
+    link = os.path.join(GAME_TYPES_FOLDER, '.tmp-' + randomUUID())
+    os.symlink(os.path.join(REVISIONS_FOLDER, game_type_id, revision), link)
+    try:
+        if os.path.isdir(path) and not os.path.islink(path):
+            # checkout made before revisions is moved aside once, later swaps are atomic
+            os.rename(path, os.path.join(revisionsFolder(game_type_id), 'legacy-' + randomUUID()))
+        os.replace(link, path)
+    except BaseException:
+        if os.path.lexists(link):
+            os.remove(link)
+        raise
+
+
+def _pruneRevisions(game_type_id: str, keep: int = KEEP_GAME_REVISIONS):
+    """
+    Deletes the oldest revision folders, the current one is always kept
+    :param game_type_id: id of game type
+    :param keep: number of revisions to keep
+    """
+    folder = revisionsFolder(game_type_id)
+    current = currentRevision(game_type_id)
+    revisions = sorted((entry for entry in os.scandir(folder) if entry.is_dir() and entry.name != current),
+                       key=lambda entry: entry.stat().st_mtime, reverse=True)
+    # previous revisions stay for modules, that were imported from them and are still in use
+    for entry in revisions[max(keep - 1, 0):]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def _mirror(game_type_id: str, git_url: str):
+    """
+    Makes git mirror of game type's repository, reusing objects of checkout made before revisions
+    :param game_type_id: id of game type
+    :param git_url: url of repository
+    """
+    repository = repositoryPath(game_type_id)
+    if os.path.isdir(repository):
+        return
+    legacy = checkoutPath(game_type_id)
+    tmp = repository + '.tmp-' + randomUUID()
+    try:
+        if os.path.isdir(os.path.join(legacy, '.git')):
+            _git('clone', '--mirror', '--quiet', legacy, tmp)
+            _git('--git-dir', tmp, 'remote', 'set-url', 'origin', git_url)
+        else:
+            _git('clone', '--mirror', '--quiet', git_url, tmp)
+        os.rename(tmp, repository)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def cloneGameType(game_type_id: str, git_url: str, revision: str = None) -> str:
+    """
+    Clones game type's repository and checks out revision
+    :param game_type_id: id of game type
+    :param git_url: url of repository
+    :param revision: commit to check out, HEAD if None
+    :return: checked out commit hash
+    """
+    with _updateLock(game_type_id):
+        _mirror(game_type_id, git_url)
+        if revision is None:
+            revision = _git('--git-dir', repositoryPath(game_type_id), 'rev-parse', 'HEAD^{commit}')
+        elif currentRevision(game_type_id) == revision:
+            return revision
+        _extractRevision(game_type_id, revision)
+        _swapCheckout(game_type_id, revision)
+    return revision
+
+
+def updateGameType(game_type) -> tuple:
+    """
+    Fetches new commits of game type, bundles new revision and swaps it in
+    :param game_type: GameType
+    :return: tuple of (previous revision, current revision)
+    """
+    from .models import GameType
+
+    gt_id = game_type.game_type_id
+    with _updateLock(gt_id):
+        previous = currentRevision(gt_id)
+        _mirror(gt_id, game_type.git_url)
+        repository = repositoryPath(gt_id)
+        logger.info("Fetching {%s}...", gt_id)
+        _git('--git-dir', repository, 'fetch', '--prune', '--quiet', 'origin')
+        revision = _git('--git-dir', repository, 'rev-parse', 'HEAD^{commit}')
+        if revision != previous:
+            source = _extractRevision(gt_id, revision)
+            # new bundle goes first, so workers reloading after the swap never import the old code
+            buildBundle(gt_id, source)
+            _swapCheckout(gt_id, revision)
+            logger.info("Updated {%s} from {%s} to {%s}", gt_id, previous or 'unversioned checkout', revision)
+        GameType.objects.filter(pk=game_type.pk).update(revision=revision)
+        game_type.revision = revision
+        _pruneRevisions(gt_id)
+    return previous, revision
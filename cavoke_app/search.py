@@ -0,0 +1,188 @@
+"""
+In-memory inverted index over game types catalog.
+
+Indexes name, creator_display_name and description of game types, supports prefix matching
+and ranks results by weighted term matches. The index is updated incrementally:
+in-process saves are indexed through signals, game types saved by other workers are picked up
+by id watermark on the next search.
+"""
+import bisect
+import re
+import time
+from collections import defaultdict
+from threading import RLock
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import GameType
+
+"""
+Weights of indexed fields
+"""
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'creator_display_name': 2.0,
+    'description': 1.0,
+}
+
+"""
+Score multiplier for terms matched only by prefix
+"""
+PREFIX_MATCH_WEIGHT = 0.5
+
+"""
+Seconds between checks for game types saved by other workers
+"""
+REFRESH_INTERVAL = 5
+
+SORT_RELEVANCE = 'relevance'
+SORT_TIMES_PLAYED = 'timesPlayed'
+SORT_CREATED_ON = 'createdOn'
+
+_word = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text: str) -> list:
+    """
+    Splits text into lowercase terms
+    :param text: text
+    :return: list of terms
+    """
+    return _word.findall((text or '').lower())
+
+
+class CatalogIndex:
+    """
+    Inverted index of game types
+    """
+
+    def __init__(self):
+        self.__lock = RLock()
+        # term -> {game type pk -> weight}
+        self.__postings = defaultdict(dict)
+        # sorted terms for prefix lookup
+        self.__terms = []
+        # game type pk -> (creator, terms of game type)
+        self.__docs = {}
+        self.__watermark = 0
+        self.__checkedOn = 0.0
+
+    def add(self, game_type: GameType):
+        """
+        Indexes game type, replacing its previous version
+        :param game_type: GameType
+        """
+        with self.__lock:
+            self.remove(game_type.pk)
+            weights = defaultdict(float)
+            for field, weight in FIELD_WEIGHTS.items():
+                for term in tokenize(getattr(game_type, field)):
+                    weights[term] += weight
+            for term, weight in weights.items():
+                if term not in self.__postings:
+                    bisect.insort(self.__terms, term)
+                self.__postings[term][game_type.pk] = weight
+            self.__docs[game_type.pk] = (game_type.creator, list(weights))
+            self.__watermark = max(self.__watermark, game_type.pk)
+
+    def remove(self, pk: int):
+        """
+        Removes game type from index
+        :param pk: primary key of game type
+        """
+        with self.__lock:
+            doc = self.__docs.pop(pk, None)
+            if doc is None:
+                return
+            for term in doc[1]:
+                postings = self.__postings[term]
+                postings.pop(pk, None)
+                if not postings:
+                    del self.__postings[term]
+                    del self.__terms[bisect.bisect_left(self.__terms, term)]
+
+    def refresh(self, force: bool = False):
+        """
+        Indexes game types created by other workers, rebuilds index if some were deleted
+        :param force: check database even if REFRESH_INTERVAL hasn't passed
+        """
+        now = time.monotonic()
+        if not force and now - self.__checkedOn < REFRESH_INTERVAL:
+            return
+        fields = ('pk', 'creator') + tuple(FIELD_WEIGHTS)
+        with self.__lock:
+            self.__checkedOn = now
+            for game_type in GameType.objects.filter(pk__gt=self.__watermark).only(*fields):
+                self.add(game_type)
+            if GameType.objects.count() != len(self.__docs):
+                self.__postings.clear()
+                self.__terms.clear()
+                self.__docs.clear()
+                for game_type in GameType.objects.only(*fields).iterator():
+                    self.add(game_type)
+
+    def search(self, query: str, creator: str = None) -> dict:
+        """
+        Finds game types, that match all terms of query (exactly or by prefix)
+        :param query: search query, empty query matches everything
+        :param creator: uid of creator to filter by
+        :return: dict of game type pk to score
+        """
+        self.refresh()
+        with self.__lock:
+            scores = None
+            for term in set(tokenize(query)):
+                matched = defaultdict(float)
+                start = bisect.bisect_left(self.__terms, term)
+                for candidate in self.__terms[start:]:
+                    if not candidate.startswith(term):
+                        break
+                    factor = 1.0 if candidate == term else PREFIX_MATCH_WEIGHT
+                    for pk, weight in self.__postings[candidate].items():
+                        matched[pk] = max(matched[pk], weight * factor)
+                if scores is None:
+                    scores = matched
+                else:
+                    scores = {pk: score + matched[pk] for pk, score in scores.items() if pk in matched}
+            if scores is None:
+                scores = {pk: 0.0 for pk in self.__docs}
+            if creator is not None:
+                scores = {pk: score for pk, score in scores.items() if self.__docs[pk][0] == creator}
+            return scores
+
+
+"""
+Process-wide catalog index
+"""
+catalog_index = CatalogIndex()
+
+
+def searchGameTypes(query: str, creator: str = None, sort: str = SORT_RELEVANCE, limit: int = 50) -> list:
+    """
+    Searches catalog
+    :param query: search query
+    :param creator: uid of creator to filter by
+    :param sort: relevance, timesPlayed or createdOn
+    :param limit: maximum number of results
+    :return: list of GameType
+    """
+    scores = catalog_index.search(query, creator)
+    if not scores:
+        return []
+    if sort == SORT_RELEVANCE:
+        # rank in memory, fetch only the page
+        ranked = sorted(scores, key=lambda pk: (-scores[pk], -pk))[:limit]
+        game_types = GameType.objects.in_bulk(ranked)
+        return [game_types[pk] for pk in ranked if pk in game_types]
+    return list(GameType.objects.filter(pk__in=list(scores)).order_by('-' + sort, '-pk')[:limit])
+
+
+@receiver(post_save, sender=GameType)
+def index_game_type(sender, instance, **kwargs):
+    catalog_index.add(instance)
+
+
+@receiver(post_delete, sender=GameType)
+def unindex_game_type(sender, instance, **kwargs):
+    catalog_index.remove(instance.pk)
@@ -19,7 +19,8 @@ from cavoke_app.models import GameSession, GameType
 class GameSessionSerializer(ModelSerializer):
     class Meta:
         model = GameSession
-        exclude = ['game_object_bytes', 'id']
+        exclude = ['game_object_bytes', 'id', 'archive_segment', 'archive_offset', 'archive_length',
+                   'game_object_hash']
 
     def createInstance(self):
         return GameSession(**self.validated_data)
@@ -28,7 +29,7 @@ class GameSessionSerializer(ModelSerializer):
 class GameTypeSerializer(ModelSerializer):
     class Meta:
         model = GameType
-        exclude = ['id']
+        exclude = ['id', 'revision']
 
     def createInstance(self):
         return GameType(**self.validated_data)
@@ -0,0 +1,46 @@
+"""
+Summaries of game sessions.
+
+Games may define `getSummary()`, returning a small JSON-serializable dict (e.g. score, turn, finished), that is stored
+with the session whenever its state is saved, so session lists are shown without unpickling games or running game code.
+"""
+import json
+import logging
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .config import MAX_SESSION_SUMMARY_SIZE, run_with_limited_time
+
+logger = logging.getLogger(__name__)
+
+
+def gameSummary(game) -> dict:
+    """
+    Gets summary of game, runs game code with time limit, so it must be called under admission control
+    :param game: cavoke game
+    :return: summary, empty if game doesn't provide one, it fails, times out or is invalid
+    """
+    getSummary = getattr(game, 'getSummary', None)
+    if getSummary is None:
+        return {}
+    try:
+        summary = run_with_limited_time(getSummary, ())
+    except TimeoutError:
+        logger.warning("Summary of {%s} timed out", type(game).__module__)
+        return {}
+    except Exception as e:
+        logger.warning("Summary of {%s} failed. Details: {%s}", type(game).__module__, e)
+        return {}
+    if not isinstance(summary, dict):
+        logger.warning("Summary of {%s} isn't a dict", type(game).__module__)
+        return {}
+    try:
+        size = len(json.dumps(summary, cls=DjangoJSONEncoder, separators=(',', ':')))
+    except (TypeError, ValueError) as e:
+        logger.warning("Summary of {%s} isn't JSON-serializable. Details: {%s}", type(game).__module__, e)
+        return {}
+    if size > MAX_SESSION_SUMMARY_SIZE:
+        logger.warning("Summary of {%s} is %s bytes, more than %s", type(game).__module__, size,
+                       MAX_SESSION_SUMMARY_SIZE)
+        return {}
+    return summary
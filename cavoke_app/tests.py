@@ -1,3 +1,1354 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import time
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connections
+from django.test import TestCase, RequestFactory, override_settings
+from rest_framework import exceptions
+
+from cavoke_app.authentication import CachedFirebaseAuthentication, token_cache, revokeUid
+from cavoke_server import routers
+
+
+def mintKey():
+    """
+    Makes local RSA key pair for signing id tokens
+    :return: (private key, public key)
+    """
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return key, key.public_key()
+
+
+def mintToken(key, uid: str, lifetime: float = 3600, iat: float = None) -> str:
+    """
+    Mints id token signed with local key
+    :param key: private key
+    :param uid: uid of user
+    :param lifetime: seconds until exp
+    :param iat: issue time, now if None
+    :return: token
+    """
+    import jwt
+
+    iat = time.time() if iat is None else iat
+    return jwt.encode({'uid': uid, 'sub': uid, 'iat': int(iat), 'exp': int(iat + lifetime)}, key, 'RS256')
+
+
+def firebaseUser(uid: str, valid_after: float = 0, email_verified: bool = True):
+    return SimpleNamespace(uid=uid, email=uid + '@example.com', email_verified=email_verified, display_name=None,
+                           provider_data=[], tokens_valid_after_timestamp=int(valid_after * 1000))
+
+
+class LocalFirebaseAuthentication:
+    """
+    Stands in for FirebaseAuthentication, verifying tokens with local public key
+    """
+
+    def __init__(self, public_key, users: dict):
+        self.public_key = public_key
+        self.users = users
+        self.verified = 0
+
+    def decode_token(self, firebase_token):
+        import jwt
+
+        self.verified += 1
+        try:
+            return jwt.decode(firebase_token, self.public_key, algorithms=['RS256'])
+        except jwt.InvalidTokenError:
+            raise exceptions.AuthenticationFailed('Token is invalid.')
+
+    def authenticate_token(self, decoded_token):
+        return self.users[decoded_token['uid']]
+
+    def get_or_create_local_user(self, firebase_user):
+        from django.contrib.auth.models import User
+
+        return User.objects.get_or_create(username=firebase_user.uid, email=firebase_user.email)[0]
+
+    def create_local_firebase_user(self, local_user, firebase_user):
+        from drf_firebase_auth_cavoke.models import FirebaseUser
+
+        FirebaseUser.objects.get_or_create(user=local_user, uid=firebase_user.uid)
+
+    def authenticate(self, request):
+        raise exceptions.AuthenticationFailed('Invalid Authorization header format, expecting: JWT <token>.')
+
+
+@override_settings(TOKEN_REVOCATION_CHECK_INTERVAL=0)
+class TokenCacheTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.key, cls.public_key = mintKey()
+
+    def setUp(self):
+        token_cache.clear()
+        self.users = {'u1': firebaseUser('u1')}
+        self.firebase = LocalFirebaseAuthentication(self.public_key, self.users)
+        patcher = mock.patch.object(CachedFirebaseAuthentication, 'firebase', return_value=self.firebase)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('firebase_admin.auth.get_user', side_effect=lambda uid: self.users[uid])
+        self.get_user = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def authenticate(self, token):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION='JWT ' + token)
+        return CachedFirebaseAuthentication().authenticate(request)
+
+    def test_verifies_token_once(self):
+        token = mintToken(self.key, 'u1')
+        user, decoded = self.authenticate(token)
+        self.assertEqual(self.authenticate(token)[0], user)
+        self.assertEqual(decoded['uid'], 'u1')
+        self.assertEqual(self.firebase.verified, 1)
+
+    def test_rejects_token_signed_with_other_key(self):
+        other_key, _ = mintKey()
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate(mintToken(other_key, 'u1'))
+        self.assertEqual(len(token_cache), 0)
+
+    def test_expired_token_is_verified_again(self):
+        token = mintToken(self.key, 'u1', lifetime=2)
+        self.authenticate(token)
+        with mock.patch('time.time', return_value=time.time() + 5):
+            self.authenticate(token)
+        self.assertEqual(self.firebase.verified, 2)
+
+    def test_revoked_token_is_rejected_on_cache_hit(self):
+        token = mintToken(self.key, 'u1', iat=time.time() - 10)
+        self.authenticate(token)
+        self.users['u1'] = firebaseUser('u1', valid_after=time.time())
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate(token)
+        self.assertEqual(len(token_cache), 0)
+
+    def test_unverified_email_is_rejected_on_cache_hit(self):
+        token = mintToken(self.key, 'u1')
+        self.authenticate(token)
+        self.users['u1'] = firebaseUser('u1', email_verified=False)
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_firebase_user_is_checked_once_per_interval(self):
+        token = mintToken(self.key, 'u1')
+        with self.settings(TOKEN_REVOCATION_CHECK_INTERVAL=60):
+            for _ in range(3):
+                self.authenticate(token)
+        self.assertEqual(self.get_user.call_count, 0)
+        with self.settings(TOKEN_REVOCATION_CHECK_INTERVAL=0):
+            self.authenticate(token)
+        self.assertEqual(self.get_user.call_count, 1)
+
+    def test_revocation_hooks(self):
+        token = mintToken(self.key, 'u1')
+        user, _ = self.authenticate(token)
+        revokeUid('u1')
+        self.authenticate(token)
+        user.is_active = False
+        user.save()
+        self.assertEqual(len(token_cache), 0)
+        self.assertEqual(self.firebase.verified, 2)
+
+
+class LocalDatabasesTestCase(TestCase):
+    """
+    TestCase with extra databases in local SQLite files, that are migrated before the test case starts.
+    Settings in `database_settings` are applied while migrating, so routers see the aliases
+    """
+    local_databases = ()
+    database_settings = {}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.settings_override = override_settings(**cls.database_settings)
+        cls.settings_override.enable()
+        for alias in cls.local_databases:
+            path = os.path.join(cls.directory, alias + '.sqlite3')
+            connections.databases[alias] = dict(connections.databases['default'], NAME=path, TEST={'NAME': path})
+            call_command('migrate', database=alias, verbosity=0)
+        cls.databases = {'default', *cls.local_databases}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in cls.local_databases:
+            connections[alias].close()
+            del connections[alias]
+            del connections.databases[alias]
+        cls.settings_override.disable()
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def tables(self, alias: str) -> set:
+        return {table for table in connections[alias].introspection.table_names() if not table.startswith('django')}
+
+
+class ReplicaRouterTests(LocalDatabasesTestCase):
+    local_databases = ('replica',)
+    database_settings = {'DATABASE_REPLICAS': ['replica']}
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        self.user = User.objects.create(username='r1')
+        settings_override = self.settings(REPLICA_STICKY_STORE=os.path.join(self.directory, self._testMethodName))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def read(self, uid: str):
+        from django.contrib.auth.models import User
+
+        @routers.replica_reads
+        def view(request):
+            return set(User.objects.values_list('username', flat=True))
+
+        return view(SimpleNamespace(auth={'uid': uid}))
+
+    def test_replica_has_all_tables(self):
+        self.assertIn('cavoke_app_gametype', self.tables('replica'))
+        self.assertIn('cavoke_app_gamesession', self.tables('replica'))
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.read('r1'), set())
+
+    def test_writes_go_to_primary(self):
+        from django.contrib.auth.models import User
+
+        self.assertTrue(User.objects.filter(username='r1').exists())
+        self.assertFalse(User.objects.using('replica').filter(username='r1').exists())
+
+    def test_reads_stick_to_primary_after_write(self):
+        routers.markSticky('r1')
+        self.assertEqual(self.read('r1'), {'r1'})
+        self.assertEqual(self.read('r2'), set())
+
+    def test_stickiness_is_seen_by_other_processes(self):
+        import threading
+
+        routers.markSticky('r1')
+        # every thread has its own connection to the store, as other processes do
+        seen = []
+        thread = threading.Thread(target=lambda: seen.append(routers.isSticky('r1')))
+        thread.start()
+        thread.join()
+        self.assertEqual(seen, [True])
+
+    def test_writes_without_replicas_are_not_remembered(self):
+        from django.contrib.auth.models import User
+
+        def view(request):
+            User.objects.create(username=request.auth['uid'])
+
+        request = SimpleNamespace(auth={'uid': 'r2'})
+        with self.settings(DATABASE_REPLICAS=[]), mock.patch.object(routers, 'markSticky') as markSticky:
+            routers.ReplicaStickinessMiddleware(view)(request)
+        markSticky.assert_not_called()
+        routers.ReplicaStickinessMiddleware(view)(SimpleNamespace(auth={'uid': 'r3'}))
+        self.assertTrue(routers.isSticky('r3'))
+
+    def test_stickiness_expires(self):
+        with self.settings(REPLICA_STICKY_FOR=0.01):
+            routers.markSticky('r1')
+        time.sleep(0.05)
+        self.assertFalse(routers.isSticky('r1'))
+
+
+MINIMAL_GAME_CODE = 'import cavoke\n\n\nclass MyGame(cavoke.Game):\n    pass\n'
+
+
+def writeGameModule(game_type_id: str, code: str = MINIMAL_GAME_CODE) -> str:
+    """
+    Writes checkout of game type, so GameType.save doesn't clone it
+    :param game_type_id: id of game type
+    :param code: source of game module
+    :return: folder, that should be removed after the test
+    """
+    from cavoke_app.config import GAME_TYPES_FOLDER
+
+    created = GAME_TYPES_FOLDER if not os.path.exists(GAME_TYPES_FOLDER) else GAME_TYPES_FOLDER + game_type_id
+    os.makedirs(GAME_TYPES_FOLDER + game_type_id)
+    with open(os.path.join(GAME_TYPES_FOLDER + game_type_id, '__init__.py'), 'w') as f:
+        f.write(code)
+    return created
+
+
+class GameTestCase(TestCase):
+    """
+    TestCase with a saved game type, whose checkout is written before the test case starts
+    """
+    game_code = MINIMAL_GAME_CODE
+
+    @classmethod
+    def setUpClass(cls):
+        from cavoke_app.modulecache import game_module_cache
+
+        cls.game_type_id = 'test' + cls.__name__.lower()
+        cls.module_folder = writeGameModule(cls.game_type_id, cls.game_code)
+        cls.addClassCleanup(shutil.rmtree, cls.module_folder, ignore_errors=True)
+        cls.addClassCleanup(game_module_cache.evict, cls.game_type_id)
+        super().setUpClass()
+
+    def setUp(self):
+        from cavoke_app.models import GameType
+
+        self.game_type = GameType(game_type_id=self.game_type_id, name='Game', creator='author',
+                                  creator_display_name='Author', git_url='https://example.com/game.git')
+        self.game_type.save()
+
+    def newSession(self, player_uid: str):
+        from cavoke_app.models import GameSession
+
+        game_session = GameSession(player_uid=player_uid, game_type=self.game_type)
+        game_session.save()
+        return game_session
+
+
+class ShardingTests(LocalDatabasesTestCase, GameTestCase):
+    local_databases = ('shard1', 'shard2')
+    layout = {'default': range(0, 128), 'shard1': range(128, 256)}
+    new_layout = {'default': range(0, 64), 'shard2': range(64, 128), 'shard1': range(128, 256)}
+
+    def setUp(self):
+        super().setUp()
+        settings_override = self.settings(SESSION_SHARD_MAP=self.layout, SESSION_SHARD_MAP_PREVIOUS={})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def used(self, player_uid: str) -> int:
+        from cavoke_app.models import QuotaCounter
+
+        counter = QuotaCounter.objects.filter(kind=QuotaCounter.GAME_SESSIONS, owner=player_uid).first()
+        return counter.used if counter else 0
+
+    def playerIn(self, buckets: range) -> str:
+        from cavoke_server.sharding import bucketOf
+
+        return next(uid for uid in ('player%d' % i for i in range(10000)) if bucketOf(uid) in buckets)
+
+    def test_shards_have_only_game_sessions(self):
+        self.assertEqual(self.tables('shard1'), {'cavoke_app_gamesession'})
+
+    def test_new_session_is_written_to_its_shard(self):
+        from cavoke_app.models import GameSession
+
+        for alias, buckets in self.layout.items():
+            player_uid = self.playerIn(buckets)
+            game_session = self.newSession(player_uid)
+            self.assertEqual(game_session._state.db, alias)
+            self.assertEqual(GameSession.objects.locate(game_session.game_session_id)._state.db, alias)
+            self.assertEqual(self.used(player_uid), 1)
+
+    def test_failed_insert_into_shard_releases_quota(self):
+        from django.db import IntegrityError
+        from cavoke_app.models import GameSession
+
+        player_uid = self.playerIn(self.layout['shard1'])
+        with mock.patch.object(GameSession, 'save_base', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                self.newSession(player_uid)
+        self.assertEqual(self.used(player_uid), 0)
+
+    def test_game_state_is_saved_on_shard(self):
+        from cavoke_app.models import GameSession
+
+        game_session = self.newSession(self.playerIn(self.layout['shard1']))
+        game_session.saveGameState({'turn': 1})
+        saved = GameSession.objects.using('shard1').get(pk=game_session.pk)
+        self.assertEqual((saved.state_version, saved.summary), (1, {'turn': 1}))
+
+    def test_reshard_moves_sessions_to_new_shards(self):
+        from io import StringIO
+        from cavoke_app.models import GameSession
+
+        ids = [self.newSession(self.playerIn(buckets)).game_session_id
+               for buckets in (range(0, 64), range(64, 128), range(128, 256))]
+        with self.settings(SESSION_SHARD_MAP=self.new_layout, SESSION_SHARD_MAP_PREVIOUS=self.layout):
+            # sessions are found on their previous shard until they are moved
+            self.assertEqual(GameSession.objects.locate(ids[1])._state.db, 'default')
+            call_command('reshardsessions', stdout=StringIO())
+        with self.settings(SESSION_SHARD_MAP=self.new_layout):
+            self.assertEqual([GameSession.objects.locate(game_session_id)._state.db for game_session_id in ids],
+                             ['default', 'shard2', 'shard1'])
+        self.assertEqual(GameSession.objects.using('default').filter(game_session_id__in=ids).count(), 1)
+
+
+class GameSummaryTests(TestCase):
+
+    def summary(self, getSummary):
+        from cavoke_app.summaries import gameSummary
+
+        return gameSummary(SimpleNamespace(getSummary=getSummary))
+
+    def test_summary_of_game(self):
+        self.assertEqual(self.summary(lambda: {'score': 3}), {'score': 3})
+
+    def test_game_without_summary(self):
+        from cavoke_app.summaries import gameSummary
+
+        self.assertEqual(gameSummary(object()), {})
+
+    def test_failing_summary_is_empty(self):
+        def getSummary():
+            raise KeyError('score')
+
+        with self.assertLogs('cavoke_app.summaries', 'WARNING'):
+            self.assertEqual(self.summary(getSummary), {})
+
+    def test_invalid_summaries_are_empty(self):
+        from cavoke_app.config import MAX_SESSION_SUMMARY_SIZE
+
+        for summary in (['score'], {'game': object()}, {'score': 'x' * MAX_SESSION_SUMMARY_SIZE}):
+            with self.assertLogs('cavoke_app.summaries', 'WARNING'):
+                self.assertEqual(self.summary(lambda: summary), {})
+
+    def test_summary_runs_with_time_limit(self):
+        getSummary = mock.Mock(return_value={'score': 3})
+        with mock.patch('cavoke_app.summaries.run_with_limited_time', side_effect=TimeoutError) as limited, \
+                self.assertLogs('cavoke_app.summaries', 'WARNING'):
+            self.assertEqual(self.summary(getSummary), {})
+        limited.assert_called_once_with(getSummary, ())
+
+
+class PrototypeTests(TestCase):
+
+    def setUp(self):
+        import sys
+        import types
+        from cavoke_app.prototypes import invalidatePrototype
+
+        self.constructed = 0
+
+        def MyGame():
+            self.constructed += 1
+            return {'game': self.constructed}
+
+        self.module = types.ModuleType('prototypetestgame')
+        self.module.MyGame = MyGame
+        sys.modules[self.module.__name__] = self.module
+        self.addCleanup(sys.modules.pop, self.module.__name__)
+        self.game_type = SimpleNamespace(game_type_id='prototypetestgame', getGameModule=lambda: self.module)
+        self.addCleanup(invalidatePrototype, self.game_type.game_type_id)
+
+    def test_initial_state_is_constructed_every_time_by_default(self):
+        from cavoke_app.prototypes import initialGame
+
+        self.assertNotEqual(initialGame(self.game_type), initialGame(self.game_type))
+        self.assertEqual(self.constructed, 2)
+
+    def test_cached_initial_state_is_constructed_once(self):
+        from cavoke_app.prototypes import initialGame
+
+        self.module.CACHE_INITIAL_STATE = True
+        self.assertEqual(initialGame(self.game_type), initialGame(self.game_type))
+        self.assertEqual(self.constructed, 1)
+
+    def test_constructor_needs_slot_for_game_code(self):
+        from cavoke_app.admission import AdmissionController
+        from cavoke_app.exceptions import OverloadedWarning
+        from cavoke_app.prototypes import initialGame
+
+        with mock.patch('cavoke_app.prototypes.game_admission', AdmissionController(max_per_type=0)):
+            with self.assertRaises(OverloadedWarning):
+                initialGame(self.game_type)
+        self.assertEqual(self.constructed, 0)
+
+
+class ArchiveTests(GameTestCase):
+
+    def setUp(self):
+        import functools
+        from cavoke_app import archive
+
+        super().setUp()
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder, ignore_errors=True)
+        patcher = mock.patch('cavoke_app.models.readRecord', functools.partial(archive.readRecord, folder=self.folder))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def idleSession(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from cavoke_app.models import GameSession
+
+        game_session = self.newSession('archived')
+        GameSession.objects.filter(pk=game_session.pk).update(lastUsedOn=timezone.now() - timedelta(days=1))
+        return GameSession.objects.get(pk=game_session.pk)
+
+    def archive(self) -> int:
+        from datetime import timedelta
+        from cavoke_app.archive import archiveIdleSessions
+
+        return archiveIdleSessions(timedelta(hours=1), self.folder)
+
+    def test_idle_session_is_archived_and_restored(self):
+        from cavoke_app.models import GameSession
+
+        state = bytes(self.idleSession().game_object_bytes)
+        self.assertEqual(self.archive(), 1)
+        stub = GameSession.objects.get(game_type=self.game_type)
+        self.assertTrue(stub.isArchived())
+        self.assertEqual(bytes(stub.game_object_bytes), b'')
+        self.assertEqual(stub.getGameObjectBytes(), state)
+        restored = GameSession.objects.get(pk=stub.pk)
+        self.assertEqual((restored.isArchived(), bytes(restored.game_object_bytes)), (False, state))
+
+    def test_state_saved_after_archiving_replaces_archived_one(self):
+        import pickle
+        from cavoke_app.models import GameSession
+
+        game_session = self.idleSession()
+        game = game_session.getCavokeGame()
+        self.assertEqual(self.archive(), 1)
+        game.moves = 1
+        game_session.saveGameState()
+        saved = GameSession.objects.get(pk=game_session.pk)
+        self.assertFalse(saved.isArchived())
+        self.assertEqual(pickle.loads(saved.getGameObjectBytes()).moves, 1)
+
+    def test_session_changed_while_archiving_is_kept(self):
+        from cavoke_app.archive import SegmentWriter, _stubSessions
+        from cavoke_app.models import GameSession
+
+        game_session = self.idleSession()
+        with SegmentWriter(self.folder) as writer:
+            batch = [(game_session.pk, game_session.lastUsedOn, game_session.state_version)
+                     + writer.append(bytes(game_session.game_object_bytes))]
+            game_session.saveGameState()
+            self.assertEqual(_stubSessions(writer, 'default', batch), 0)
+        self.assertFalse(GameSession.objects.get(pk=game_session.pk).isArchived())
+
+
+class BlobStoreTests(GameTestCase):
+
+    def setUp(self):
+        import functools
+        from cavoke_app import blobstore
+
+        super().setUp()
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder, ignore_errors=True)
+        for patcher in (mock.patch.object(blobstore, 'blobPath', functools.partial(blobstore.blobPath,
+                                                                                   folder=self.folder)),
+                        mock.patch('cavoke_app.models.GAME_STATE_BACKEND', 'blob')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def refcount(self, blob_hash: str) -> int:
+        from cavoke_app.models import GameBlob
+
+        blob = GameBlob.objects.filter(blob_hash=blob_hash).first()
+        return blob.refcount if blob else 0
+
+    def stored(self, blob_hash: str) -> bool:
+        from cavoke_app.blobstore import blobPath
+
+        return os.path.exists(blobPath(blob_hash))
+
+    def test_identical_states_are_stored_once(self):
+        first, second = self.newSession('b1'), self.newSession('b2')
+        self.assertEqual(first.game_object_hash, second.game_object_hash)
+        self.assertEqual(self.refcount(first.game_object_hash), 2)
+        self.assertEqual(len(os.listdir(self.folder)), 1)
+
+    def test_blob_is_deleted_when_release_commits(self):
+        from django.db import transaction
+        from cavoke_app.blobstore import releaseBlob
+
+        blob_hash = self.newSession('b1').game_object_hash
+        with self.assertRaises(RuntimeError), self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                releaseBlob(blob_hash)
+                raise RuntimeError
+        self.assertEqual((self.refcount(blob_hash), self.stored(blob_hash)), (1, True))
+        with self.captureOnCommitCallbacks(execute=True):
+            releaseBlob(blob_hash)
+        self.assertEqual((self.refcount(blob_hash), self.stored(blob_hash)), (0, False))
+
+    def test_migrate_to_db_skips_sessions_saved_meanwhile(self):
+        import pickle
+        from io import StringIO
+        from cavoke_app.blobstore import readBlob
+        from cavoke_app.models import GameSession
+
+        first, second = self.newSession('b1'), self.newSession('b2')
+        initial = first.game_object_hash
+        state = readBlob(initial)
+
+        def readAfterSave(blob_hash):
+            # the first session is played while the command moves it
+            if not hasattr(first, 'moved'):
+                first.moved = True
+                first.getCavokeGame().moves = 1
+                first.saveGameState()
+            return readBlob(blob_hash)
+
+        with mock.patch('cavoke_app.management.commands.migrateblobs.readBlob', readAfterSave), \
+                self.captureOnCommitCallbacks(execute=True):
+            call_command('migrateblobs', to='db', stdout=StringIO())
+        first, second = GameSession.objects.get(pk=first.pk), GameSession.objects.get(pk=second.pk)
+        self.assertNotEqual(first.game_object_hash, '')
+        self.assertEqual(pickle.loads(first.getGameObjectBytes()).moves, 1)
+        self.assertEqual((second.game_object_hash, bytes(second.game_object_bytes)), ('', state))
+        self.assertEqual((self.refcount(initial), self.stored(initial)), (0, False))
+
+
+class GameModuleCacheTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.game_type_ids = ['modulecachetest%d' % i for i in range(3)]
+        for game_type_id in cls.game_type_ids:
+            cls.addClassCleanup(shutil.rmtree, writeGameModule(game_type_id), ignore_errors=True)
+
+    def setUp(self):
+        import sys
+        from cavoke_app.modulecache import GameModuleCache
+
+        self.cache = GameModuleCache(max_count=2, max_memory=None)
+        for game_type_id in self.game_type_ids:
+            self.addCleanup(sys.modules.pop, 'cavoke_app.game_modules.' + game_type_id, None)
+
+    def test_least_recently_used_module_is_evicted(self):
+        import sys
+        import cavoke_app.game_modules
+
+        first, second, third = self.game_type_ids
+        self.cache.get(first)
+        self.cache.get(second)
+        self.cache.get(first)
+        self.cache.get(third)
+        self.assertNotIn('cavoke_app.game_modules.' + second, sys.modules)
+        self.assertFalse(hasattr(cavoke_app.game_modules, second))
+        self.assertIn('cavoke_app.game_modules.' + first, sys.modules)
+        self.assertEqual((self.cache.stats()['loaded'], self.cache.stats()['evictions']), (2, 1))
+
+    def test_garbage_is_collected_without_holding_the_lock(self):
+        import threading
+
+        finished = []
+
+        def collect():
+            # another thread can look modules up meanwhile
+            thread = threading.Thread(target=lambda: finished.append(self.cache.stats()))
+            thread.start()
+            thread.join(5)
+
+        for game_type_id in self.game_type_ids[:2]:
+            self.cache.get(game_type_id)
+        with mock.patch('cavoke_app.modulecache.gc.collect', side_effect=collect) as gc_collect:
+            self.cache.get(self.game_type_ids[2])
+        self.assertEqual((gc_collect.call_count, len(finished)), (1, 1))
+
+    def test_warmup_imports_most_played_up_to_limit(self):
+        from cavoke_app import bundles
+        from cavoke_app.models import GameType
+
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder, ignore_errors=True)
+        for game_type_id, played in zip(self.game_type_ids, (5, 1, 9)):
+            open(os.path.join(folder, game_type_id + '.zip'), 'w').close()
+            GameType.objects.bulk_create([GameType(game_type_id=game_type_id, name=game_type_id, creator='author',
+                                                   creator_display_name='Author', git_url='g', timesPlayed=played)])
+        loaded = []
+        with mock.patch.object(bundles, 'GAME_BUNDLES_FOLDER', folder):
+            bundles.warmup(loaded.append, 2)
+        # the most played is imported last, so it is evicted last
+        self.assertEqual(loaded, [self.game_type_ids[0], self.game_type_ids[2]])
+
+
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        from cavoke_app import ratelimit
+
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder, ignore_errors=True)
+        for patcher in (mock.patch.object(ratelimit, 'RATE_LIMIT_STORE', os.path.join(folder, 'limits.sqlite3')),
+                        mock.patch.dict(ratelimit.RATE_LIMITS, {'test': (2, 3)}, clear=True),
+                        mock.patch.object(ratelimit, '_local', ratelimit.threading.local())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_burst_is_allowed_then_calls_wait_for_refill(self):
+        from cavoke_app.ratelimit import take
+
+        now = time.time()
+        with mock.patch('time.time', return_value=now):
+            self.assertEqual([take('test', 'u1') for _ in range(3)], [0, 0, 0])
+            self.assertAlmostEqual(take('test', 'u1'), 0.5)
+            # other users have their own buckets
+            self.assertEqual(take('test', 'u2'), 0)
+        with mock.patch('time.time', return_value=now + 0.5):
+            self.assertEqual(take('test', 'u1'), 0)
+
+    def test_buckets_are_shared_by_connections(self):
+        import threading
+        from cavoke_app.ratelimit import take
+
+        # every thread has its own connection to the store, as other processes do
+        with mock.patch('time.time', return_value=time.time()):
+            threads = [threading.Thread(target=take, args=('test', 'u1')) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertGreater(take('test', 'u1'), 0)
+
+    def test_limited_view_answers_429_with_retry_after(self):
+        from cavoke_app.errormessages import TOO_MANY_REQUESTS
+        from cavoke_app.ratelimit import rate_limited, throttledCounts
+
+        view = rate_limited('test')(lambda request: 'ok')
+        request = SimpleNamespace(auth={'uid': 'u1'})
+        self.assertEqual([view(request) for _ in range(3)], ['ok'] * 3)
+        response = view(request)
+        self.assertEqual((response.status_code, response.data['message']), (429, TOO_MANY_REQUESTS))
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(throttledCounts(), {'test': 1})
+
+    def test_anonymous_requests_and_unlimited_endpoints_pass(self):
+        from cavoke_app.ratelimit import rate_limited
+
+        self.assertEqual([rate_limited('test')(lambda request: 'ok')(SimpleNamespace(auth=None))
+                          for _ in range(5)], ['ok'] * 5)
+        self.assertEqual([rate_limited('other')(lambda request: 'ok')(SimpleNamespace(auth={'uid': 'u1'}))
+                          for _ in range(5)], ['ok'] * 5)
+
+
+class CatalogIndexTests(TestCase):
+
+    def setUp(self):
+        from cavoke_app.search import CatalogIndex
+
+        # not connected to save signals, like the index of another worker
+        self.index = CatalogIndex()
+
+    def createGameTypes(self, *names: str):
+        from cavoke_app.models import GameType
+
+        GameType.objects.bulk_create([
+            GameType(game_type_id='search{}'.format(name.replace(' ', '')), name=name, creator='author',
+                     creator_display_name='Author', git_url='g') for name in names])
+
+    def names(self, query: str) -> set:
+        from cavoke_app.models import GameType
+
+        names = dict(GameType.objects.values_list('pk', 'name'))
+        return {names[pk] for pk in self.index.search(query)}
+
+    def test_game_types_saved_elsewhere_are_found_after_refresh(self):
+        self.createGameTypes('Chess')
+        self.index.refresh(force=True)
+        self.assertEqual(self.names('chess'), {'Chess'})
+        self.createGameTypes('Chinese checkers')
+        # checked again only after REFRESH_INTERVAL
+        self.assertEqual(self.names('ch'), {'Chess'})
+        self.index.refresh(force=True)
+        self.assertEqual(self.names('ch'), {'Chess', 'Chinese checkers'})
+
+    def test_index_is_rebuilt_when_game_types_were_deleted_elsewhere(self):
+        from cavoke_app.models import GameType
+
+        self.createGameTypes('Chess', 'Checkers')
+        self.index.refresh(force=True)
+        GameType.objects.filter(name='Checkers').delete()
+        self.index.refresh(force=True)
+        self.assertEqual(self.names('ch'), {'Chess'})
+
+    def test_exact_matches_rank_above_prefix_matches(self):
+        from cavoke_app.models import GameType
+
+        self.createGameTypes('Chess', 'Chessboard')
+        self.index.refresh(force=True)
+        pks = dict(GameType.objects.values_list('name', 'pk'))
+        scores = self.index.search('chess')
+        self.assertGreater(scores[pks['Chess']], scores[pks['Chessboard']])
+        self.assertEqual(self.names('chess author'), {'Chess', 'Chessboard'})
+        self.assertEqual(self.names('chess nobody'), set())
+
+
+class PopularityTests(TestCase):
+
+    def setUp(self):
+        from cavoke_app.models import GameType
+        from cavoke_app.popularity import PopularityTracker
+
+        self.tracker = PopularityTracker(background=False)
+        GameType.objects.bulk_create([
+            GameType(game_type_id='popular{}'.format(i), name='Game', creator='author',
+                     creator_display_name='Author', git_url='g') for i in range(2)])
+        self.game_types = list(GameType.objects.filter(game_type_id__startswith='popular').order_by('game_type_id'))
+
+    def test_plays_are_counted_before_and_after_checkpoint(self):
+        from cavoke_app.models import GameType
+
+        first, second = self.game_types
+        for game_type in (first, second, second):
+            # recording a play never queries the database
+            with self.assertNumQueries(0):
+                self.tracker.record(game_type)
+        self.assertEqual(self.tracker.top('week', 2), [(second.pk, 2), (first.pk, 1)])
+        self.assertEqual(GameType.objects.get(pk=second.pk).timesPlayed, 2)
+        self.tracker.record(first)
+        self.tracker.record(first)
+        self.assertEqual(self.tracker.top('day', 1), [(first.pk, 3)])
+
+    def test_failed_checkpoint_is_logged_and_plays_are_kept(self):
+        from django.db import DatabaseError
+        from cavoke_app.models import GameType, GameTypePlays
+
+        game_type = self.game_types[0]
+        self.tracker.record(game_type)
+        with mock.patch.object(GameTypePlays.objects, 'get_or_create', side_effect=DatabaseError), \
+                self.assertLogs('cavoke_app.popularity', 'ERROR'):
+            self.tracker.checkpoint()
+            self.tracker.record(game_type)
+        # totals are loaded anyway, with plays not written counted locally
+        self.assertEqual(self.tracker.top('all', 1), [(game_type.pk, 2)])
+        self.assertEqual(GameType.objects.get(pk=game_type.pk).timesPlayed, 0)
+        self.tracker.checkpoint()
+        self.assertEqual(GameType.objects.get(pk=game_type.pk).timesPlayed, 2)
+        self.assertEqual(self.tracker.top('all', 1), [(game_type.pk, 2)])
+
+    def test_failed_load_leaves_top_empty(self):
+        from django.db import DatabaseError
+
+        with mock.patch('cavoke_app.popularity.GameType.objects.values_list', side_effect=DatabaseError), \
+                self.assertLogs('cavoke_app.popularity', 'ERROR'):
+            self.assertEqual(self.tracker.top('all', 1), [])
+
+
+class ExportImportTests(GameTestCase):
+
+    def test_round_trip_keeps_timestamps_and_game_objects(self):
+        from django.utils import timezone
+        from cavoke_app.export import exportAll, importRecords
+        from cavoke_app.models import GameSession, GameType
+
+        game_session = self.newSession('player')
+        # exported with millisecond precision
+        created_on = (timezone.now() - timezone.timedelta(days=30)).replace(microsecond=0)
+        GameType.objects.filter(pk=self.game_type.pk).update(createdOn=created_on)
+        GameSession.objects.filter(pk=game_session.pk).update(createdOn=created_on)
+        game_object = bytes(GameSession.objects.get(pk=game_session.pk).game_object_bytes)
+        lines = list(exportAll(include_blobs=True))
+        GameType.objects.filter(pk=self.game_type.pk).delete()
+
+        created, skipped, unknown_game_type = importRecords(lines)
+        self.assertEqual((created, skipped, unknown_game_type),
+                         ({'game_type': 1, 'game_session': 1}, {'game_type': 0, 'game_session': 0}, 0))
+        self.assertEqual(GameType.objects.get(game_type_id=self.game_type_id).createdOn, created_on)
+        imported = GameSession.objects.get(game_session_id=game_session.game_session_id)
+        self.assertEqual(imported.createdOn, created_on)
+        self.assertEqual(bytes(imported.game_object_bytes), game_object)
+        # running it again skips everything
+        self.assertEqual(importRecords(lines)[0], {'game_type': 0, 'game_session': 0})
+
+    def test_sessions_of_unknown_game_types_are_skipped(self):
+        import json
+        from cavoke_app.export import exportGameSessions, importRecords
+        from cavoke_app.models import GameSession
+
+        game_session = self.newSession('player')
+        record = json.loads(next(exportGameSessions()))
+        GameSession.objects.filter(pk=game_session.pk).delete()
+        record['fields']['game_type_id'] = 'unknown'
+
+        created, skipped, unknown_game_type = importRecords([json.dumps(record)])
+        self.assertEqual((created['game_session'], skipped['game_session'], unknown_game_type), (0, 0, 1))
+        self.assertFalse(GameSession.objects.filter(game_session_id=game_session.game_session_id).exists())
+
+
+class RevisionTests(TestCase):
+    game_type_id = 'testrevisions'
+
+    def setUp(self):
+        from cavoke_app import bundles, revisions
+        from cavoke_app.config import GAME_TYPES_FOLDER
+        from cavoke_app.models import GameType
+
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder, ignore_errors=True)
+        if not os.path.exists(GAME_TYPES_FOLDER):
+            os.makedirs(GAME_TYPES_FOLDER)
+            self.addCleanup(shutil.rmtree, GAME_TYPES_FOLDER, ignore_errors=True)
+        else:
+            self.addCleanup(shutil.rmtree, revisions.revisionsFolder(self.game_type_id), ignore_errors=True)
+            self.addCleanup(lambda: os.path.lexists(revisions.checkoutPath(self.game_type_id))
+                            and os.remove(revisions.checkoutPath(self.game_type_id)))
+        for patcher in (mock.patch.object(revisions, 'GAME_REPOS_FOLDER', os.path.join(folder, 'repos')),
+                        mock.patch.object(bundles, 'GAME_BUNDLES_FOLDER', os.path.join(folder, 'bundles'))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.source = os.path.join(folder, 'source')
+        os.makedirs(self.source)
+        self.git('init', '--quiet')
+        GameType.objects.bulk_create([GameType(game_type_id=self.game_type_id, name='Game', creator='author',
+                                               creator_display_name='Author', git_url=self.source)])
+        self.game_type = GameType.objects.get(game_type_id=self.game_type_id)
+
+    def git(self, *args) -> str:
+        import subprocess
+
+        return subprocess.check_output(['git', '-C', self.source, '-c', 'user.name=author',
+                                        '-c', 'user.email=author@example.com'] + list(args)).decode().strip()
+
+    def commit(self, version: int) -> str:
+        with open(os.path.join(self.source, '__init__.py'), 'w') as f:
+            f.write('VERSION = {}\n'.format(version))
+        self.git('add', '__init__.py')
+        self.git('commit', '--quiet', '-m', 'version {}'.format(version))
+        return self.git('rev-parse', 'HEAD')
+
+    def test_update_swaps_checkout_and_workers_reload_module(self):
+        from cavoke_app.modulecache import GameModuleCache
+        from cavoke_app.revisions import cloneGameType, currentRevision, revisionsFolder, updateGameType
+
+        first = self.commit(1)
+        self.assertEqual(cloneGameType(self.game_type_id, self.source), first)
+        cache = GameModuleCache(max_count=1, max_memory=None)
+        self.addCleanup(cache.evict, self.game_type_id)
+        self.assertEqual(cache.get(self.game_type_id, first).VERSION, 1)
+
+        second = self.commit(2)
+        self.assertEqual(updateGameType(self.game_type), (first, second))
+        self.assertEqual(currentRevision(self.game_type_id), second)
+        self.game_type.refresh_from_db()
+        self.assertEqual(self.game_type.revision, second)
+        # the previous revision stays for modules imported from it
+        self.assertEqual(set(os.listdir(revisionsFolder(self.game_type_id))), {first, second})
+        self.assertEqual(cache.get(self.game_type_id, second).VERSION, 2)
+
+    def test_update_without_new_commits_keeps_checkout(self):
+        from cavoke_app.revisions import cloneGameType, currentRevision, updateGameType
+
+        first = self.commit(1)
+        cloneGameType(self.game_type_id, self.source)
+        with mock.patch('cavoke_app.revisions.buildBundle') as buildBundle:
+            self.assertEqual(updateGameType(self.game_type), (first, first))
+        buildBundle.assert_not_called()
+        self.assertEqual(currentRevision(self.game_type_id), first)
+
+    def test_old_revisions_are_pruned(self):
+        from cavoke_app import revisions
+        from cavoke_app.revisions import cloneGameType, revisionsFolder, updateGameType
+
+        self.commit(1)
+        cloneGameType(self.game_type_id, self.source)
+        self.commit(2)
+        updateGameType(self.game_type)
+        third = self.commit(3)
+        # KEEP_GAME_REVISIONS is bound as the default of keep
+        with mock.patch.object(revisions._pruneRevisions, '__defaults__', (1,)):
+            updateGameType(self.game_type)
+        self.assertEqual(os.listdir(revisionsFolder(self.game_type_id)), [third])
+
+
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        from cavoke_app.responsecache import ResponseCache
+
+        self.cache = ResponseCache(size=2)
+
+    def test_response_is_computed_once_per_version(self):
+        compute = mock.Mock(side_effect=lambda: {'state': compute.call_count})
+        self.assertEqual(self.cache.get('s1', (1, 'r'), compute), {'state': 1})
+        self.assertEqual(self.cache.get('s1', (1, 'r'), compute), {'state': 1})
+        # new state version or game type revision renders again
+        self.assertEqual(self.cache.get('s1', (2, 'r'), compute), {'state': 2})
+        self.assertEqual(self.cache.get('s1', (2, 'r2'), compute), {'state': 3})
+        self.assertEqual(self.cache.stats(), {'cached': 1, 'hits': 1, 'misses': 3, 'collapsed': 0})
+
+    def test_least_recently_used_sessions_are_dropped(self):
+        for game_session_id in ('s1', 's2', 's1', 's3'):
+            self.cache.get(game_session_id, 1, lambda: game_session_id)
+        compute = mock.Mock(return_value='s2 again')
+        self.assertEqual(self.cache.get('s1', 1, compute), 's1')
+        self.assertEqual(self.cache.get('s2', 1, compute), 's2 again')
+        self.cache.invalidate('s1')
+        self.assertEqual(self.cache.get('s1', 1, compute), 's2 again')
+
+    def test_concurrent_misses_are_collapsed(self):
+        import threading
+
+        started, release = threading.Event(), threading.Event()
+
+        def compute():
+            started.set()
+            release.wait(5)
+            return 'response'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(self.cache.get('s1', 1, compute)))
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=lambda: results.append(self.cache.get('s1', 1, mock.Mock())))
+        follower.start()
+        while self.cache.stats()['collapsed'] == 0:
+            time.sleep(0.001)
+        release.set()
+        leader.join()
+        follower.join()
+        self.assertEqual(results, ['response', 'response'])
+
+    def test_errors_are_not_cached(self):
+        with self.assertRaises(ValueError):
+            self.cache.get('s1', 1, mock.Mock(side_effect=ValueError))
+        self.assertEqual(self.cache.get('s1', 1, lambda: 'response'), 'response')
+
+
+class AdmissionTests(GameTestCase):
+
+    def test_calls_over_game_type_cap_are_rejected(self):
+        from cavoke_app.admission import AdmissionController
+        from cavoke_app.exceptions import OverloadedWarning
+
+        admission = AdmissionController(max_running=2, max_waiting=0, max_wait=0, max_per_type=1)
+        with admission.admit('a'):
+            with self.assertRaises(OverloadedWarning) as raised:
+                with admission.admit('a'):
+                    pass
+            self.assertGreaterEqual(raised.exception.args[0], 1)
+            # other game types still get slots
+            with admission.admit('b'):
+                pass
+        with admission.admit('a'):
+            pass
+        self.assertEqual(admission.stats()['rejected'], {'game_type': 1})
+        self.assertEqual(admission.stats()['in_flight_by_type'], {})
+
+    def test_calls_waiting_too_long_are_rejected(self):
+        from cavoke_app.admission import AdmissionController
+        from cavoke_app.exceptions import OverloadedWarning
+
+        admission = AdmissionController(max_running=1, max_waiting=1, max_wait=0.01, max_per_type=2)
+        with admission.admit('a'):
+            with self.assertRaises(OverloadedWarning):
+                with admission.admit('b'):
+                    pass
+        self.assertEqual(admission.stats()['rejected'], {'timeout': 1})
+        self.assertEqual((admission.stats()['running'], admission.stats()['waiting']), (0, 0))
+
+    def test_rejected_request_gets_503_with_retry_after(self):
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from cavoke_app.admission import AdmissionController
+        from cavoke_app.errormessages import SERVER_OVERLOADED
+        from cavoke_app.models import GameSession
+        from cavoke_app.views import newGameSession
+
+        request = APIRequestFactory().get('/', {'game_type_id': self.game_type_id})
+        force_authenticate(request, token={'uid': 'player'})
+        with mock.patch('cavoke_app.prototypes.game_admission', AdmissionController(max_per_type=0)), \
+                mock.patch.dict('cavoke_app.ratelimit.RATE_LIMITS', clear=True):
+            response = newGameSession(request)
+        self.assertEqual((response.status_code, response.data['message']), (503, SERVER_OVERLOADED))
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(GameSession.objects.filter(player_uid='player').exists())
+
+
+class QuotaReconcileTests(GameTestCase):
+
+    def test_drifted_counters_are_fixed(self):
+        from cavoke_app.models import GameSession, QuotaCounter
+        from cavoke_app.quotas import reconcileQuotas
+
+        kind = QuotaCounter.GAME_SESSIONS
+        for player_uid in ('p1', 'p1', 'p2', 'p3'):
+            self.newSession(player_uid)
+        self.assertEqual(reconcileQuotas(kind), 0)
+        # rows deleted with raw SQL, a counter lost and another one too low
+        GameSession.objects.filter(player_uid='p2')._raw_delete('default')
+        QuotaCounter.objects.filter(kind=kind, owner='p1').delete()
+        QuotaCounter.objects.filter(kind=kind, owner='p3').update(used=0)
+
+        with self.assertLogs('cavoke_app.quotas', 'WARNING'):
+            self.assertEqual(reconcileQuotas(kind), 3)
+        self.assertEqual([QuotaCounter.objects.used(kind, owner) for owner in ('p1', 'p2', 'p3')], [2, 0, 1])
+        self.assertEqual(reconcileQuotas(kind), 0)
+
+    def test_command_reconciles_requested_kinds(self):
+        from io import StringIO
+        from cavoke_app.models import QuotaCounter
+
+        QuotaCounter.objects.filter(kind=QuotaCounter.GAME_TYPES, owner='author').delete()
+        stdout = StringIO()
+        with self.assertLogs('cavoke_app.quotas', 'WARNING'):
+            call_command('reconcilequotas', kind=[QuotaCounter.GAME_TYPES], stdout=stdout)
+        self.assertEqual(stdout.getvalue(), 'Fixed 1 counters of game_types\n')
+        self.assertEqual(QuotaCounter.objects.used(QuotaCounter.GAME_TYPES, 'author'), 1)
+
+
+class ResponseHistoryTests(TestCase):
+
+    def setUp(self):
+        from cavoke_app.deltas import ResponseHistory
+
+        self.history = ResponseHistory(sessions=2, length=2)
+        self.board = {'cells': ['x'] * 50, 'turn': 'o'}
+
+    def test_patch_against_version_client_has(self):
+        from cavoke_app.deltas import diff
+
+        self.assertEqual(self.history.encode('s1', None, '1', self.board), {'game': self.board, 'response_version': '1'})
+        board = dict(self.board, turn='x')
+        self.assertEqual(self.history.encode('s1', '1', '2', board),
+                         {'game_patch': [{'op': 'replace', 'path': '/turn', 'value': 'x'}],
+                          'since_version': '1', 'response_version': '2'})
+        self.assertEqual(self.history.encode('s1', '2', '2', board)['game_patch'], [])
+        self.assertEqual(diff({'a': [1, 2, 3]}, {'a': [1]}),
+                         [{'op': 'remove', 'path': '/a/2'}, {'op': 'remove', 'path': '/a/1'}])
+
+    def test_full_response_when_base_is_unknown_or_patch_is_larger(self):
+        self.history.encode('s1', None, '1', self.board)
+        self.assertIn('game', self.history.encode('s1', '0', '2', self.board))
+        self.assertIn('game', self.history.encode('s2', '1', '1', self.board))
+        self.assertIn('game', self.history.encode('s1', '2', '3', {'other': 1}))
+        # versions older than history length are forgotten
+        self.history.encode('s1', None, '4', self.board)
+        self.assertIn('game', self.history.encode('s1', '2', '4', self.board))
+        self.assertEqual(self.history.stats(), {'sessions': 2, 'deltas': 0, 'full': 6})
+
+    def test_response_other_than_canonical_is_sent_in_full_and_not_recorded(self):
+        clicked = dict(self.board, clicked=True)
+        answer = self.history.encode('s1', None, '1', clicked, self.board)
+        # the client's copy differs from the one recorded for the version, so it has no version to patch against
+        self.assertEqual(answer, {'game': clicked})
+        self.assertEqual(self.history.encode('s1', '1', '1', self.board)['game_patch'], [])
+        # responses equal to the canonical one are patched as usual
+        board = dict(self.board, turn='x')
+        self.assertEqual(self.history.encode('s1', '1', '2', board, dict(board))['response_version'], '2')
+        self.assertIn('game_patch', self.history.encode('s1', '1', '2', board, dict(board)))
+
+
+class ClickResponseTests(GameTestCase):
+    game_code = '''import cavoke
+
+
+class MyGame(cavoke.Game):
+    def __init__(self):
+        super().__init__()
+        self.clicks = 0
+
+    def clickUnitId(self, unit_id):
+        self.clicks += 1
+        return {'clicks': self.clicks, 'clicked': unit_id}
+
+    def getResponse(self):
+        return {'clicks': self.clicks, 'board': list(range(50))}
+'''
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from drf_firebase_auth_cavoke.models import FirebaseUser
+
+        super().setUp()
+        FirebaseUser.objects.create(uid='player', user=User.objects.create(username='player'))
+        self.game_session = self.newSession('player')
+        patcher = mock.patch.dict('cavoke_app.ratelimit.RATE_LIMITS', clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def call(self, view, **params) -> dict:
+        from rest_framework.test import APIRequestFactory, force_authenticate
+
+        request = APIRequestFactory().get('/', dict(params, game_id=self.game_session.game_session_id))
+        force_authenticate(request, token={'uid': 'player'})
+        response = view(request)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data['response']
+
+    def test_click_response_other_than_rendered_one_is_no_patch_base(self):
+        from cavoke_app.views import click, getSession
+
+        polled = self.call(getSession)
+        self.assertEqual(polled['game'], {'clicks': 0, 'board': list(range(50))})
+        clicked = self.call(click, unit_clicked='a', since_version=polled['response_version'])
+        self.assertEqual(clicked, {'game': {'clicks': 1, 'clicked': 'a'}})
+        # the client patches the last version it got from getSession
+        patched = self.call(getSession, since_version=polled['response_version'])
+        self.assertEqual(patched['game_patch'], [{'op': 'replace', 'path': '/clicks', 'value': 1}])
+        self.assertEqual(self.call(getSession, since_version=patched['response_version'])['game_patch'], [])
+
+
+@override_settings(TRAFFIC_CAPTURE_FILE='capture.jsonl', TRAFFIC_CAPTURE_RATE=1.0)
+class TrafficCaptureTests(TestCase):
+
+    def capture(self, path: str, query: dict, uid: str = None, content: dict = None) -> dict:
+        import json
+        from django.http import JsonResponse
+        from cavoke_server.capture import TrafficCaptureMiddleware
+
+        request = RequestFactory().get(path, query)
+        request.auth = {'uid': uid} if uid else None
+        middleware = TrafficCaptureMiddleware(lambda request: JsonResponse(content or {}))
+        with self.assertLogs('cavoke_server.capture', 'INFO') as logs:
+            middleware(request)
+        return json.loads(logs.records[0].getMessage())
+
+    def test_traces_are_pseudonymized(self):
+        from cavoke_server.capture import pseudonym
+
+        trace = self.capture('/v1/getSession/', {'game_id': 'session1', 'since_version': '2', 'token': 'secret'},
+                             'player')
+        self.assertEqual((trace['endpoint'], trace['user'], trace['status']), ('getSession', pseudonym('player'), 200))
+        self.assertEqual(trace['query'], {'game_id': pseudonym('session1'), 'since_version': '2'})
+        self.assertNotIn('player', str(trace))
+        self.assertNotIn('secret', str(trace))
+
+    def test_new_session_trace_names_created_session(self):
+        from cavoke_server.capture import pseudonym
+
+        trace = self.capture('/v1/newSession/', {'game_type_id': 'chess'}, 'player',
+                             {'response': {'game': {'game_session_id': 'session1'}}})
+        self.assertEqual(trace['session'], pseudonym('session1'))
+
+    def test_capture_is_off_without_file(self):
+        from django.core.exceptions import MiddlewareNotUsed
+        from cavoke_server.capture import TrafficCaptureMiddleware
+
+        with self.settings(TRAFFIC_CAPTURE_FILE=''), self.assertRaises(MiddlewareNotUsed):
+            TrafficCaptureMiddleware(lambda request: None)
+
+
+class ReplayTests(TestCase):
+
+    def test_captured_sessions_are_mapped_to_replayed_ones(self):
+        from cavoke_server.replay import Replayer, readTraces, summarize
+
+        lines = [
+            '{"t": 2, "method": "GET", "path": "/v1/getSession/", "endpoint": "getSession", '
+            '"query": {"game_id": "p1"}, "user": "u1", "status": 200, "ms": 5}',
+            '{"t": 1, "method": "GET", "path": "/v1/newSession/", "endpoint": "newSession", '
+            '"query": {"game_type_id": "chess"}, "user": "u1", "status": 200, "ms": 9, "session": "p1"}',
+            '{"t": 3, "method": "GET", "path": "/v1/getSession/", "endpoint": "getSession", '
+            '"query": {"game_id": "p0"}, "user": "u1", "status": 200, "ms": 5}',
+            '{"t": 4, "method": "GET", "path": "/v1/approveGame/", "endpoint": "approveGame", '
+            '"query": {}, "user": null, "status": 200, "ms": 5}',
+        ]
+        traces = readTraces(lines)
+        self.assertEqual([trace['endpoint'] for trace in traces], ['newSession', 'getSession', 'getSession'])
+
+        http = mock.Mock()
+        http.request.return_value.status_code = 200
+        http.request.return_value.json.return_value = {'response': {'game': {'game_session_id': 'replayed1'}}}
+        replayer = Replayer('http://target/', speed=0, workers=2)
+        with mock.patch.object(Replayer, '_Replayer__http', return_value=http):
+            results = replayer.run(traces)
+        self.assertEqual(replayer.skipped, 1)
+        self.assertEqual(len(results), 2)
+        http.request.assert_any_call('GET', 'http://target/v1/getSession/', params={'game_id': 'replayed1'},
+                                     headers={'Authorization': 'Stub u1'}, timeout=replayer.timeout)
+        self.assertEqual(summarize(results)['getSession']['errors'], 0)
+
+    def test_stub_authentication_is_refused_in_production(self):
+        import subprocess
+        import sys
+        from django.conf import settings
+
+        process = subprocess.run([sys.executable, '-c', 'import cavoke_server.settings'], cwd=settings.BASE_DIR,
+                                 env=dict(os.environ, CAVOKE_STUB_AUTH='1'), capture_output=True)
+        self.assertNotEqual(process.returncode, 0)
+        self.assertIn(b'CAVOKE_STUB_AUTH=1 requires DEBUG', process.stderr)
+
+    def test_stub_authentication_creates_local_user(self):
+        from cavoke_app.authentication import StubAuthentication
+
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION='Stub u1')
+        user, auth = StubAuthentication().authenticate(request)
+        self.assertEqual((user.username, auth), ('u1', {'uid': 'u1'}))
+        self.assertEqual(StubAuthentication().authenticate(request)[0], user)
+        self.assertIsNone(StubAuthentication().authenticate(RequestFactory().get('/', HTTP_AUTHORIZATION='JWT x')))
+
+
+class FakeGamesQuery:
+    """
+    Stands in for Firestore query of author's games, ordered descending by createdOn and id
+    """
+
+    def __init__(self, games: dict, position: tuple = None, count: int = None):
+        self.games = games
+        self.position = position
+        self.count = count
+
+    def order_by(self, field, direction=None):
+        return self
+
+    def start_after(self, position: dict):
+        return FakeGamesQuery(self.games, (position['createdOn'], position.get('__name__')), self.count)
+
+    def limit(self, count: int):
+        return FakeGamesQuery(self.games, self.position, count)
+
+    def stream(self):
+        docs = sorted(self.games.items(), key=lambda item: (item[1]['createdOn'], item[0]), reverse=True)
+        if self.position is not None:
+            # cursors without id start after every game created at that time
+            created_on, game_type_id = self.position
+            docs = [(id_, game) for id_, game in docs if (game['createdOn'], id_) < (created_on, game_type_id or '')]
+        return [SimpleNamespace(id=id_, get=game.get, to_dict=lambda game=game: dict(game))
+                for id_, game in docs[:self.count]]
+
+
+class AuthorPaginationTests(TestCase):
+
+    def setUp(self):
+        from datetime import datetime, timezone
+
+        moment = datetime(2021, 5, 1, 12, 0, 0, 123456, tzinfo=timezone.utc)
+        # three games share createdOn, as batched writes give them
+        self.games = {'g{}'.format(i): {'game_type_id': 'g{}'.format(i), 'createdOn': moment.replace(second=i // 3)}
+                      for i in range(7)}
+        patcher = mock.patch('cavoke_app.authors.authorGames', return_value=FakeGamesQuery(self.games))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_pages_cover_every_game_once(self):
+        from cavoke_app.authors import AUTHORED_GAMES, readAuthorGames
+
+        seen, cursor = [], None
+        while True:
+            page, cursor = readAuthorGames('author', AUTHORED_GAMES, 2, cursor)
+            seen.extend(game['game_type_id'] for game in page)
+            if cursor is None:
+                break
+        self.assertEqual(seen, ['g6', 'g5', 'g4', 'g3', 'g2', 'g1', 'g0'])
+        self.assertEqual(len(readAuthorGames('author', AUTHORED_GAMES)[0]), 7)
+
+    def test_cursor_round_trip(self):
+        from cavoke_app.authors import makeCursor, parseCursor
+
+        game = self.games['g4']
+        cursor = makeCursor(SimpleNamespace(id='g4', get=game.get))
+        self.assertEqual(parseCursor(cursor), (game['createdOn'], 'g4'))
+        # cursors made before ids were added
+        self.assertEqual(parseCursor(cursor.partition('.')[0]), (game['createdOn'], None))
+        with self.assertRaises(ValueError):
+            parseCursor('x.g4')
+
+    def test_author_query(self):
+        from cavoke_app.authors import AUTHOR_GAMES, AUTHORED_GAMES
+        from cavoke_app.config import AUTHOR_GAMES_PAGE_SIZE
+        from cavoke_app.exceptions import RequestRejectedWarning
+        from cavoke_app.views import authorQuery
+
+        # clients, that don't paginate, get every game
+        self.assertEqual(authorQuery({}), (AUTHOR_GAMES, None, {kind: None for kind in AUTHOR_GAMES}))
+        self.assertEqual(authorQuery({'kind': AUTHORED_GAMES, AUTHORED_GAMES + '_cursor': '1.g1'}),
+                         ((AUTHORED_GAMES,), AUTHOR_GAMES_PAGE_SIZE, {AUTHORED_GAMES: '1.g1'}))
+        for data in ({'kind': 'other'}, {'limit': '0'}, {'limit': 'x'}, {AUTHORED_GAMES + '_cursor': 'x'}):
+            with self.assertRaises(RequestRejectedWarning):
+                authorQuery(data)
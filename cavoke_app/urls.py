@@ -13,22 +13,34 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.urls import path, include
 from cavoke_app import views
 
+if settings.ASYNC_VIEWS:
+    from cavoke_app import async_views as io_views
+else:
+    io_views = views
+
 
 # Wire up our API using automatic URL routing.
 # Additionally, we include login URLs for the browsable API.
 urlpatterns = [
     path('health/', views.health),
     path('newSession/', views.newGameSession),
-    path('newGameType/', views.newGameType),
+    path('newGameType/', io_views.newGameType),
     path('adminMethods/approveGame/', views.approveGame),
     path('adminMethods/declineGame/', views.declineGame),
-    path('getAuthor/', views.getAuthor),
+    path('adminMethods/bulkModerate/', views.bulkModerate),
+    path('adminMethods/stats/', views.stats),
+    path('adminMethods/updateGame/', views.updateGame),
+    path('adminMethods/export/', views.export),
+    path('getAuthor/', io_views.getAuthor),
     path('getSessions/', views.getSessions),
     path('getSession/', views.getSession),
     path('click/', views.click),
     path('dragTo/', views.dragTo),
-    path('getTypes/', views.getTypes)
+    path('getTypes/', views.getTypes),
+    path('searchTypes/', views.searchTypes),
+    path('getPopular/', views.getPopular)
 ]
@@ -9,17 +9,32 @@ from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
 from django.db.models import QuerySet
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
 from drf_firebase_auth_cavoke.models import FirebaseUser
-from google.cloud.firestore_v1 import ArrayUnion, ArrayRemove
-from rest_framework.decorators import api_view, authentication_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from rest_framework.status import *
 
 from cavoke_server import db, notifyAdmin
-from .models import GameSession, GameType
+from cavoke_server.routers import replica_reads
+from .models import GameSession, GameType, Profile, QuotaCounter
+from .bundles import buildBundle
+from .revisions import updateGameType
+from .modulecache import game_module_cache
+from .responsecache import response_cache
+from .admission import game_admission, overloadedResponse
+from .authors import authorGameRef, moderatedGameWrites, commitWrites, readAuthorGames, parseCursor, \
+    AUTHOR_GAMES, PENDING_GAMES
+from .deltas import response_history, responseVersion
+from .summaries import gameSummary
+from .ratelimit import rate_limited, throttledCounts
+from .moderation import moderate
+from .search import searchGameTypes, SORT_RELEVANCE, SORT_TIMES_PLAYED, SORT_CREATED_ON
+from .popularity import popularity_tracker, WINDOWS, WINDOW_WEEK
+from .export import exportGameTypes, exportGameSessions, exportAll
 from .serializers import *
 from .errormessages import *
 from .exceptions import *
@@ -41,6 +56,7 @@ def health(request):
 
 
 @api_view(["GET"])
+@rate_limited('newSession')
 def newGameSession(request):
     """
     Creates new game session for an authenticated user.
@@ -62,11 +78,16 @@ def newGameSession(request):
         gs.save()
     except TooManyGameSessionsWarning:
         return error_response(MAX_GAME_SESSIONS, HTTP_400_BAD_REQUEST)
+    except OverloadedWarning as e:
+        return overloadedResponse(e.args[0])
+    except TimeoutError:
+        return error_response(TIMEOUT_ERROR, HTTP_500_INTERNAL_SERVER_ERROR)
     except Exception as e:
-        logger.error(str(e))
+        logger.error("Creating game session failed: %s", e, extra={'uid': uid, 'game_type_id': game_type_id})
         return error_response("Error occurred when processing the input data.", HTTP_400_BAD_REQUEST)
 
-    logger.info("New Game Session started by " + uid)
+    logger.info("New game session started by %s", uid, extra={'uid': uid, 'game_type_id': game_type_id})
+    popularity_tracker.record(gs.game_type)
 
     return ok_response({"game": GameSessionSerializer(gs).data})
 
@@ -87,6 +108,28 @@ def newGameType(request):
 
     # get query params
     data = parse(request.query_params)
+    try:
+        rdict, modtoken = prepareGameType(uid, data)
+    except RequestRejectedWarning as e:
+        return error_response(*e.args)
+
+    savePendingGame(rdict, modtoken)
+    addPendingToUser(uid, rdict)
+
+    # notify moderator
+    host = request._request._current_scheme_host
+    notifyAdmin(moderationMessage(rdict, modtoken, host))
+
+    return ok_response(rdict)
+
+
+def prepareGameType(uid: str, data: dict) -> tuple:
+    """
+    Validates new game type and takes a slot from author's limit. Touches only the database
+    :param uid: uid of author
+    :param data: parsed query with parameters for GameType constructor
+    :return: tuple of (dict with game type info, token for moderator)
+    """
     user = userByUID(uid)
     data['creator'] = uid
     data['creator_display_name'] = user.username
@@ -98,66 +141,76 @@ def newGameType(request):
     # create model
     gts = GameTypeSerializer(data=data)
     if not gts.is_valid():
-        return error_response(NOT_ENOUGH_PARAMS, HTTP_400_BAD_REQUEST)
+        raise RequestRejectedWarning(NOT_ENOUGH_PARAMS, HTTP_400_BAD_REQUEST)
     gt = gts.createInstance()
 
-    # check if author hasn't got too many games
-    if user.profile.gamesMadeCount >= user.profile.gamesMadeMaxCount:
-        return error_response(AUTHOR_MAX_GAMES, HTTP_400_BAD_REQUEST)
-    user.profile.gamesMadeCount += 1
-    user.profile.lastGameCreatedOn = timezone.now()
-    user.save()
-
-    # gen token for moderator
-    modtoken = randomUUID()
-
-    gameId = gt.game_type_id
-    gitUrl = gt.git_url
-
     # check if valid url
     try:
-        validator(gitUrl)
-        if gitUrl[-4:] != '.git':
-            raise ValidationError
+        validator(gt.git_url)
+        if gt.git_url[-4:] != '.git':
+            raise ValidationError(WRONG_URL)
     except ValidationError:
-        return error_response(WRONG_URL, HTTP_400_BAD_REQUEST)
+        raise RequestRejectedWarning(WRONG_URL, HTTP_400_BAD_REQUEST)
+
+    # take a slot from author's limit, if author hasn't got too many games
+    if not QuotaCounter.objects.acquire(QuotaCounter.SUBMISSIONS, uid, user.profile.gamesMadeMaxCount):
+        raise RequestRejectedWarning(AUTHOR_MAX_GAMES, HTTP_400_BAD_REQUEST)
+    Profile.objects.filter(pk=user.profile.pk).update(lastGameCreatedOn=timezone.now())
+
+    # gen token for moderator
+    modtoken = randomUUID()
 
     # prepare dict with game type info
     rdict = GameTypeSerializer(gt).data
 
     # INFO we do this as gt.save() wasn't called yet and createdOn isn't initialized
     rdict['createdOn'] = timezone.now()
+    return rdict, modtoken
+
 
+def savePendingGame(rdict: dict, modtoken: str):
+    """
+    Saves game type with moderator token to pending games in Firestore
+    :param rdict: dict with game type info
+    :param modtoken: token for moderator
+    """
     # add modtoken to copy of rdict
     secret_rdict = rdict.copy()
     secret_rdict['modtoken'] = modtoken
     # save secret rdict
-    db.collection('pending_games').document(gameId).set(secret_rdict)
+    db.collection('pending_games').document(rdict['game_type_id']).set(secret_rdict)
 
-    # add game to pending games
-    doc_ref = db.collection('users').document(uid)
-    if doc_ref.get()._exists:
-        doc_ref.update({'pending_games': ArrayUnion([rdict])})
-    else:
-        doc_ref.set({'pending_games': [rdict]})
 
-    # notify moderator
-    host = request._request._current_scheme_host
-    # TODO improve security
-    message = ('New game for moderation check:'
-               '\n\n' +
-               str(rdict) +
-               '\n\n'
-               'https://console.firebase.google.com/project/cavoke-firebase/database/firestore/'
-               'data~2Fpending_games~2F' + gameId +
-               '\n\n'
-               'To **approve** click ' + host + '/v1/adminMethods/approveGame?game_type_id=' + gameId + '&token=' + modtoken +
-               '\n'
-               'To **decline** click ' + host + '/v1/adminMethods/declineGame?game_type_id=' + gameId + '&token=' + modtoken
-               )
-    notifyAdmin(message)
+def addPendingToUser(uid: str, rdict: dict):
+    """
+    Adds game type to author's pending games in Firestore
+    :param uid: uid of author
+    :param rdict: dict with game type info
+    """
+    authorGameRef(uid, PENDING_GAMES, rdict['game_type_id']).set(rdict)
 
-    return ok_response(rdict)
+
+def moderationMessage(rdict: dict, modtoken: str, host: str) -> str:
+    """
+    Makes message for moderator about new game type
+    :param rdict: dict with game type info
+    :param modtoken: token for moderator
+    :param host: scheme and host of this server
+    :return: message
+    """
+    gameId = rdict['game_type_id']
+    # TODO improve security
+    return ('New game for moderation check:'
+            '\n\n' +
+            str(rdict) +
+            '\n\n'
+            'https://console.firebase.google.com/project/cavoke-firebase/database/firestore/'
+            'data~2Fpending_games~2F' + gameId +
+            '\n\n'
+            'To **approve** click ' + host + '/v1/adminMethods/approveGame?game_type_id=' + gameId + '&token=' + modtoken +
+            '\n'
+            'To **decline** click ' + host + '/v1/adminMethods/declineGame?game_type_id=' + gameId + '&token=' + modtoken
+            )
 
 
 @api_view(["GET"])
@@ -187,20 +240,21 @@ def approveGame(request):
     if gdict['modtoken'] != modtoken:
         return error_response(WRONG_TOKEN, HTTP_403_FORBIDDEN)
 
-    # get uid
-    uid = gdict['creator']
-
     # save game type to database
     serializer = GameTypeSerializer(data=gdict)
     if not serializer.is_valid():
         return error_response(ERROR_OCCURRED, HTTP_500_INTERNAL_SERVER_ERROR)
     serializer.save()
 
+    # precompile game for fast cold imports
+    try:
+        buildBundle(game_type_id)
+    except Exception as e:
+        logger.error("Building bundle of {%s} failed! Details: {%s}", game_type_id, e)
+
     # save stats for user
     gdict.pop('modtoken')
-    db.collection('pending_games').document(game_type_id).delete()
-    db.collection('users').document(uid).update({u'pending_games': ArrayRemove([gdict])})
-    db.collection('users').document(uid).update({u'authored_games': ArrayUnion([gdict])})
+    commitWrites(moderatedGameWrites(game_type_id, gdict, True))
 
     return ok_response(gdict)
 
@@ -234,46 +288,106 @@ def declineGame(request):
     uid = gdict['creator']
 
     # save stats
-    db.collection('pending_games').document(game_type_id).delete()
-    db.collection('users').document(uid).update({u'pending_games': ArrayRemove([gdict])})
+    gdict.pop('modtoken')
+    commitWrites(moderatedGameWrites(game_type_id, gdict, False))
 
     # free up the slot for game
-    # TODO make atomic
-    user = userByUID(uid)
-    user.profile.gamesMadeCount -= 1
-    user.save()
+    QuotaCounter.objects.release(QuotaCounter.SUBMISSIONS, uid)
 
     return ok_response()
 
 
+@api_view(["POST"])
+@authentication_classes(())
+def bulkModerate(request):
+    """
+    Approves and declines many games for moderator
+    :param request: request with json body {"decisions": [{"game_type_id": ..., "token": ..., "decision": "approve"/"decline"}]}
+    :return: response with result for each decision
+    """
+    # get body
+    try:
+        decisions = list(request.data['decisions'])
+    except (KeyError, TypeError):
+        return error_response(NOT_ENOUGH_PARAMS, HTTP_400_BAD_REQUEST)
+
+    return ok_response({"results": moderate(decisions)})
+
+
 @api_view(["GET"])
+@replica_reads
 def getAuthor(request):
     """
     Gets info about authored games, that authenticated user has made.
-    :param request: request
-    :return: response
+    :param request: request with optional kind (authored_games or pending_games), limit
+    and authored_games_cursor/pending_games_cursor returned with previous page, all games are returned without both
+    :return: response with pages of games and cursors of next pages (null after the last one)
     """
     # get id
     uid = request.auth["uid"]
 
-    # get data
-    gdoc = db.collection('users').document(uid).get()
-    gdict = gdoc.to_dict() if gdoc.to_dict() else {}
-    f = lambda b: tryGetListFromDict(gdict, b)
-    authored, pending = f("authored_games"), f("pending_games")
+    # get query
+    try:
+        kinds, limit, cursors = authorQuery(parse(request.query_params))
+    except RequestRejectedWarning as e:
+        return error_response(*e.args)
 
-    return ok_response({
-        "authored_games": authored,
-        "pending_games": pending
-    })
+    return ok_response(readAuthor(uid, kinds, limit, cursors))
+
+
+def authorQuery(data: dict) -> tuple:
+    """
+    Validates query of getAuthor
+    :param data: parsed query
+    :return: tuple of (kinds of games to read, page size or None for all games, dict of kind to cursor)
+    """
+    kind = data.get('kind')
+    if kind is not None and kind not in AUTHOR_GAMES:
+        raise RequestRejectedWarning(WRONG_AUTHOR_GAMES, HTTP_400_BAD_REQUEST)
+    kinds = (kind,) if kind is not None else AUTHOR_GAMES
+    cursors = {}
+    for kind in kinds:
+        cursor = data.get(kind + '_cursor')
+        if cursor is not None:
+            try:
+                parseCursor(cursor)
+            except (ValueError, OverflowError):
+                raise RequestRejectedWarning(WRONG_CURSOR, HTTP_400_BAD_REQUEST)
+        cursors[kind] = cursor
+    # clients, that don't paginate, get all games as before
+    if 'limit' not in data and all(cursor is None for cursor in cursors.values()):
+        return kinds, None, cursors
+    try:
+        limit = min(int(data.get('limit', AUTHOR_GAMES_PAGE_SIZE)), MAX_AUTHOR_GAMES_PAGE_SIZE)
+    except ValueError:
+        raise RequestRejectedWarning(NOT_ENOUGH_PARAMS, HTTP_400_BAD_REQUEST)
+    if limit < 1:
+        raise RequestRejectedWarning(NOT_ENOUGH_PARAMS, HTTP_400_BAD_REQUEST)
+    return kinds, limit, cursors
+
+
+def readAuthor(uid: str, kinds: tuple, limit: int, cursors: dict) -> dict:
+    """
+    Reads pages of authored and pending games of user from Firestore
+    :param uid: user's uid
+    :param kinds: kinds of games to read
+    :param limit: page size, all games if None
+    :param cursors: dict of kind to cursor of page
+    :return: dict with games and cursor of next page of every kind
+    """
+    author = {}
+    for kind in kinds:
+        author[kind], author[kind + '_cursor'] = readAuthorGames(uid, kind, limit, cursors.get(kind))
+    return author
 
 
 @api_view(["GET"])
+@rate_limited('click')
 def click(request):
     """
     Click on unit in game session
-    :param request: request with game_id and unit_clicked
-    :return: response
+    :param request: request with game_id, unit_clicked and optional since_version of response client has
+    :return: response with game or game_patch against since_version
     """
     # get uid
     uid = request.auth["uid"]
@@ -283,12 +397,13 @@ def click(request):
     try:
         gameId = str(data['game_id'])
         unitClicked = str(data['unit_clicked'])
+        sinceVersion = data.get('since_version')
     except KeyError:
         return error_response(NOT_ENOUGH_PARAMS, HTTP_400_BAD_REQUEST)
 
     # check if user is the owner
     try:
-        gs = GameSession.objects.get(game_session_id=gameId)
+        gs = GameSession.objects.locate(gameId, uid)
     except GameSession.DoesNotExist:
         return error_response(GAME_NOT_FOUND, HTTP_400_BAD_REQUEST)
     if gs.player_uid != uid:
@@ -297,10 +412,18 @@ def click(request):
     # stats
     user = userByUID(uid)
     user.profile.lastPlayedOn = timezone.now()
+    gs.touch()
 
-    # try clicking
+    # try clicking, if there is a free slot for game code
     try:
-        response = run_with_limited_time(gs.getCavokeGame().clickUnitId, (unitClicked,))
+        with game_admission.admit(gs.game_type.game_type_id):
+            game = gs.getCavokeGame()
+            response = run_with_limited_time(game.clickUnitId, (unitClicked,))
+            summary = gameSummary(game)
+            # what getSession renders for the new state, so both endpoints give clients the same payload per version
+            rendered = run_with_limited_time(game.getResponse, ())
+    except OverloadedWarning as e:
+        return overloadedResponse(e.args[0])
     except cavoke.exceptions.UnitNotFoundError:
         # if unit wasn't found
         return error_response(UNIT_NOT_FOUND, HTTP_400_BAD_REQUEST)
@@ -310,10 +433,20 @@ def click(request):
     except Exception as e:
         # anything else
         message = "Error occurred during game code execution: [" + str(e) + "]. Contact developer"
-        logger.error(message)
+        logger.error("Game code failed in click: %s", e,
+                     extra={'game_type_id': gs.game_type.game_type_id, 'game_session_id': gameId})
         return error_response(message, HTTP_500_INTERNAL_SERVER_ERROR)
 
-    return ok_response({"game": response})
+    # save new state, so polls see it
+    try:
+        gs.saveGameState(summary)
+    except StateConflictWarning:
+        return error_response(STATE_CONFLICT, HTTP_409_CONFLICT)
+
+    # the next poll of the new state is served from cache
+    response_cache.get(gs.game_session_id, (gs.state_version, gs.game_type.revision), lambda: rendered)
+    version = responseVersion(gs.state_version, gs.game_type.revision)
+    return ok_response(response_history.encode(gs.game_session_id, sinceVersion, version, response, rendered))
 
 
 @api_view(["GET"])
@@ -327,6 +460,7 @@ def dragTo(request):
 
 
 @api_view(["GET"])
+@replica_reads
 def getSessions(request):
     """
     Gets all sessions for an authenticated user
@@ -336,19 +470,20 @@ def getSessions(request):
     # get uid
     uid = request.auth["uid"]
 
-    # get data
-    gs_list = list(GameSession.objects.filter(player_uid=uid))
+    # get data, summaries are stored, so game objects aren't loaded
+    gs_list = GameSession.objects.forPlayer(uid, defer=('game_object_bytes',))
     gs_info_list = [GameSessionSerializer(gs).data for gs in gs_list]
 
     return ok_response({'game_sessions': gs_info_list})
 
 
 @api_view(["GET"])
+@rate_limited('getSession')
 def getSession(request):
     """
     Gets info about a specific game session
-    :param request: request with game_id
-    :return: response
+    :param request: request with game_id and optional since_version of response client has
+    :return: response with game or game_patch against since_version
     """
     # get uid
     uid = request.auth["uid"]
@@ -357,12 +492,14 @@ def getSession(request):
     data = parse(request.query_params)
     try:
         gameId = str(data['game_id'])
+        sinceVersion = data.get('since_version')
     except KeyError:
         return error_response(NOT_ENOUGH_PARAMS, HTTP_400_BAD_REQUEST)
 
     # check if user is the owner
+    # game object is loaded only if its response isn't cached
     try:
-        gs = GameSession.objects.get(game_session_id=gameId)
+        gs = GameSession.objects.locate(gameId, uid, defer=('game_object_bytes',))
     except GameSession.DoesNotExist:
         return error_response(GAME_NOT_FOUND, HTTP_400_BAD_REQUEST)
     if gs.player_uid != uid:
@@ -371,24 +508,36 @@ def getSession(request):
     # stats
     user = userByUID(uid)
     user.profile.lastPlayedOn = timezone.now()
+    gs.touch()
 
-    # try getting response from cavoke.Game
+    def render():
+        with game_admission.admit(gs.game_type.game_type_id):
+            return run_with_limited_time(gs.getCavokeGame().getResponse, ())
+
+    # try getting response from cavoke.Game, unless it is cached for this state
     try:
-        response = run_with_limited_time(gs.getCavokeGame().getResponse, ())
+        response = response_cache.get(gs.game_session_id, (gs.state_version, gs.game_type.revision), render)
+    except OverloadedWarning as e:
+        return overloadedResponse(e.args[0])
     except TimeoutError:
         # in case of timeout, but how?
         return error_response(TIMEOUT_ERROR, HTTP_500_INTERNAL_SERVER_ERROR)
     except Exception as e:
         # in case of any other error, but hOw??
         message = "Error occurred during game code execution: [" + str(e) + "]. Contact the developer."
-        logger.error(message)
+        logger.error("Game code failed in getSession: %s", e,
+                     extra={'game_type_id': gs.game_type.game_type_id, 'game_session_id': gameId})
         return error_response(message, HTTP_500_INTERNAL_SERVER_ERROR)
 
-    return ok_response({"data": GameSessionSerializer(gs).data, "game": response})
+    version = responseVersion(gs.state_version, gs.game_type.revision)
+    answer = response_history.encode(gs.game_session_id, sinceVersion, version, response)
+    answer["data"] = GameSessionSerializer(gs).data
+    return ok_response(answer)
 
 
 @api_view(["GET"])
 @authentication_classes(())
+@replica_reads
 def getTypes(request):
     """
     Gets available types for playing
@@ -397,4 +546,133 @@ def getTypes(request):
     """
     return ok_response({'game_types': GameTypeSerializer(GameType.objects.all(), many=True).data})
 
+
+@api_view(["GET"])
+@authentication_classes(())
+def getPopular(request):
+    """
+    Gets the most played types over a window
+    :param request: request with optional window (day, week, all) and k
+    :return: response
+    """
+    # get query
+    data = parse(request.query_params)
+    window = str(data.get('window', WINDOW_WEEK))
+    if window not in WINDOWS:
+        return error_response(WRONG_WINDOW, HTTP_400_BAD_REQUEST)
+    try:
+        k = max(min(int(data.get('k', 10)), MAX_POPULAR_GAMES), 0)
+    except ValueError:
+        return error_response(NOT_ENOUGH_PARAMS, HTTP_400_BAD_REQUEST)
+
+    top = popularity_tracker.top(window, k)
+    game_types = GameType.objects.in_bulk([pk for pk, plays in top])
+    result = []
+    for pk, plays in top:
+        if pk in game_types:
+            gdict = GameTypeSerializer(game_types[pk]).data
+            gdict['plays'] = plays
+            result.append(gdict)
+    return ok_response({'window': window, 'game_types': result})
+
+
+@api_view(["GET"])
+@authentication_classes(())
+@replica_reads
+def searchTypes(request):
+    """
+    Searches available types by name, description and creator's name
+    :param request: request with q and optional creator, sort (relevance, timesPlayed, createdOn) and limit
+    :return: response
+    """
+    # get query
+    data = parse(request.query_params)
+    query = str(data.get('q', ''))
+    creator = data.get('creator')
+    sort = str(data.get('sort', SORT_RELEVANCE))
+    if sort not in (SORT_RELEVANCE, SORT_TIMES_PLAYED, SORT_CREATED_ON):
+        return error_response(WRONG_SORT, HTTP_400_BAD_REQUEST)
+    try:
+        limit = min(int(data.get('limit', MAX_SEARCH_RESULTS)), MAX_SEARCH_RESULTS)
+    except ValueError:
+        return error_response(NOT_ENOUGH_PARAMS, HTTP_400_BAD_REQUEST)
+    if limit < 1:
+        return error_response(NOT_ENOUGH_PARAMS, HTTP_400_BAD_REQUEST)
+
+    game_types = searchGameTypes(query, creator, sort, limit)
+    return ok_response({'game_types': GameTypeSerializer(game_types, many=True).data})
+
+
+@api_view(["GET"])
+@permission_classes((IsAdminUser,))
+def stats(request):
+    """
+    Gets worker, rate limiting and admission statistics for admins
+    :param request: request
+    :return: response
+    """
+    return ok_response({
+        'throttled': throttledCounts(),
+        'game_modules': game_module_cache.stats(),
+        'game_responses': response_cache.stats(),
+        'game_code_admission': game_admission.stats(),
+        'response_history': response_history.stats(),
+    })
+
+
+@api_view(["GET"])
+@permission_classes((IsAdminUser,))
+def updateGame(request):
+    """
+    Fetches new commits of game type and swaps its new revision in for admins. Workers reload it lazily
+    :param request: request with game_type_id
+    :return: response
+    """
+    data = parse(request.query_params)
+    try:
+        game_type_id = str(data['game_type_id'])
+    except KeyError:
+        return error_response(NOT_ENOUGH_PARAMS, HTTP_400_BAD_REQUEST)
+    try:
+        gt = GameType.objects.get(game_type_id=game_type_id)
+    except GameType.DoesNotExist:
+        return error_response(GAME_NOT_FOUND, HTTP_400_BAD_REQUEST)
+
+    try:
+        previous, revision = updateGameType(gt)
+    except Exception as e:
+        logger.error("Update of {%s} failed! Details: {%s}", game_type_id, e)
+        return error_response(ERROR_OCCURRED, HTTP_500_INTERNAL_SERVER_ERROR)
+
+    return ok_response({
+        'game_type_id': game_type_id,
+        'previous_revision': previous,
+        'revision': revision,
+        'updated': previous != revision,
+    })
+
+
+@api_view(["GET"])
+@permission_classes((IsAdminUser,))
+def export(request):
+    """
+    Streams game types and/or game sessions as NDJSON for admins
+    :param request: request with optional what (types, sessions, all) and blobs (1 to include game objects)
+    :return: streaming response
+    """
+    data = parse(request.query_params)
+    what = str(data.get('what', 'all'))
+    include_blobs = str(data.get('blobs', '0')) == '1'
+    if what == 'types':
+        lines = exportGameTypes()
+    elif what == 'sessions':
+        lines = exportGameSessions(include_blobs)
+    elif what == 'all':
+        lines = exportAll(include_blobs)
+    else:
+        return error_response(WRONG_EXPORT, HTTP_400_BAD_REQUEST)
+    response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="cavoke-' + what + '.ndjson"'
+    return response
+
 # TODO delete game session
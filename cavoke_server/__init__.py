@@ -1,12 +1,10 @@
 import logging
 import os
 import sys
+import threading
 from logging import NullHandler
 
-import firebase_admin
-import requests
 import urllib.parse as urlparse
-from firebase_admin import credentials, firestore
 
 from cavoke_server.settings import SECRET_PATH
 from cavoke_server.secret.secret_settings import TELEGRAM_BOT_CHAT, TELEGRAM_BOT_TOKEN, FIREBASE_JSON_FILE
@@ -18,13 +16,49 @@ __version__ = "0.0.1"
 
 logging.getLogger(__name__).addHandler(NullHandler())
 
-# initialize firebase
-try:
-    cred = credentials.Certificate(os.path.join(SECRET_PATH, FIREBASE_JSON_FILE))
-    firebase_admin.initialize_app(cred)
-except ValueError:
-    pass
-db = firestore.client()
+# firebase is initialized on first use, so processes, that never touch Firestore, don't import it
+_firestore_client = None
+_firestore_lock = threading.Lock()
+
+
+def firestoreClient():
+    """
+    Gets Firestore client, initializing firebase app on first call
+    :return: google.cloud.firestore.Client
+    """
+    global _firestore_client
+    if _firestore_client is None:
+        with _firestore_lock:
+            if _firestore_client is None:
+                import firebase_admin
+                from firebase_admin import credentials, firestore
+                try:
+                    cred = credentials.Certificate(os.path.join(SECRET_PATH, FIREBASE_JSON_FILE))
+                    firebase_admin.initialize_app(cred)
+                except ValueError:
+                    pass
+                _firestore_client = firestore.client()
+    return _firestore_client
+
+
+class LazyFirestore:
+    """
+    Stands in for Firestore client and creates it on first attribute access
+    """
+
+    def __getattr__(self, name):
+        return getattr(firestoreClient(), name)
+
+
+db = LazyFirestore()
+
+
+def DeleteField():
+    """
+    Gets google.cloud.firestore_v1.DELETE_FIELD, importing it on first use
+    """
+    from google.cloud.firestore_v1 import DELETE_FIELD
+    return DELETE_FIELD
 
 
 def add_stderr_logger(level=logging.DEBUG):
@@ -51,6 +85,8 @@ def notifyAdmin(message: str):
     Notifies moderator(-s)
     :param message: message to send
     """
+    import requests
+
     # send message via telegram
     try:
         telegram_request = requests.get(
@@ -0,0 +1,27 @@
+"""
+ASGI config for cavoke_server project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+I/O-bound views are served by their async versions from cavoke_app.async_views.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cavoke_server.settings')
+os.environ.setdefault('CAVOKE_ASYNC_VIEWS', '1')
+
+application = get_asgi_application()
+
+# import game modules before the first request
+from cavoke_app.config import WARMUP_GAME_BUNDLES  # noqa: E402
+
+if WARMUP_GAME_BUNDLES:
+    from cavoke_app.bundles import warmup
+    from cavoke_app.modulecache import game_module_cache
+    # no more modules than stay loaded
+    warmup(game_module_cache.get, game_module_cache.max_count)
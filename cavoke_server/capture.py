@@ -0,0 +1,106 @@
+"""
+Capture of request traces for replaying real traffic against other builds (see replaytraffic command).
+
+If settings.TRAFFIC_CAPTURE_FILE is set, TrafficCaptureMiddleware writes a JSON line per request with its path,
+query params, user, status and server time. Uids and game session ids are replaced with HMACs keyed by SECRET_KEY,
+so the same user and session keep the same pseudonym through the capture, and moderator tokens are dropped.
+Request bodies aren't captured. Lines go through the background 'capture_queue' log handler, so requests never wait
+for the file. Users are sampled as a whole (TRAFFIC_CAPTURE_RATE), so their getSession polls and clicks stay together.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger(__name__)
+
+# query params with game session ids, replaced with pseudonyms
+SESSION_PARAMS = ('game_id',)
+# query params, that are never written
+REDACTED_PARAMS = ('token',)
+# endpoints, that return new game session as response.game.game_session_id
+NEW_SESSION_ENDPOINTS = ('newSession',)
+
+
+def pseudonym(value: str) -> str:
+    """
+    Makes stable pseudonym of uid or game session id
+    :param value: uid or id
+    :return: hex HMAC of value
+    """
+    return hmac.new(settings.SECRET_KEY.encode(), value.encode(), hashlib.sha256).hexdigest()[:24]
+
+
+def endpointName(path: str) -> str:
+    """
+    Gets endpoint name of request path, e.g. 'getSession' for /v1/getSession/
+    :param path: request path
+    :return: last segment of path
+    """
+    return path.strip('/').rpartition('/')[2]
+
+
+class TrafficCaptureMiddleware:
+    """
+    Writes sanitized trace of every sampled request to settings.TRAFFIC_CAPTURE_FILE
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'TRAFFIC_CAPTURE_FILE', ''):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.rate = getattr(settings, 'TRAFFIC_CAPTURE_RATE', 1.0)
+
+    def __call__(self, request):
+        started = time.time()
+        start = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        # rest_framework sets auth of authenticated requests on django request too
+        auth = getattr(request, 'auth', None)
+        uid = auth.get('uid') if isinstance(auth, dict) else None
+        user = pseudonym(uid) if uid else None
+        if not self.sampled(user):
+            return response
+
+        endpoint = endpointName(request.path)
+        query = {}
+        for key, value in request.GET.items():
+            if key in REDACTED_PARAMS:
+                continue
+            query[key] = pseudonym(value) if key in SESSION_PARAMS else value
+        trace = {
+            't': round(started, 6),
+            'method': request.method,
+            'path': request.path,
+            'endpoint': endpoint,
+            'query': query,
+            'user': user,
+            'status': response.status_code,
+            'ms': round(duration * 1000, 3),
+        }
+        if endpoint in NEW_SESSION_ENDPOINTS and response.status_code == 200:
+            try:
+                trace['session'] = pseudonym(json.loads(response.content)['response']['game']['game_session_id'])
+            except (ValueError, KeyError, TypeError):
+                pass
+        logger.info("%s", json.dumps(trace, separators=(',', ':')))
+        return response
+
+    def sampled(self, user: str) -> bool:
+        """
+        Checks if request of user is captured
+        :param user: pseudonym of user, None for anonymous requests
+        :return: true if captured
+        """
+        if self.rate >= 1.0:
+            return True
+        if user is None:
+            return random.random() < self.rate
+        return int(user[:8], 16) < self.rate * 0x100000000
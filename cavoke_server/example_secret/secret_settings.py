@@ -25,4 +25,14 @@ PRODUCTION_DB = {
           }
 }
 
+# read replicas of the database (optional), e.g. for local testing:
+# REPLICA_DBS = {
+#     'replica1': {
+#         'ENGINE': 'django.db.backends.sqlite3',
+#         'NAME': 'db-replica1.sqlite3',
+#         'TEST': {'MIRROR': 'default'},
+#     },
+# }
+REPLICA_DBS = {}
+
 FIREBASE_JSON_FILE = 'YOUR-FIREBASE-CONFIG-FILE'
@@ -0,0 +1,165 @@
+"""
+Non-blocking structured logging.
+
+Records are put on an in-memory queue by QueueListenerHandler and written by a background thread,
+so request threads never wait for I/O. If the queue is full, records are dropped and counted instead of blocking.
+High-volume info records are sampled per logger and errors are rate limited per message template,
+so that a burst of failing game code doesn't turn into a logging storm.
+Log with lazy formatting (`logger.info("... %s", value)`): the message is only formatted for records,
+that pass the filters, and its template identifies the event for rate limiting.
+"""
+import atexit
+import json
+import logging
+import random
+import threading
+import time
+from logging.config import ConvertingList
+from logging.handlers import QueueHandler, QueueListener
+from queue import Queue, Full
+
+# attributes of every LogRecord, everything else was passed in extra
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats record as one line of JSON with its extra fields
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+    def formatTime(self, record, datefmt=None) -> str:
+        return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + '.%03dZ' % record.msecs
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a share of records below WARNING for configured loggers (and their children)
+    """
+
+    def __init__(self, rates: dict = None):
+        """
+        :param rates: dict of logger name to share of records kept, from 0 to 1
+        """
+        super().__init__()
+        self.rates = rates or {}
+
+    def rate(self, name: str) -> float:
+        """
+        Gets sampling rate of logger
+        :param name: logger name
+        :return: share of records kept
+        """
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate(record.name)
+        if rate >= 1.0:
+            return True
+        if random.random() >= rate:
+            return False
+        # lets readers weight sampled events back
+        record.sample_rate = rate
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per (logger, message template) for records of ERROR and above.
+    The first record let through after suppression carries the number of suppressed ones
+    """
+
+    def __init__(self, rate: float = 1.0, burst: int = 20, level: int = logging.ERROR):
+        """
+        :param rate: records per second allowed for each template
+        :param burst: records allowed at once for each template
+        :param level: minimal level of limited records
+        """
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.level = level
+        # key -> [tokens, updated, suppressed]
+        self.__buckets = {}
+        self.__lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.level:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self.__lock:
+            bucket = self.__buckets.get(key)
+            if bucket is None:
+                if len(self.__buckets) > 10000:
+                    self.__buckets.clear()
+                bucket = self.__buckets[key] = [self.burst, now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+
+def _resolveHandlers(handlers) -> list:
+    # indexing ConvertingList makes dictConfig resolve 'cfg://handlers.<name>' to configured handlers
+    if isinstance(handlers, ConvertingList):
+        return [handlers[i] for i in range(len(handlers))]
+    return list(handlers)
+
+
+class QueueListenerHandler(QueueHandler):
+    """
+    Hands records to a background thread, that passes them to the target handlers.
+    Usable from dictConfig: {'()': 'cavoke_server.logconfig.QueueListenerHandler',
+    'handlers': ['cfg://handlers.console']} (target handlers must sort before this one by name)
+    """
+
+    def __init__(self, handlers, queue_size: int = 10000):
+        """
+        :param handlers: target handlers
+        :param queue_size: maximum number of records waiting to be written
+        """
+        super().__init__(Queue(queue_size))
+        self.dropped = 0
+        self.listener = QueueListener(self.queue, *_resolveHandlers(handlers), respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # merge arguments now, as they may change after the call, formatting is left to the listener
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
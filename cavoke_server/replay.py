@@ -0,0 +1,210 @@
+"""
+Replay of captured traffic (see cavoke_server.capture) for performance regression testing.
+
+Traces are sent to a target server at their original pacing, or faster with speed > 1 (speed 0 sends them as fast
+as workers allow). The target must run with stub authentication (CAVOKE_STUB_AUTH=1 and DEBUG on), so requests
+are sent as "Stub <user pseudonym>" without Firebase, and should have the captured game types imported (importndjson).
+Game session pseudonyms are mapped to sessions created by replayed newSession requests. Requests for sessions created
+before the capture started can't be mapped and are skipped.
+Results (client-side latency per request) are written as JSONL, and results of two builds are compared per endpoint.
+"""
+import json
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from .capture import SESSION_PARAMS, NEW_SESSION_ENDPOINTS
+
+# endpoints replayed by default: game play, that doesn't need Firestore or moderator tokens
+DEFAULT_ENDPOINTS = ('health', 'newSession', 'getSessions', 'getSession', 'click', 'getTypes', 'searchTypes',
+                     'getPopular')
+
+
+def readTraces(lines, endpoints=DEFAULT_ENDPOINTS):
+    """
+    Reads captured traces
+    :param lines: iterable of JSONL lines
+    :param endpoints: endpoints to keep, all if None
+    :return: list of traces sorted by time
+    """
+    traces = []
+    for line in lines:
+        if line.strip():
+            trace = json.loads(line)
+            if endpoints is None or trace['endpoint'] in endpoints:
+                traces.append(trace)
+    traces.sort(key=lambda trace: trace['t'])
+    return traces
+
+
+class Replayer:
+    """
+    Sends traces to target server from a pool of workers
+    """
+
+    def __init__(self, target: str, speed: float = 1.0, workers: int = 16, timeout: float = 30.0,
+                 session_wait: float = 10.0):
+        """
+        :param target: base url of server, e.g. http://127.0.0.1:8000
+        :param speed: pacing multiplier, 0 for no pacing
+        :param workers: concurrent requests
+        :param timeout: request timeout in seconds
+        :param session_wait: seconds to wait for newSession of a game session, that is still being replayed
+        """
+        self.target = target.rstrip('/')
+        self.speed = speed
+        self.workers = workers
+        self.timeout = timeout
+        self.session_wait = session_wait
+        # pseudonym -> game session id on target, None if its newSession failed
+        self.__sessions = {}
+        # pseudonyms of sessions, that replayed newSession requests will create
+        self.__expected = set()
+        self.__cond = threading.Condition()
+        self.__local = threading.local()
+        self.skipped = 0
+
+    def __http(self):
+        import requests
+
+        if not hasattr(self.__local, 'http'):
+            self.__local.http = requests.Session()
+        return self.__local.http
+
+    def __session(self, pseudonym: str):
+        """
+        Gets id of game session on target
+        :param pseudonym: captured pseudonym
+        :return: id or None, if it can't be mapped
+        """
+        deadline = time.monotonic() + self.session_wait
+        with self.__cond:
+            while pseudonym not in self.__sessions and pseudonym in self.__expected:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.__cond.wait(remaining)
+            return self.__sessions.get(pseudonym)
+
+    def __created(self, pseudonym: str, game_session_id):
+        with self.__cond:
+            self.__sessions[pseudonym] = game_session_id
+            self.__cond.notify_all()
+
+    def send(self, trace: dict):
+        """
+        Sends one trace
+        :param trace: captured trace
+        :return: result dict, None if skipped
+        """
+        params = dict(trace['query'])
+        for key in SESSION_PARAMS:
+            if key in params:
+                params[key] = self.__session(params[key])
+                if params[key] is None:
+                    with self.__cond:
+                        self.skipped += 1
+                    return None
+        headers = {'Authorization': 'Stub ' + trace['user']} if trace.get('user') else {}
+        start = time.perf_counter()
+        try:
+            response = self.__http().request(trace['method'], self.target + trace['path'], params=params,
+                                             headers=headers, timeout=self.timeout)
+            status = response.status_code
+        except Exception:
+            response, status = None, 0
+        ms = (time.perf_counter() - start) * 1000
+        if 'session' in trace:
+            try:
+                game_session_id = response.json()['response']['game']['game_session_id']
+            except Exception:
+                game_session_id = None
+            self.__created(trace['session'], game_session_id)
+        return {'endpoint': trace['endpoint'], 'status': status, 'ms': round(ms, 3),
+                'captured_status': trace['status'], 'captured_ms': trace['ms']}
+
+    def run(self, traces: list, on_result=None) -> list:
+        """
+        Replays traces at configured pacing
+        :param traces: traces sorted by time
+        :param on_result: function called with every result
+        :return: list of results
+        """
+        with self.__cond:
+            self.__expected = {trace['session'] for trace in traces
+                               if trace['endpoint'] in NEW_SESSION_ENDPOINTS and 'session' in trace}
+        results = []
+        lock = threading.Lock()
+
+        def task(trace):
+            result = self.send(trace)
+            if result is not None:
+                with lock:
+                    results.append(result)
+                    if on_result is not None:
+                        on_result(result)
+
+        # requests waiting for their game session would otherwise take all workers from the newSession requests
+        # they wait for, so sessions are created by workers of their own
+        with ThreadPoolExecutor(self.workers) as executor, ThreadPoolExecutor(self.workers) as creators:
+            started = time.monotonic()
+            for trace in traces:
+                if self.speed > 0:
+                    delay = started + (trace['t'] - traces[0]['t']) / self.speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                (creators if trace['endpoint'] in NEW_SESSION_ENDPOINTS else executor).submit(task, trace)
+        return results
+
+
+def _percentile(values: list, q: float) -> float:
+    return values[min(int(q * len(values)), len(values) - 1)] if values else 0.0
+
+
+def summarize(results) -> dict:
+    """
+    Aggregates latencies per endpoint
+    :param results: iterable of result dicts
+    :return: dict of endpoint to {count, errors, p50, p95, p99, mean},
+    errors are failed requests and requests, that got other status than the captured one
+    """
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    for result in results:
+        latencies[result['endpoint']].append(result['ms'])
+        if not 200 <= result['status'] < 500 or result['status'] != result.get('captured_status', result['status']):
+            errors[result['endpoint']] += 1
+    summary = {}
+    for endpoint, values in sorted(latencies.items()):
+        values.sort()
+        summary[endpoint] = {
+            'count': len(values),
+            'errors': errors[endpoint],
+            'p50': _percentile(values, 0.5),
+            'p95': _percentile(values, 0.95),
+            'p99': _percentile(values, 0.99),
+            'mean': sum(values) / len(values),
+        }
+    return summary
+
+
+def compare(base: dict, new: dict) -> list:
+    """
+    Compares summaries of two builds
+    :param base: summary of base build
+    :param new: summary of new build
+    :return: list of rows (endpoint, count, p50 base, p50 new, p50 change, p95 base, p95 new, p95 change),
+    changes are relative, e.g. 0.1 for 10% slower
+    """
+    rows = []
+    for endpoint in sorted(set(base) | set(new)):
+        a, b = base.get(endpoint), new.get(endpoint)
+        if a is None or b is None:
+            rows.append((endpoint, (a or b)['count'], a and a['p50'], b and b['p50'], None,
+                         a and a['p95'], b and b['p95'], None))
+            continue
+        rows.append((endpoint, min(a['count'], b['count']),
+                     a['p50'], b['p50'], (b['p50'] - a['p50']) / a['p50'] if a['p50'] else None,
+                     a['p95'], b['p95'], (b['p95'] - a['p95']) / a['p95'] if a['p95'] else None))
+    return rows
@@ -0,0 +1,179 @@
+"""
+Database routers for cavoke_server project.
+
+ReplicaRouter sends reads to read replicas (settings.DATABASE_REPLICAS) only inside views
+decorated with `replica_reads`. Everything else, including all writes, goes to the primary.
+After a request has written something for a user, this user's reads stay on the primary
+for settings.REPLICA_STICKY_FOR seconds, so clients always see their own writes.
+Views streaming their response can't use `replica_reads`, as the stream is read after the view has returned.
+
+SessionShardRouter places game sessions on shards (see cavoke_server.sharding) and goes before ReplicaRouter.
+"""
+import os
+import random
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+
+from .sharding import PRIMARY_DB, sessionBucket, shardOf
+
+SESSION_MODEL = 'cavoke_app.GameSession'
+
+_state = threading.local()
+
+
+def _stickyStore() -> sqlite3.Connection:
+    """
+    Gets this thread's connection to the store of sticky users, shared by all workers,
+    so users' next reads see their writes on whichever worker they land
+    :return: connection
+    """
+    path = getattr(settings, 'REPLICA_STICKY_STORE', 'replica_sticky.sqlite3')
+    conn = getattr(_state, 'sticky_store', None)
+    if conn is None or getattr(_state, 'sticky_store_path', None) != path:
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('CREATE TABLE IF NOT EXISTS sticky (uid TEXT PRIMARY KEY, until REAL)')
+        _state.sticky_store, _state.sticky_store_path = conn, path
+    return conn
+
+
+def replicas() -> list:
+    """
+    Gets aliases of configured read replicas
+    :return: list of database aliases
+    """
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def isSticky(uid: str) -> bool:
+    """
+    Checks if user has written recently, so their reads must go to the primary
+    :param uid: user's uid
+    :return: true if user's reads are pinned to the primary
+    """
+    if not uid:
+        return False
+    row = _stickyStore().execute('SELECT until FROM sticky WHERE uid = ?', (uid,)).fetchone()
+    return row is not None and row[0] > time.time()
+
+
+def markSticky(uid: str):
+    """
+    Pins user's reads to the primary for REPLICA_STICKY_FOR seconds
+    :param uid: user's uid
+    """
+    now = time.time()
+    conn = _stickyStore()
+    conn.execute('INSERT OR REPLACE INTO sticky VALUES (?, ?)', (uid, now + getattr(settings, 'REPLICA_STICKY_FOR', 5)))
+    if random.random() < 0.001:
+        conn.execute('DELETE FROM sticky WHERE until < ?', (now,))
+
+
+def replica_reads(view):
+    """
+    Decorator for read-only views, that allows them to read from replicas
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        auth = request.auth
+        uid = auth.get('uid') if isinstance(auth, dict) else None
+        if not replicas() or isSticky(uid):
+            return view(request, *args, **kwargs)
+        previous = getattr(_state, 'use_replicas', False)
+        _state.use_replicas = True
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _state.use_replicas = previous
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    Router, that sends reads from `replica_reads` views to replicas
+    """
+
+    def db_for_read(self, model, **hints):
+        if getattr(_state, 'use_replicas', False):
+            aliases = replicas()
+            if aliases:
+                return random.choice(aliases)
+        return PRIMARY_DB
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return PRIMARY_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        dbs = {PRIMARY_DB, *replicas()}
+        if obj1._state.db in dbs and obj2._state.db in dbs:
+            return True
+        return None
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Remembers users, that have written to the primary during the request
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.wrote = False
+        try:
+            return self.get_response(request)
+        finally:
+            # DRF copies authentication result to the underlying django request
+            auth = getattr(request, 'auth', None)
+            # without replicas every read is on the primary anyway
+            if _state.wrote and replicas() and isinstance(auth, dict) and auth.get('uid'):
+                markSticky(auth['uid'])
+            _state.wrote = False
+
+
+class SessionShardRouter:
+    """
+    Router, that writes game sessions to the shard of their bucket and keeps loaded sessions on their database.
+    Querysets of sessions must pick their shard with using() (see GameSessionManager)
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label != SESSION_MODEL:
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.label != SESSION_MODEL:
+            return None
+        _state.wrote = True
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        # assigning game type sets db of new sessions to the game type's one, so they are placed by id
+        if instance._state.db and not instance._state.adding:
+            return instance._state.db
+        return shardOf(sessionBucket(instance.game_session_id or '', instance.player_uid))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # game type of session may be in another database
+        if SESSION_MODEL in (obj1._meta.label, obj2._meta.label):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # new shards are migrated before they are added to SESSION_SHARD_MAP
+        if db == PRIMARY_DB or db in replicas():
+            return None
+        return app_label == 'cavoke_app' and model_name == 'gamesession'
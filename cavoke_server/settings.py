@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)m
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -19,6 +21,11 @@ SECRET_PATH = os.path.join(BASE_DIR, 'cavoke_server', 'secret')
 
 from cavoke_server.secret.secret_settings import SECRET_KEY, PRODUCTION_DB, FIREBASE_JSON_FILE
 
+try:
+    from cavoke_server.secret.secret_settings import REPLICA_DBS
+except ImportError:
+    REPLICA_DBS = {}
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/
@@ -47,11 +54,11 @@ INSTALLED_APPS = [
     'drf_firebase_auth_cavoke',
     'cavoke',
     'logentry_admin',
-    'eventlet',
     'corsheaders'
 ]
 
 MIDDLEWARE = [
+    'cavoke_server.capture.TrafficCaptureMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -60,6 +67,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'cavoke_server.routers.ReplicaStickinessMiddleware',
 ]
 
 ROOT_URLCONF = 'cavoke_server.urls'
@@ -92,6 +100,12 @@ if PRODUCTION:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+            # keep connections open between requests of the same worker
+            'CONN_MAX_AGE': 600,
+            'OPTIONS': {
+                # seconds to wait for a lock held by other process
+                'timeout': 20,
+            },
         }
     }
 else:
@@ -99,6 +113,36 @@ else:
         'default': PRODUCTION_DB
     }
 
+# Read replicas, used only by views decorated with cavoke_server.routers.replica_reads
+DATABASES.update(REPLICA_DBS)
+DATABASE_REPLICAS = list(REPLICA_DBS)
+DATABASE_ROUTERS = ['cavoke_server.routers.SessionShardRouter', 'cavoke_server.routers.ReplicaRouter']
+# seconds user's reads stay on the primary after they have written something
+REPLICA_STICKY_FOR = 5
+
+# SQLite file remembering users, that have written recently (see cavoke_server.routers), shared by worker processes
+# of one host, so hosts behind a load balancer need sticky sessions for users to always see their own writes
+REPLICA_STICKY_STORE = os.path.join(BASE_DIR, 'replica_sticky.sqlite3')
+
+# Game session shards (see cavoke_server.sharding)
+# virtual buckets players are hashed into, never change it after sessions were created
+SESSION_BUCKETS = 256
+# {database alias: range of buckets}, all sessions are on 'default' if empty,
+# e.g. {'default': range(0, 128), 'sessions1': range(128, 256)} with 'sessions1' in DATABASES,
+# migrated with `migrate --database sessions1` (MySQL shards need foreign_key_checks off for it, see sharding.py)
+SESSION_SHARD_MAP = {}
+# map before resharding, sessions not found on their current shard are looked up there until reshardsessions is done
+SESSION_SHARD_MAP_PREVIOUS = {}
+
+# Pragmas applied to every new SQLite connection (see cavoke_server.sqlite)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 20000,
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -144,14 +188,112 @@ REST_FRAMEWORK = {
     # or allow read-only access for unauthenticated users.
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.SessionAuthentication',
-        'drf_firebase_auth_cavoke.authentication.FirebaseAuthentication',
+        'cavoke_app.authentication.CachedFirebaseAuthentication',
     )
 }
 
+# Authenticate "Stub <uid>" headers without Firebase (see cavoke_app.authentication.StubAuthentication)
+# only for replaying captured traffic against a local server, refused unless DEBUG is on or PRODUCTION is off
+STUB_AUTH = os.environ.get('CAVOKE_STUB_AUTH', '') == '1'
+if STUB_AUTH:
+    if PRODUCTION and not DEBUG:
+        raise ImproperlyConfigured('CAVOKE_STUB_AUTH=1 requires DEBUG = True or PRODUCTION = False')
+    REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'] = ('cavoke_app.authentication.StubAuthentication',)
+
 DRF_FIREBASE_AUTH_CAVOKE = {
     'FIREBASE_SERVICE_ACCOUNT_KEY': os.path.join(SECRET_PATH, FIREBASE_JSON_FILE),
     'FIREBASE_ATTEMPT_CREATE_WITH_DISPLAY_NAME': False,
     'FIREBASE_AUTH_EMAIL_VERIFICATION': True,
 }
 
+# Verified id tokens cache (see cavoke_app.authentication)
+# maximum number of tokens cached by each worker
+TOKEN_CACHE_SIZE = 4096
+# maximum time in seconds a verified token is trusted without verifying it again
+TOKEN_CACHE_MAX_AGE = 60 * 60
+# seconds between checks of cached tokens for revocation and unverified email (FIREBASE_CHECK_JWT_REVOKED,
+# FIREBASE_AUTH_EMAIL_VERIFICATION), every check is a Firebase API call, 0 makes one on every request
+TOKEN_REVOCATION_CHECK_INTERVAL = 60
+
+# Serve async versions of I/O-bound views (see cavoke_app.async_views), set by cavoke_server.asgi
+ASYNC_VIEWS = os.environ.get('CAVOKE_ASYNC_VIEWS', '') == '1'
+
 CORS_ORIGIN_ALLOW_ALL = True
+
+# Traffic capture (see cavoke_server.capture)
+# JSONL file request traces are appended to, capture is disabled if empty
+TRAFFIC_CAPTURE_FILE = os.environ.get('CAVOKE_CAPTURE_FILE', '')
+# share of users, whose requests are captured
+TRAFFIC_CAPTURE_RATE = float(os.environ.get('CAVOKE_CAPTURE_RATE', '1'))
+
+# Logging (see cavoke_server.logconfig)
+# share of info records kept per logger
+LOG_SAMPLE_RATES = {
+    'cavoke_app.views': 0.1,
+}
+# error records per second (and burst) allowed for each message template
+LOG_ERROR_RATE = (1.0, 20)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'cavoke_server.logconfig.JsonFormatter',
+        },
+    },
+    'filters': {
+        'sampling': {
+            '()': 'cavoke_server.logconfig.SamplingFilter',
+            'rates': LOG_SAMPLE_RATES,
+        },
+        'error_rate': {
+            '()': 'cavoke_server.logconfig.RateLimitFilter',
+            'rate': LOG_ERROR_RATE[0],
+            'burst': LOG_ERROR_RATE[1],
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json',
+        },
+        # writes to the handlers above from a background thread
+        'queue': {
+            '()': 'cavoke_server.logconfig.QueueListenerHandler',
+            'handlers': ['cfg://handlers.console'],
+            'filters': ['sampling', 'error_rate'],
+        },
+    },
+    'loggers': {
+        'cavoke_app': {
+            'handlers': ['queue'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'cavoke_server': {
+            'handlers': ['queue'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+if TRAFFIC_CAPTURE_FILE:
+    LOGGING['formatters']['raw'] = {
+        'format': '%(message)s',
+    }
+    LOGGING['handlers']['capture_file'] = {
+        'class': 'logging.FileHandler',
+        'filename': TRAFFIC_CAPTURE_FILE,
+        'formatter': 'raw',
+    }
+    LOGGING['handlers']['capture_queue'] = {
+        '()': 'cavoke_server.logconfig.QueueListenerHandler',
+        'handlers': ['cfg://handlers.capture_file'],
+    }
+    LOGGING['loggers']['cavoke_server.capture'] = {
+        'handlers': ['capture_queue'],
+        'level': 'INFO',
+        'propagate': False,
+    }
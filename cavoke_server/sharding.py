@@ -0,0 +1,119 @@
+"""
+Horizontal sharding of game sessions by player_uid.
+
+Every player is hashed into one of settings.SESSION_BUCKETS virtual buckets, and settings.SESSION_SHARD_MAP assigns
+buckets to database aliases ({alias: range of buckets}, everything is on 'default' if it's empty).
+The bucket is encoded in game_session_id ('<bucket>-<uuid>'), so a session is found by its id with a single query.
+Ids made before sharding have no bucket and are found by their player's uid.
+Shards have only the GameSession table (`migrate --database <alias>`), game types, quotas and blobs stay on default,
+so the game type foreign key isn't enforced by the database.
+Shards are migrated from the first migration, which creates the foreign key to cavoke_app_gametype, missing on shards,
+until 0017 drops it. SQLite doesn't check it, but MySQL refuses it, so a new MySQL shard has to be migrated with
+'OPTIONS': {'init_command': 'SET foreign_key_checks = 0'} in its DATABASES entry.
+
+To move buckets, set SESSION_SHARD_MAP_PREVIOUS to the current map and SESSION_SHARD_MAP to the new one,
+sessions not found on their new shard are looked up on the previous one, and run reshardsessions.
+SESSION_BUCKETS must never change, as ids of existing sessions refer to buckets.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+PRIMARY_DB = 'default'
+
+
+def sessionBuckets() -> int:
+    """
+    Gets number of virtual buckets
+    :return: number of buckets
+    """
+    return getattr(settings, 'SESSION_BUCKETS', 256)
+
+
+def bucketOf(player_uid: str) -> int:
+    """
+    Gets bucket of player
+    :param player_uid: uid of player
+    :return: bucket
+    """
+    return int(hashlib.sha1(player_uid.encode()).hexdigest()[:8], 16) % sessionBuckets()
+
+
+def newSessionId(player_uid: str) -> str:
+    """
+    Makes id of new game session, that encodes player's bucket
+    :param player_uid: uid of player
+    :return: game_session_id
+    """
+    return '{:03x}-{}'.format(bucketOf(player_uid), uuid.uuid4().hex)
+
+
+def sessionBucket(game_session_id: str, player_uid: str = None):
+    """
+    Gets bucket of game session
+    :param game_session_id: id of game session
+    :param player_uid: uid of player, used for ids without bucket
+    :return: bucket or None, if neither id nor player_uid tell it
+    """
+    if len(game_session_id) == 36 and game_session_id[3] == '-':
+        try:
+            return int(game_session_id[:3], 16)
+        except ValueError:
+            pass
+    return bucketOf(player_uid) if player_uid else None
+
+
+def _shardIn(layout: dict, bucket: int) -> str:
+    if not layout:
+        return PRIMARY_DB
+    for alias, buckets in layout.items():
+        if bucket in buckets:
+            return alias
+    raise ImproperlyConfigured("Bucket {} isn't assigned to any session shard".format(bucket))
+
+
+def shardsOf(bucket: int) -> list:
+    """
+    Gets databases, that may have sessions of bucket
+    :param bucket: bucket
+    :return: list of aliases, the current shard first
+    """
+    current = _shardIn(getattr(settings, 'SESSION_SHARD_MAP', None), bucket)
+    previous = getattr(settings, 'SESSION_SHARD_MAP_PREVIOUS', None)
+    if previous:
+        previous = _shardIn(previous, bucket)
+        if previous != current:
+            return [current, previous]
+    return [current]
+
+
+def shardOf(bucket: int) -> str:
+    """
+    Gets database, that sessions of bucket are written to
+    :param bucket: bucket
+    :return: alias
+    """
+    return shardsOf(bucket)[0]
+
+
+def sessionShards() -> list:
+    """
+    Gets all databases, that may have sessions
+    :return: list of aliases
+    """
+    aliases = [PRIMARY_DB]
+    for layout in (getattr(settings, 'SESSION_SHARD_MAP', None), getattr(settings, 'SESSION_SHARD_MAP_PREVIOUS', None)):
+        for alias in layout or ():
+            if alias not in aliases:
+                aliases.append(alias)
+    return aliases
+
+
+def isResharding() -> bool:
+    """
+    Checks if buckets are being moved between shards
+    :return: true if previous map is set
+    """
+    return bool(getattr(settings, 'SESSION_SHARD_MAP_PREVIOUS', None))
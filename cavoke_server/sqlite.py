@@ -0,0 +1,36 @@
+"""
+SQLite tuning for multi-process deployments.
+
+Applies settings.SQLITE_PRAGMAS to every new SQLite connection, so concurrent writers
+from several Apache processes wait for each other instead of failing with
+"database is locked", and readers don't block writers (WAL journal).
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+def pragmas() -> dict:
+    """
+    Gets pragmas to apply, settings.SQLITE_PRAGMAS is the only place they are configured
+    :return: dict of pragma name to value
+    """
+    return getattr(settings, 'SQLITE_PRAGMAS', {})
+
+
+def applyPragmas(cursor, values: dict = None):
+    """
+    Applies pragmas on open sqlite connection
+    :param cursor: DB-API cursor of sqlite connection
+    :param values: pragmas to apply, settings.SQLITE_PRAGMAS by default
+    """
+    for name, value in (pragmas() if values is None else values).items():
+        cursor.execute('PRAGMA {} = {}'.format(name, value))
+
+
+@receiver(connection_created)
+def tune_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        applyPragmas(cursor)
@@ -14,3 +14,12 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cavoke_server.settings')
 
 application = get_wsgi_application()
+
+# import game modules before the first request
+from cavoke_app.config import WARMUP_GAME_BUNDLES  # noqa: E402
+
+if WARMUP_GAME_BUNDLES:
+    from cavoke_app.bundles import warmup
+    from cavoke_app.modulecache import game_module_cache
+    # no more modules than stay loaded
+    warmup(game_module_cache.get, game_module_cache.max_count)